@@ -0,0 +1,49 @@
+"""
+Compares the cost of the binary event envelope against JSON dicts on the message path.
+Run from the repository root: python -m benchmarks.bench_envelope
+"""
+import argparse
+import hashlib
+import json
+import timeit
+from messaging import envelope
+
+def sample_events() -> dict:
+    pubkey = hashlib.sha256(b"pubkey").digest()
+    tpm_key = b"LS0tLS1CRUdJTiBQVUJMSUMgS0VZLS0tLS0K" * 4
+    return {
+        "identity": envelope.IdentityEvent(
+            "alice@example.coin", pubkey, tpm_key, hashlib.sha256(tpm_key).digest(), True
+        ),
+        "nvs_update": envelope.NvsUpdateEvent(
+            "example.coin", "QmYwAPJzv5CZsnA625s3Xf2nemtYgPpHdWEz79ojWnPbdG", hashlib.sha256(b"root").digest()
+        ),
+    }
+
+def measure(statement, number: int) -> float:
+    """Best of five runs, in nanoseconds per operation"""
+    return min(timeit.repeat(statement, number=number, repeat=5)) / number * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=100000, help="operations per run")
+    args = parser.parse_args()
+
+    print(f"{'event':<12}{'codec':<10}{'bytes':>8}{'encode ns':>12}{'decode ns':>12}{'roundtrip ns':>14}")
+    for name, event in sample_events().items():
+        as_dict = event.to_dict()
+        json_body = json.dumps(as_dict).encode()
+        binary_body = envelope.encode(event)
+        rows = (
+            ("json", len(json_body),
+             measure(lambda: json.dumps(as_dict).encode(), args.number),
+             measure(lambda: json.loads(json_body), args.number)),
+            ("envelope", len(binary_body),
+             measure(lambda: envelope.encode(event), args.number),
+             measure(lambda: envelope.decode(binary_body), args.number)),
+        )
+        for codec, size, encode_ns, decode_ns in rows:
+            print(f"{name:<12}{codec:<10}{size:>8}{encode_ns:>12.0f}{decode_ns:>12.0f}{encode_ns + decode_ns:>14.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+End-to-end benchmark of the identity system against in-process stand-ins of Emercoin, IPFS and
+the TPM. Operations are started open-loop at a target rate in a configurable mix:
+    register   sign the row hash of a new identity and insert it into address_keys
+    lookup     GET /v1/identity/<address> from the identity API
+    verify     lookup, then verify the returned Merkle proof against the returned root
+    republish  recompute the root, export a snapshot, add it to IPFS, sign the root, name_update
+Latency is measured from the moment an operation was due, so a saturated system shows up as
+growing latency instead of a lower offered rate. From the repository root:
+python -m benchmarks.e2e --rate 500 --duration 30 --mix register=0.1,lookup=0.6,verify=0.25,republish=0.05
+python -m benchmarks.e2e --rate 500 --duration 30 --baseline baseline.json
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import aiohttp
+from aiohttp import web
+from benchmarks.fakes import FakeEmercoinNode, FakeIpfsNode, FakeSigner
+from emercoin.rpc_client import EmercoinRpcClient, EmercoinRpcError
+from identity.api import IdentityApi
+from identity.ipfs import IpfsClient, IpfsError
+from identity.merkle import address_keys_row_hash, verify_proof
+from identity.snapshot import export_snapshot
+from identity.store import IdentityStore
+from metrics.registry import MetricsRegistry
+
+# Same tables as create_database in brunnen-cli.sh
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS address_keys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    address TEXT NOT NULL,
+    pubkey TEXT NOT NULL,
+    TPM_key TEXT,
+    TPM_key_hash BLOB,
+    TPM_enable BOOLEAN DEFAULT 0,
+    row_hash BLOB
+);
+CREATE TABLE IF NOT EXISTS db_root (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    root BLOB NOT NULL,
+    row_hash BLOB
+);
+CREATE TABLE IF NOT EXISTS tpm_domain_settings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    domain TEXT NOT NULL,
+    TPM_enable BOOLEAN DEFAULT 0,
+    row_hash BLOB
+);
+"""
+INSERT_IDENTITY = "INSERT INTO address_keys (address, pubkey, TPM_key, TPM_key_hash, TPM_enable, row_hash) VALUES (?, ?, ?, ?, ?, ?)"
+
+OPERATIONS = ("register", "lookup", "verify", "republish")
+DEFAULT_MIX = {"register": 0.10, "lookup": 0.60, "verify": 0.25, "republish": 0.05}
+# Errors an operation may end with, anything else is a bug in the benchmark and aborts it
+OPERATION_ERRORS = (EmercoinRpcError, IpfsError, aiohttp.ClientError, sqlite3.Error, OSError, ValueError)
+STAGE_METRIC = "e2e_stage_seconds"
+
+def parse_mix(text: str) -> dict:
+    """Parses register=0.1,lookup=0.6,... into weights, operations left out get no weight"""
+    mix = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}, expected one of {', '.join(OPERATIONS)}")
+        mix[name] = float(weight) if weight else 1.0
+        if mix[name] < 0:
+            raise ValueError(f"Weight of {name} must not be negative")
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one operation with a positive weight")
+    return mix
+
+class E2eBenchmark():
+    """
+    Runs the identity database, the identity API, a fake Emercoin node, a fake IPFS node and a
+    fake TPM signer in this process and drives a mix of operations through the real clients.
+    Args:
+        workdir: directory for the database and snapshots
+        mix: weight of every operation, DEFAULT_MIX when not given
+        rate: operations started per second
+        duration: seconds operations are started for
+        concurrency: operations in flight at most, later ones wait and their latency grows
+        identities: identities registered before the run
+        domain: domain the identities belong to and republishes update
+        sign_delay: seconds per signature of the fake TPM
+        rpc_latency: seconds added to every Emercoin call
+        update_delay: seconds the fake wallet stays locked per name_update
+        ipfs_latency: seconds added to every IPFS request
+        seed: seed of the operation mix and generated identities
+    """
+    def __init__(self, workdir: str, mix: dict = None, rate: float = 200.0, duration: float = 10.0,
+                 concurrency: int = 64, identities: int = 1000, domain: str = "example.coin",
+                 sign_delay: float = 0.001, rpc_latency: float = 0.0, update_delay: float = 0.0,
+                 ipfs_latency: float = 0.0, seed: int = None):
+        if rate <= 0 or duration <= 0 or concurrency <= 0:
+            raise ValueError("rate, duration and concurrency must be positive")
+        self.workdir = workdir
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.rate = rate
+        self.duration = duration
+        self.concurrency = concurrency
+        self.identities = identities
+        self.domain = domain
+        self.name = f"dns:{domain}"
+        self.random = random.Random(seed)
+        self.config = {
+            "mix": self.mix, "rate": rate, "duration": duration, "concurrency": concurrency,
+            "identities": identities, "sign_delay": sign_delay, "rpc_latency": rpc_latency,
+            "update_delay": update_delay, "ipfs_latency": ipfs_latency,
+        }
+        self.db_path = os.path.join(workdir, "identities.tmp")
+        self.node = FakeEmercoinNode({self.name: "{}"}, latency=rpc_latency, update_delay=update_delay)
+        self.ipfs = FakeIpfsNode(latency=ipfs_latency)
+        self.signer = FakeSigner(sign_delay=sign_delay)
+        self.registry = MetricsRegistry()
+        self.addresses = []
+        self.counts = dict.fromkeys(OPERATIONS, 0)
+        self.errors = dict.fromkeys(OPERATIONS, 0)
+        self.last_errors = {}
+        self._ids = itertools.count()
+        self._snapshots = itertools.count()
+        # Single writer thread, the CLI is the only writer of the database in production too
+        self._writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="e2e-writer")
+        self._connection = None
+        self._store = None
+        self._api_runner = None
+        self._session = None
+        self._rpc = None
+        self._ipfs_client = None
+        self.api_url = None
+
+    def _stage(self, name: str):
+        return self.registry.histogram(STAGE_METRIC, "Latency of one stage of a benchmark operation", stage=name).time()
+
+    def _new_identity(self) -> tuple:
+        address = f"user{next(self._ids)}@{self.domain}"
+        pubkey = self.random.randbytes(32).hex()
+        return address, pubkey, "", "", 0, address_keys_row_hash(address, pubkey, "", "", 0)
+
+    def _insert(self, rows: list):
+        with self._connection:
+            self._connection.executemany(INSERT_IDENTITY, rows)
+
+    async def setup(self):
+        loop = asyncio.get_running_loop()
+        os.makedirs(self.workdir, exist_ok=True)
+        self._connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+        rows = [self._new_identity() for _ in range(self.identities)]
+        await loop.run_in_executor(self._writer, self._insert, rows)
+        self.addresses = [row[0] for row in rows]
+
+        await self.node.start()
+        await self.ipfs.start()
+        self._store = IdentityStore(self.db_path)
+        self._api_runner = web.AppRunner(IdentityApi(self._store).create_app())
+        await self._api_runner.setup()
+        site = web.TCPSite(self._api_runner, "127.0.0.1", 0)
+        await site.start()
+        self.api_url = f"http://127.0.0.1:{self._api_runner.addresses[0][1]}"
+
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency))
+        self._rpc = EmercoinRpcClient(self.node.url, "benchmark", "benchmark")
+        self._ipfs_client = IpfsClient(self.ipfs.url)
+
+    async def teardown(self):
+        for client in (self._rpc, self._ipfs_client):
+            if client is not None:
+                await client.close()
+        if self._session is not None:
+            await self._session.close()
+        if self._api_runner is not None:
+            await self._api_runner.cleanup()
+        await self.node.stop()
+        await self.ipfs.stop()
+        if self._store is not None:
+            self._store.close()
+        if self._connection is not None:
+            self._connection.close()
+        self._writer.shutdown(wait=True)
+
+    async def _register(self):
+        identity = self._new_identity()
+        with self._stage("register.sign"):
+            await self.signer.sign_row_hashes([identity[-1]])
+        with self._stage("register.insert"):
+            await asyncio.get_running_loop().run_in_executor(self._writer, self._insert, [identity])
+        self.addresses.append(identity[0])
+
+    async def _get_identity(self) -> dict:
+        address = self.random.choice(self.addresses)
+        async with self._session.get(f"{self.api_url}/v1/identity/{address}") as response:
+            if response.status != 200:
+                raise ValueError(f"Lookup of {address} returned HTTP {response.status}")
+            return await response.json()
+
+    async def _lookup(self):
+        with self._stage("lookup.http"):
+            await self._get_identity()
+
+    async def _verify(self):
+        with self._stage("verify.http"):
+            record = await self._get_identity()
+        with self._stage("verify.proof"):
+            if not verify_proof(record["row_hash"], record["proof"], record["root"]):
+                raise ValueError(f"Proof of {record['address']} does not verify against {record['root']}")
+
+    async def _republish(self):
+        loop = asyncio.get_running_loop()
+        with self._stage("republish.root"):
+            await loop.run_in_executor(None, self._store.refresh)
+            root = self._store.root
+        path = os.path.join(self.workdir, f"snapshot-{next(self._snapshots)}.bgsnap")
+        try:
+            with self._stage("republish.snapshot"):
+                summary = await loop.run_in_executor(None, export_snapshot, self.db_path, path)
+            with self._stage("republish.ipfs_add"):
+                cid = await self._ipfs_client.add_file(path)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+        with self._stage("republish.sign"):
+            await self.signer.sign_row_hashes([root])
+        with self._stage("republish.name_update"):
+            await self._rpc.name_update(self.name, json.dumps({"cid": cid, "merkle_root": root, "snapshot_root": summary["root"]}), 365)
+
+    async def _execute(self, operation: str, due: float, slots: asyncio.Semaphore):
+        loop = asyncio.get_running_loop()
+        async with slots:
+            try:
+                await getattr(self, f"_{operation}")()
+            except OPERATION_ERRORS as e:
+                self.errors[operation] += 1
+                self.last_errors[operation] = str(e)
+                return
+        self.counts[operation] += 1
+        self.registry.histogram(STAGE_METRIC, stage=operation).record(loop.time() - due)
+
+    async def drive(self) -> dict:
+        """Starts operations at the target rate for the configured duration and waits for all of them"""
+        loop = asyncio.get_running_loop()
+        operations = [name for name in OPERATIONS if self.mix.get(name)]
+        weights = [self.mix[name] for name in operations]
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        started = loop.time()
+        for i in range(max(int(self.rate * self.duration), 1)):
+            due = started + i / self.rate
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            operation = self.random.choices(operations, weights)[0]
+            tasks.append(asyncio.ensure_future(self._execute(operation, due, slots)))
+        await asyncio.gather(*tasks)
+        return self.report(loop.time() - started)
+
+    async def run(self) -> dict:
+        await self.setup()
+        try:
+            return await self.drive()
+        finally:
+            await self.teardown()
+
+    def report(self, seconds: float) -> dict:
+        stages = {}
+        for (name, labels), metric in sorted(self.registry.metrics.items()):
+            if name != STAGE_METRIC or not metric.count:
+                continue
+            stages[dict(labels)["stage"]] = {
+                "count": metric.count,
+                "p50_ms": metric.quantile(0.50) * 1000,
+                "p99_ms": metric.quantile(0.99) * 1000,
+                "max_ms": metric.max * 1000,
+            }
+        completed = sum(self.counts.values())
+        return {
+            "config": self.config,
+            "seconds": seconds,
+            "operations": completed,
+            "throughput": completed / seconds if seconds else 0.0,
+            "counts": self.counts,
+            "errors": self.errors,
+            "last_errors": self.last_errors,
+            "stages": stages,
+            "services": {
+                "identities": len(self.addresses),
+                "name_updates": len(self.node.transactions),
+                "ipfs_bytes_added": self.ipfs.added_bytes,
+                "signatures": self.signer.signatures,
+            },
+        }
+
+def compare(report: dict, baseline: dict, tolerance: float = 0.10, min_delta_ms: float = 1.0) -> list:
+    """
+    Regressions of report against baseline: lower throughput, or a stage p50/p99 that grew by
+    more than tolerance and by more than min_delta_ms, which keeps sub-millisecond noise out.
+    Returns one (metric, baseline, current) tuple per regression.
+    """
+    regressions = []
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(("throughput", baseline["throughput"], report["throughput"]))
+    for stage, current in report["stages"].items():
+        previous = baseline.get("stages", {}).get(stage)
+        if previous is None:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if current[key] > previous[key] * (1 + tolerance) and current[key] - previous[key] > min_delta_ms:
+                regressions.append((f"{stage} {key}", previous[key], current[key]))
+    return regressions
+
+def format_report(report: dict, baseline: dict = None) -> str:
+    lines = [
+        f"{report['operations']} operations in {report['seconds']:.2f}s "
+        f"({report['throughput']:.0f} ops/s, offered {report['config']['rate']:.0f} ops/s)",
+        "  ".join(f"{name} {count}" + (f" ({report['errors'][name]} failed)" if report["errors"][name] else "")
+                  for name, count in report["counts"].items()),
+        f"{'stage':<24}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    for stage, values in report["stages"].items():
+        line = f"{stage:<24}{values['count']:>8}{values['p50_ms']:>10.2f}{values['p99_ms']:>10.2f}{values['max_ms']:>10.2f}"
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous and previous["p99_ms"]:
+            line += f"  p99 {(values['p99_ms'] / previous['p99_ms'] - 1) * 100:+.0f}%"
+        lines.append(line)
+    lines.append("  ".join(f"{key} {value}" for key, value in report["services"].items()))
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="operation weights, default register=0.1,lookup=0.6,verify=0.25,republish=0.05")
+    parser.add_argument("--rate", type=float, default=200.0, help="operations started per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds operations are started for")
+    parser.add_argument("-c", "--concurrency", type=int, default=64)
+    parser.add_argument("--identities", type=int, default=1000, help="identities registered before the run")
+    parser.add_argument("--sign-delay", type=float, default=0.001, help="seconds per TPM signature")
+    parser.add_argument("--rpc-latency", type=float, default=0.0, help="seconds added to every Emercoin call")
+    parser.add_argument("--update-delay", type=float, default=0.0, help="seconds the wallet is locked per name_update")
+    parser.add_argument("--ipfs-latency", type=float, default=0.0, help="seconds added to every IPFS request")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workdir", help="directory for the database and snapshots, a temporary one by default")
+    parser.add_argument("--output", help="write the report as JSON, usable as a later --baseline")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative slowdown allowed against the baseline")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="brunnen-e2e-")
+    benchmark = E2eBenchmark(workdir, args.mix, args.rate, args.duration, args.concurrency, args.identities,
+                             sign_delay=args.sign_delay, rpc_latency=args.rpc_latency,
+                             update_delay=args.update_delay, ipfs_latency=args.ipfs_latency, seed=args.seed)
+    try:
+        report = asyncio.run(benchmark.run())
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(format_report(report, baseline))
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for metric, previous, current in regressions:
+            print(f"REGRESSION {metric}: {previous:.2f} -> {current:.2f}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
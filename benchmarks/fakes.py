@@ -0,0 +1,214 @@
+"""
+In-process stand-ins for the services the identity system talks to: the Emercoin JSON-RPC,
+the IPFS HTTP API and the TPM signing key. They answer like the real services closely enough
+for the clients in this repository, with configurable latency so benchmarks can model them.
+"""
+from abc import ABC, abstractmethod
+import asyncio
+import hashlib
+import time
+from aiohttp import web
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from identity.merkle import merkle_root
+
+# Base32 alphabet of CIDv1 strings, fake CIDs only need to look and compare like real ones
+_BASE32 = "abcdefghijklmnopqrstuvwxyz234567"
+
+def fake_cid(data: bytes) -> str:
+    digest = int.from_bytes(hashlib.sha256(data).digest(), "big")
+    chars = []
+    for _ in range(52):
+        digest, index = divmod(digest, 32)
+        chars.append(_BASE32[index])
+    return "bafkrei" + "".join(chars)
+
+class _Service(ABC):
+    """Runs an aiohttp app on a free localhost port until stopped"""
+    def __init__(self):
+        self.url = None
+        self._runner = None
+
+    @abstractmethod
+    def create_app(self) -> web.Application:
+        pass
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+class FakeEmercoinNode(_Service):
+    """
+    Emercoin JSON-RPC answering name_show, name_new and name_update from a dict. name_update
+    holds a lock for update_delay seconds, like the wallet that stays locked while the
+    transaction is built, so concurrent updates queue behind each other.
+    Args:
+        names: initial NVS records, name to value
+        latency: seconds added to every call
+        update_delay: seconds a name_new or name_update keeps the wallet busy
+    """
+    def __init__(self, names: dict = None, latency: float = 0.0, update_delay: float = 0.0):
+        super().__init__()
+        self.names = dict(names or {})
+        self.latency = latency
+        self.update_delay = update_delay
+        self.calls = {}
+        self.transactions = []
+        self._wallet = asyncio.Lock()
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        app.router.add_post("/wallet/{wallet}", self.handle)
+        return app
+
+    def _error(self, request_id, code: int, message: str) -> web.Response:
+        return web.json_response({"result": None, "error": {"code": code, "message": message}, "id": request_id},
+                                 status=500)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        method, params, request_id = payload.get("method"), payload.get("params", []), payload.get("id")
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method == "name_show":
+            if not params or params[0] not in self.names:
+                return self._error(request_id, -4, "failed to read from name DB")
+            result = {"name": params[0], "value": self.names[params[0]], "expires_in": 365 * 175}
+        elif method in ("name_new", "name_update"):
+            if len(params) < 3:
+                return self._error(request_id, -1, f"{method} <name> <value> <days>")
+            name, value = params[0], params[1]
+            if method == "name_new" and name in self.names:
+                return self._error(request_id, -4, "this name already exists")
+            if method == "name_update" and name not in self.names:
+                return self._error(request_id, -4, "failed to read from name DB")
+            async with self._wallet:
+                if self.update_delay:
+                    await asyncio.sleep(self.update_delay)
+                self.names[name] = value
+                result = hashlib.sha256(f"{len(self.transactions)}:{name}:{value}".encode()).hexdigest()
+                self.transactions.append((method, name, value, result))
+        elif method == "getblockcount":
+            result = len(self.transactions)
+        else:
+            return self._error(request_id, -32601, "Method not found")
+        return web.json_response({"result": result, "error": None, "id": request_id})
+
+class FakeIpfsNode(_Service):
+    """
+    IPFS HTTP API answering add and cat from memory.
+    Args:
+        latency: seconds added to every request
+        bandwidth: bytes per second an add is slowed to, unlimited when 0
+    """
+    def __init__(self, latency: float = 0.0, bandwidth: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.blocks = {}
+        self.added_bytes = 0
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post("/api/v0/add", self.add)
+        app.router.add_post("/api/v0/cat", self.cat)
+        return app
+
+    async def add(self, request: web.Request) -> web.Response:
+        reader = await request.multipart()
+        part = await reader.next()
+        if part is None:
+            return web.json_response({"Message": "file argument 'path' is required", "Code": 1}, status=400)
+        data = await part.read()
+        delay = self.latency + (len(data) / self.bandwidth if self.bandwidth else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        cid = fake_cid(data)
+        self.blocks[cid] = data
+        self.added_bytes += len(data)
+        return web.json_response({"Name": part.filename or cid, "Hash": cid, "Size": str(len(data))})
+
+    async def cat(self, request: web.Request) -> web.Response:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        data = self.blocks.get(request.query.get("arg"))
+        if data is None:
+            return web.json_response({"Message": "block was not found locally (offline)", "Code": 0}, status=500)
+        return web.Response(body=data, content_type="application/octet-stream")
+
+class FakeSigner():
+    """
+    Stand-in for tpm.signer.BatchSigner signing with an in-memory ECDSA P-256 key, the
+    ecc256:ecdsa-sha256 key tpm_provisioning.sh creates. Signatures are serialized through one
+    lock and take at least sign_delay seconds, swtpm signs one command at a time as well.
+    Args:
+        sign_delay: seconds one signature takes, roughly 1 ms for swtpm and 30 ms for a hardware TPM
+    """
+    def __init__(self, sign_delay: float = 0.0):
+        self.sign_delay = sign_delay
+        self.key = ec.generate_private_key(ec.SECP256R1())
+        self.handle = 0x81000000
+        self.restricted = False
+        self.signatures = 0
+        self.signing_seconds = 0.0
+        self._device = asyncio.Lock()
+
+    async def load(self):
+        return self.key.public_key()
+
+    async def _sign(self, row_hash: str) -> bytes:
+        async with self._device:
+            started = time.perf_counter()
+            signature = self.key.sign(row_hash.encode(), ec.ECDSA(hashes.SHA256()))
+            remaining = self.sign_delay - (time.perf_counter() - started)
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+            return signature
+
+    def verify(self, row_hash: str, signature: bytes) -> bool:
+        try:
+            self.key.public_key().verify(signature, row_hash.encode(), ec.ECDSA(hashes.SHA256()))
+            return True
+        except InvalidSignature:
+            return False
+
+    async def sign_row_hashes(self, row_hashes: list) -> list:
+        started = time.perf_counter()
+        signatures = await asyncio.gather(*(self._sign(row_hash) for row_hash in row_hashes))
+        self._record(len(signatures), started)
+        return signatures
+
+    async def sign_merkle_root(self, row_hashes: list) -> tuple:
+        root = merkle_root(row_hashes)
+        if root is None:
+            raise ValueError("Cannot sign the Merkle root of an empty batch")
+        started = time.perf_counter()
+        signature = await self._sign(root)
+        self._record(1, started)
+        return root, signature
+
+    def _record(self, count: int, started: float):
+        self.signatures += count
+        self.signing_seconds += time.perf_counter() - started
+
+    def get_stats(self) -> dict:
+        return {
+            "handle": f"0x{self.handle:08X}",
+            "restricted": self.restricted,
+            "signatures": self.signatures,
+            "signing_seconds": self.signing_seconds,
+            "signatures_per_second": self.signatures / self.signing_seconds if self.signing_seconds else 0.0,
+        }
@@ -0,0 +1,80 @@
+"""
+Load test for the identity lookup API, reports throughput and p50/p99 latency.
+Start the API first (python -m identity.api --db <hash>.tmp), then from the repository root:
+python -m benchmarks.load_identity_api --url http://127.0.0.1:8080 --db <hash>.tmp -n 10000 -c 64
+"""
+import argparse
+import asyncio
+import random
+import sqlite3
+import time
+import aiohttp
+from reliability.harness import percentile
+
+def load_addresses(db_path: str) -> list:
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return [row[0] for row in connection.execute("SELECT address FROM address_keys")]
+    finally:
+        connection.close()
+
+async def run(url: str, addresses: list, requests: int, concurrency: int, mode: str, batch_size: int) -> dict:
+    latencies = []
+    statuses = {}
+    etags = {}
+    remaining = iter(range(requests))
+
+    async def worker(session: aiohttp.ClientSession):
+        for _ in remaining:
+            if mode == "batch":
+                started = time.perf_counter()
+                async with session.post(f"{url}/v1/identities:lookup",
+                                        json={"addresses": random.sample(addresses, min(batch_size, len(addresses)))}) as response:
+                    await response.read()
+            else:
+                address = random.choice(addresses)
+                headers = {"If-None-Match": etags[address]} if mode == "revalidate" and address in etags else {}
+                started = time.perf_counter()
+                async with session.get(f"{url}/v1/identity/{address}", headers=headers) as response:
+                    await response.read()
+                    if "ETag" in response.headers:
+                        etags[address] = response.headers["ETag"]
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "statuses": statuses,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--db", required=True, help="database the API serves, used to pick addresses")
+    parser.add_argument("-n", "--requests", type=int, default=10000)
+    parser.add_argument("-c", "--concurrency", type=int, default=64)
+    parser.add_argument("--mode", choices=("get", "revalidate", "batch"), default="get",
+                        help="plain GETs, GETs with If-None-Match, or batch POSTs")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    addresses = load_addresses(args.db)
+    if not addresses:
+        parser.error("the database has no identities to look up")
+    report = asyncio.run(run(args.url, addresses, args.requests, args.concurrency, args.mode, args.batch_size))
+    print(f"{report['requests']} requests in {report['seconds']:.2f}s ({report['requests_per_second']:.0f} req/s)")
+    print(f"p50 {report['p50_ms']:.2f} ms  p99 {report['p99_ms']:.2f} ms  max {report['max_ms']:.2f} ms")
+    print(f"statuses {report['statuses']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Container entrypoint. Starts dbus, swtpm, tpm2-abrmd, Yggdrasil and RabbitMQ concurrently where their
+dependencies allow, waits on sockets and bus names instead of sleeping, installs Python dependencies
+only when Pipfile.lock changed, prints a startup timeline and then runs the tests in DEV_MODE.
+"""
+import asyncio
+import hashlib
+import os
+import stat
+import sys
+from bootstrap.deps import ensure_dependencies
+from bootstrap.readiness import wait_for_dbus_name, wait_for_path, wait_for_port
+from bootstrap.runner import Bootstrapper, BootstrapError, Step, run_checked, run_until_exit
+
+DBUS_SOCKET = "/var/run/dbus/system_bus_socket"
+YGGDRASIL_SOCKET = "/var/run/yggdrasil.sock"
+YGGDRASIL_STARTUP_LOG = "/var/log/yggdrasil-startup.log"
+SWTPM_PORT = 2321
+SWTPM_CTRL_PORT = 2322
+RABBITMQ_PORT = 5672
+SECRETS_DIR = "/dev/shm/secrets"
+HMAC_KEY_PATH = os.path.join(SECRETS_DIR, "hmac_key")
+
+class ContainerServices():
+    """Step actions for the services entrypoint.sh used to start one after the other"""
+    def __init__(self, dev_mode: bool = False, lockfile: str = "/tpm/Pipfile.lock"):
+        self.dev_mode = dev_mode
+        self.lockfile = lockfile
+        self.processes = []
+
+    async def spawn(self, *command) -> asyncio.subprocess.Process:
+        process = await asyncio.create_subprocess_exec(*command)
+        self.processes.append(process)
+        return process
+
+    def terminate(self):
+        for process in self.processes:
+            if process.returncode is None:
+                process.terminate()
+
+    async def tun(self):
+        if not os.path.exists("/dev/net/tun"):
+            os.makedirs("/dev/net", exist_ok=True)
+            os.mknod("/dev/net/tun", stat.S_IFCHR | 0o666, os.makedev(10, 200))
+            os.chmod("/dev/net/tun", 0o666)
+
+    async def dbus(self):
+        os.makedirs(os.path.dirname(DBUS_SOCKET), exist_ok=True)
+        await self.spawn("dbus-daemon", "--system", "--nofork")
+        await wait_for_path(DBUS_SOCKET)
+        print("✅ DBus is ready!", flush=True)
+
+    async def swtpm(self):
+        await self.spawn(
+            "swtpm", "socket",
+            "--tpmstate", "dir=/tpmdata",
+            "--ctrl", f"type=tcp,port={SWTPM_CTRL_PORT}",
+            "--server", f"type=tcp,port={SWTPM_PORT}",
+            "--flags", "not-need-init",
+            "--log", "level=20,file=/tpmdata/swtpm.log",
+            "--tpm2"
+        )
+        await wait_for_port("localhost", SWTPM_PORT)
+        print("✅ SWTPM is ready!", flush=True)
+
+    async def abrmd(self):
+        await self.spawn("tpm2-abrmd", f"--tcti=swtpm:host=localhost,port={SWTPM_PORT}", "--allow-root")
+        await wait_for_dbus_name("com.intel.tss2.Tabrmd")
+        print("✅ tpm2-abrmd is ready!", flush=True)
+
+    async def tpm2_startup(self):
+        await run_checked("tpm2_startup", "-c")
+        print("✅ TPM startup complete", flush=True)
+
+    async def yggdrasil(self):
+        # The startup script unseals the key and returns with Yggdrasil and its monitor still running
+        # in the background holding its stdout, so wait for the script to exit and then for the socket
+        print(await run_until_exit("/usr/local/bin/yggdrasil-tpm-startup.sh", log_path=YGGDRASIL_STARTUP_LOG), end="")
+        await wait_for_path(YGGDRASIL_SOCKET)
+        own = await run_checked("/usr/local/bin/yggdrasilctl", "getSelf")
+        address = next((line.split()[-1] for line in own.splitlines() if "IPv6" in line), "unknown")
+        print(f"✅ Yggdrasil started with IPv6: {address}", flush=True)
+        print(await run_checked("/usr/local/bin/yggdrasilctl", "getPeers"), end="")
+
+    async def rabbitmq(self):
+        await self.spawn("/usr/sbin/rabbitmq-server")
+        await wait_for_port("localhost", RABBITMQ_PORT)
+        print("✅ RabbitMQ is ready!", flush=True)
+
+    async def hmac_key(self):
+        os.makedirs(SECRETS_DIR, mode=0o700, exist_ok=True)
+        os.chmod(SECRETS_DIR, 0o700)
+        await run_checked("bash", "/tpm/tpm_random_number.sh", "-o", HMAC_KEY_PATH)
+        os.chmod(HMAC_KEY_PATH, 0o600)
+        with open(HMAC_KEY_PATH, 'rb') as file:
+            print(f"📝 HMAC key hash (for blockchain storage): {hashlib.sha256(file.read()).hexdigest()}")
+        os.environ["HMAC_KEY_PATH"] = HMAC_KEY_PATH
+
+    async def dependencies(self):
+        if await ensure_dependencies(self.lockfile, self.dev_mode):
+            print("📦 Installed dependencies from Pipfile.lock")
+        else:
+            print("📦 Pipfile.lock unchanged, skipping dependency install")
+
+    def steps(self) -> list:
+        return [
+            Step("tun", self.tun),
+            Step("dbus", self.dbus),
+            Step("swtpm", self.swtpm),
+            Step("rabbitmq", self.rabbitmq, timeout=120.0),
+            Step("dependencies", self.dependencies, timeout=600.0),
+            Step("abrmd", self.abrmd, depends_on=("dbus", "swtpm")),
+            Step("tpm2_startup", self.tpm2_startup, depends_on=("abrmd",)),
+            Step("hmac_key", self.hmac_key, depends_on=("tpm2_startup",)),
+            Step("yggdrasil", self.yggdrasil, depends_on=("tpm2_startup", "tun")),
+        ]
+
+async def main() -> int:
+    dev_mode = bool(os.environ.get("DEV_MODE"))
+    print("🛠️  Running in DEVELOPMENT mode" if dev_mode else "🚀 Running in PRODUCTION mode")
+    services = ContainerServices(dev_mode)
+    bootstrapper = Bootstrapper(services.steps())
+    try:
+        await bootstrapper.run()
+    except BootstrapError as e:
+        print(e)
+        services.terminate()
+        return 1
+    print("⏱️  Startup timeline:")
+    print(bootstrapper.format_timeline())
+    if not dev_mode:
+        return 0
+    tests = await asyncio.create_subprocess_exec("pipenv", "run", "pytest", "/tests", cwd=os.path.dirname(services.lockfile))
+    return await tests.wait()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,50 @@
+"""
+Skips pipenv dependency installation when Pipfile.lock has not changed since the last install.
+python -m bootstrap.deps [--dev] records the current lockfile as installed, used by the image build.
+"""
+import argparse
+import hashlib
+import os
+from bootstrap.runner import run_checked
+
+LOCKFILE = "Pipfile.lock"
+STAMP_PATH = "/var/lib/brunnen/deps.sha256"
+
+def lockfile_digest(lockfile: str, dev: bool) -> str:
+    """Digest of the lockfile and install mode, dev installs pull in extra packages"""
+    digest = hashlib.sha256(b"dev\n" if dev else b"default\n")
+    with open(lockfile, 'rb') as file:
+        digest.update(file.read())
+    return digest.hexdigest()
+
+def installed_digest(stamp_path: str) -> str:
+    try:
+        with open(stamp_path) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+def write_stamp(lockfile: str, dev: bool, stamp_path: str = STAMP_PATH):
+    os.makedirs(os.path.dirname(stamp_path), exist_ok=True)
+    with open(stamp_path, 'w') as file:
+        file.write(lockfile_digest(lockfile, dev) + "\n")
+
+async def ensure_dependencies(lockfile: str = LOCKFILE, dev: bool = False, stamp_path: str = STAMP_PATH,
+                              command: tuple = ("pipenv", "install", "--ignore-pipfile")) -> bool:
+    """Installs from the lockfile unless it is already installed, returns True if an install ran"""
+    if installed_digest(stamp_path) == lockfile_digest(lockfile, dev):
+        return False
+    await run_checked(*command, *(("--dev",) if dev else ()), cwd=os.path.dirname(os.path.abspath(lockfile)))
+    write_stamp(lockfile, dev, stamp_path)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lockfile", default=LOCKFILE)
+    parser.add_argument("--stamp", default=STAMP_PATH)
+    parser.add_argument("--dev", action="store_true")
+    args = parser.parse_args()
+    write_stamp(args.lockfile, args.dev, args.stamp)
+
+if __name__ == "__main__":
+    main()
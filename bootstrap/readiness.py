@@ -0,0 +1,119 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import shutil
+
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# Used only where no event source exists, such as platforms without inotify
+FALLBACK_POLL_INTERVAL = 0.05
+
+class ReadinessTimeout(TimeoutError):
+    """Raised when a service does not become ready in time"""
+
+def _libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+_LIBC = _libc()
+
+async def _wait_for_path_inotify(path: str) -> bool:
+    """Waits for path to be created using inotify on its parent, False if inotify is unavailable"""
+    directory = os.path.dirname(os.path.abspath(path))
+    if _LIBC is None or not os.path.isdir(directory):
+        return False
+    fd = _LIBC.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        return False
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    try:
+        if _LIBC.inotify_add_watch(fd, directory.encode(), IN_CREATE | IN_MOVED_TO) < 0:
+            return False
+        loop.add_reader(fd, changed.set)
+        try:
+            # Checked after the watch is in place so a creation in between is not missed
+            while not os.path.exists(path):
+                await changed.wait()
+                changed.clear()
+                try:
+                    os.read(fd, 4096)
+                except BlockingIOError:
+                    pass
+        finally:
+            loop.remove_reader(fd)
+        return True
+    finally:
+        os.close(fd)
+
+async def _poll_for_path(path: str):
+    while not os.path.exists(path):
+        await asyncio.sleep(FALLBACK_POLL_INTERVAL)
+
+async def wait_for_path(path: str, timeout: float = 30.0):
+    """Returns once path exists, such as a unix socket created by a daemon"""
+    async def wait():
+        if not await _wait_for_path_inotify(path):
+            await _poll_for_path(path)
+    try:
+        await asyncio.wait_for(wait(), timeout)
+    except asyncio.TimeoutError:
+        raise ReadinessTimeout(f"{path} did not appear within {timeout}s")
+
+async def wait_for_port(host: str, port: int, timeout: float = 30.0):
+    """Returns once a TCP connection to host:port is accepted"""
+    async def wait():
+        delay = 0.01
+        while True:
+            try:
+                _, writer = await asyncio.open_connection(host, port)
+            except OSError:
+                # Connection refused comes back immediately, back off a little between attempts
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.2)
+                continue
+            writer.close()
+            await writer.wait_closed()
+            return
+    try:
+        await asyncio.wait_for(wait(), timeout)
+    except asyncio.TimeoutError:
+        raise ReadinessTimeout(f"{host}:{port} did not accept connections within {timeout}s")
+
+async def wait_for_dbus_name(name: str, timeout: float = 30.0):
+    """Returns once name is owned on the system bus, blocking in gdbus instead of polling busctl"""
+    async def poll_busctl():
+        while True:
+            process = await asyncio.create_subprocess_exec(
+                "busctl", "list", "--system", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+            )
+            output, _ = await process.communicate()
+            if name in output.decode(errors="replace"):
+                return
+            await asyncio.sleep(FALLBACK_POLL_INTERVAL)
+    async def wait():
+        if shutil.which("gdbus") is None:
+            await poll_busctl()
+            return
+        process = await asyncio.create_subprocess_exec(
+            "gdbus", "wait", "--system", "--timeout", str(max(int(timeout), 1)), name,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            if await process.wait() != 0:
+                raise ReadinessTimeout(f"{name} was not registered on the system bus")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+    try:
+        await asyncio.wait_for(wait(), timeout)
+    except asyncio.TimeoutError:
+        raise ReadinessTimeout(f"{name} was not registered on the system bus within {timeout}s")
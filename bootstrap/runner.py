@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+class BootstrapError(Exception):
+    """Raised when a bootstrap step fails, times out or a command exits non-zero"""
+
+class Step():
+    """
+    One unit of container startup, run as soon as every step it depends on is ready.
+    Args:
+        name: name used in depends_on and the timeline
+        action: async callable that returns once the service is ready
+        depends_on: names of steps that must be ready first
+        timeout: seconds the action may take
+    """
+    def __init__(self, name: str, action, depends_on: tuple = (), timeout: float = 60.0):
+        self.name = name
+        self.action = action
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+
+async def run_checked(*command, **kwargs) -> str:
+    """Runs a command to completion and returns its output, raises BootstrapError on failure"""
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT, **kwargs
+    )
+    output, _ = await process.communicate()
+    output = output.decode(errors="replace")
+    if process.returncode != 0:
+        raise BootstrapError(f"{' '.join(command)} exited with {process.returncode}:\n{output}")
+    return output
+
+async def run_until_exit(*command, log_path: str, **kwargs) -> str:
+    """
+    Runs a command that leaves background processes behind, such as a startup script ending in
+    `daemon &`. Its output goes to log_path instead of a pipe, so the call returns when the command
+    exits rather than when every child closes stdout. Returns the log, raises BootstrapError on failure.
+    """
+    with open(log_path, "wb") as log:
+        process = await asyncio.create_subprocess_exec(
+            *command, stdin=asyncio.subprocess.DEVNULL, stdout=log, stderr=asyncio.subprocess.STDOUT, **kwargs
+        )
+    returncode = await process.wait()
+    with open(log_path, "rb") as log:
+        output = log.read().decode(errors="replace")
+    if returncode != 0:
+        raise BootstrapError(f"{' '.join(command)} exited with {returncode}:\n{output}")
+    return output
+
+class Bootstrapper():
+    """
+    Runs startup steps concurrently in dependency order and records when each one started
+    and became ready. A failed step marks everything that depends on it as skipped.
+    """
+    def __init__(self, steps: list, clock=time.monotonic):
+        self.steps = {step.name: step for step in steps}
+        self.timeline = {}
+        self._clock = clock
+        self._started_at = None
+        self._check_graph()
+
+    def _check_graph(self):
+        for step in self.steps.values():
+            for dependency in step.depends_on:
+                if dependency not in self.steps:
+                    raise ValueError(f"Step {step.name} depends on unknown step {dependency}")
+        visiting, visited = set(), set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle involving step {name}")
+            visiting.add(name)
+            for dependency in self.steps[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.steps:
+            visit(name)
+
+    async def run(self) -> dict:
+        self._started_at = self._clock()
+        done = {name: asyncio.Event() for name in self.steps}
+        await asyncio.gather(*(self._run_step(step, done) for step in self.steps.values()))
+        failed = [name for name, entry in self.timeline.items() if entry["status"] == "failed"]
+        if failed:
+            raise BootstrapError(f"Bootstrap failed in {', '.join(failed)}:\n{self.format_timeline()}")
+        return self.timeline
+
+    async def _run_step(self, step: Step, done: dict):
+        try:
+            for dependency in step.depends_on:
+                await done[dependency].wait()
+            blocked = [name for name in step.depends_on if self.timeline[name]["status"] != "ready"]
+            if blocked:
+                self._record(step.name, "skipped", error=f"waiting on {', '.join(blocked)}")
+                return
+            started = self._clock() - self._started_at
+            try:
+                await asyncio.wait_for(step.action(), step.timeout)
+            except asyncio.TimeoutError:
+                self._record(step.name, "failed", started, error=f"not ready within {step.timeout}s")
+            except Exception as e:
+                self._record(step.name, "failed", started, error=f"{type(e).__name__}: {e}")
+            else:
+                self._record(step.name, "ready", started)
+        finally:
+            done[step.name].set()
+
+    def _record(self, name: str, status: str, started: float = None, error: str = None):
+        finished = self._clock() - self._started_at
+        self.timeline[name] = {
+            "status": status,
+            "start": started,
+            "ready": finished if status == "ready" else None,
+            "duration": finished - started if started is not None else None,
+            "error": error,
+        }
+
+    def format_timeline(self) -> str:
+        """Startup timeline ordered by start time, one line per step"""
+        lines = []
+        ordered = sorted(self.timeline.items(), key=lambda item: (item[1]["start"] is None, item[1]["start"] or 0))
+        for name, entry in ordered:
+            if entry["start"] is None:
+                lines.append(f"{'':>17}  {name:<16} {entry['status']} ({entry['error']})")
+                continue
+            line = f"{entry['start']:>7.2f}s → {entry['start'] + entry['duration']:>6.2f}s  {name:<16} " \
+                   f"{entry['status']} in {entry['duration']:.2f}s"
+            if entry["error"]:
+                line += f" ({entry['error']})"
+            lines.append(line)
+        return "\n".join(lines)
@@ -1,11 +1,108 @@
 import keyring
 import asyncio
+import functools
+import inspect
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from keyring.backends import SecretService
 
 class PasswordGetError(keyring.errors.KeyringError):
     """Raised when password can't be retrieved"""
 
-class ConfigManager():
+class BatchResult():
+    """Outcome of a batched keyring operation, reported per (service_name, username) key"""
     def __init__(self):
+        self.values = {}
+        self.errors = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+def _group_by_service(keys) -> dict:
+    groups = {}
+    for service_name, username in keys:
+        groups.setdefault(service_name, []).append(username)
+    return groups
+
+class _CollectionSession():
+    """
+    Password operations on one open Secret Service collection, the same calls keyring's
+    SecretService backend makes but without opening and closing a D-Bus connection per key.
+    Args:
+        backend: keyring.backends.SecretService.Keyring the collection is taken from
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        # Opens the connection and unlocks the collection, prompting at most once
+        self.collection = backend.get_preferred_collection()
+
+    def get_password(self, service_name: str, username: str):
+        for item in self.collection.search_items(self.backend._query(service_name, username)):
+            self.backend.unlock(item)
+            return item.get_secret().decode('utf-8')
+        return None
+
+    def set_password(self, service_name: str, username: str, password: str):
+        attributes = self.backend._query(service_name, username, application=self.backend.appid)
+        self.collection.create_item(f"Password for '{username}' on '{service_name}'", attributes, password, replace=True)
+
+    def delete_password(self, service_name: str, username: str):
+        for item in self.collection.search_items(self.backend._query(service_name, username)):
+            return item.delete()
+        raise keyring.errors.PasswordDeleteError("No such password!")
+
+    def close(self):
+        self.collection.connection.close()
+
+def _run_group(backend, service_name: str, usernames: list, operation_name: str, arguments: dict = None) -> tuple:
+    """
+    Runs a keyring operation for every username of one service and returns (values, errors) by
+    username. A Secret Service backend serves the whole group from one session, any other
+    backend is called once per key.
+    Args:
+        backend: keyring backend, called from this thread
+        operation_name: get_password, set_password or delete_password
+        arguments: extra arguments per username, such as the password to set
+    """
+    values, errors = {}, {}
+    arguments = arguments or {}
+    session = None
+    if isinstance(backend, SecretService.Keyring):
+        try:
+            session = _CollectionSession(backend)
+        except Exception as e:
+            return values, {username: e for username in usernames}
+    target = session if session is not None else backend
+    try:
+        for username in usernames:
+            try:
+                values[username] = getattr(target, operation_name)(service_name, username, *arguments.get(username, ()))
+            except Exception as e:
+                errors[username] = e
+    finally:
+        if session is not None:
+            session.close()
+    return values, errors
+
+class _CacheRegistry():
+    """Tracks the CredentialCaches reading through a manager so every write can invalidate them"""
+    def __init__(self):
+        # Cache to the service whose credentials it holds, caches are not kept alive by the manager
+        self._caches = weakref.WeakKeyDictionary()
+
+    def register_cache(self, cache, service_name: str = 'emercoin'):
+        """Has writes through this manager invalidate cache, anything with invalidate(username) works"""
+        self._caches[cache] = service_name
+
+    def _invalidate(self, service_name: str, username: str):
+        for cache, cached_service in list(self._caches.items()):
+            if cached_service == service_name:
+                cache.invalidate(username)
+
+class ConfigManager(_CacheRegistry):
+    def __init__(self):
+        super().__init__()
         self.service_name = 'emercoin'
 
     def save_emercoin_login(self, username: str, password: str):
@@ -16,6 +113,8 @@ class ConfigManager():
             raise keyring.errors.PasswordSetError(f"Saving the emercoin password failed:\n{e}")
         except Exception as e:
             raise keyring.errors.PasswordSetError(f"Unexpected error saving emercoin password:\n{e}")
+        finally:
+            self._invalidate(self.service_name, username)
     
     def load_emercoin_login(self, username: str):
         """Retrives the emercoin login from the keyring"""
@@ -34,6 +133,8 @@ class ConfigManager():
             raise keyring.errors.PasswordDeleteError(f"Unable to remove password for emercoin\n{e}")
         except Exception as e:
             raise keyring.errors.PasswordDeleteError(f"Unexpected error removing emercoin password:\n{e}")
+        finally:
+            self._invalidate(self.service_name, username)
 
     def reset_emercoin_login(self, username: str, password: str):
         """Resets stored login for emercoin node"""
@@ -67,8 +168,88 @@ class ConfigManager():
                 f"Unexepected error resetting login {username}:",
                 keyring.errors.KeyringError
             )
+        finally:
+            # Covers a reset that failed before reaching the keyring writes
+            self._invalidate(self.service_name, username)
+
+    def _run_batch(self, keys, operation_name: str, make_error, arguments=None, writes: bool = False) -> BatchResult:
+        """
+        Runs operation_name for every (service_name, username) key, one keyring session per service.
+        Args:
+            make_error: builds the reported error from (service_name, username, error)
+            arguments: function returning the extra arguments of a key
+            writes: the operation changes credentials, so registered caches are invalidated
+        """
+        result = BatchResult()
+        backend = keyring.get_keyring()
+        for service_name, usernames in _group_by_service(keys).items():
+            extra = {username: arguments(service_name, username) for username in usernames} if arguments else None
+            try:
+                values, errors = _run_group(backend, service_name, usernames, operation_name, extra)
+            finally:
+                if writes:
+                    for username in usernames:
+                        self._invalidate(service_name, username)
+            for username, value in values.items():
+                result.values[(service_name, username)] = True if writes else value
+            for username, error in errors.items():
+                result.errors[(service_name, username)] = make_error(service_name, username, error)
+        return result
+
+    def get_many(self, keys) -> BatchResult:
+        """Retrieves passwords for (service_name, username) keys, failures are reported per key"""
+        return self._run_batch(keys, 'get_password', lambda service_name, username, e: PasswordGetError(
+            f"Retriving the password for {username} failed:\n{e}"))
+
+    def set_many(self, credentials: dict) -> BatchResult:
+        """Saves a {(service_name, username): password} mapping, failures are reported per key"""
+        return self._run_batch(
+            credentials, 'set_password',
+            lambda service_name, username, e: keyring.errors.PasswordSetError(
+                f"Saving the {service_name} password failed:\n{e}"),
+            arguments=lambda service_name, username: (credentials[(service_name, username)],),
+            writes=True)
+
+    def delete_many(self, keys) -> BatchResult:
+        """Removes passwords for (service_name, username) keys, failures are reported per key"""
+        return self._run_batch(keys, 'delete_password', lambda service_name, username, e: keyring.errors.PasswordDeleteError(
+            f"Unable to remove password for {service_name}\n{e}"), writes=True)
+
+class _KeyLocks():
+    """
+    Holds the locks of one or more users for a keyring operation. Blocking calls abandoned after
+    a timeout keep the locks until their thread finishes, so a late write cannot land after a
+    newer one.
+    """
+    def __init__(self, locks: list):
+        self.locks = locks
+        self.abandoned = []
+
+    async def __aenter__(self):
+        acquired = []
+        try:
+            for lock in self.locks:
+                await lock.acquire()
+                acquired.append(lock)
+        except BaseException:
+            for lock in acquired:
+                lock.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pending = [future for future in self.abandoned if not future.done()]
+        if pending:
+            asyncio.gather(*pending, return_exceptions=True).add_done_callback(lambda _: self._release())
+        else:
+            self._release()
+        return False
+
+    def _release(self):
+        for lock in self.locks:
+            lock.release()
 
-class ConfigManagerAsync():
+class ConfigManagerAsync(_CacheRegistry):
     """Configuration Manager that handles methods async"""
     OPERATION_MAPPING = {
         'set_password': {
@@ -94,62 +275,248 @@ class ConfigManagerAsync():
         'error_template': "Operation on {service} failed",
         'unexpected_template': "Unexpected error during operation on {service}"
     }
-    def __init__(self, keyring_backend=None):
+    def __init__(self, keyring_backend=None, max_workers: int = 4, timeout: float = 5.0):
+        """
+        Args:
+            keyring_backend: backend to use, the active keyring backend when None
+            max_workers: threads available to blocking keyring backends
+            timeout: seconds a keyring operation may take before it is abandoned. A thread cannot
+                be interrupted, so an abandoned blocking call keeps its worker and its users' locks
+                until it returns, and new blocking calls fail fast once every worker is stuck
+        """
+        super().__init__()
         self.keyring = keyring_backend
-        self._locks = {}
-    
-    
-    def _get_lock(self, username: str) -> asyncio.Lock():
-        if username not in self._locks:
-            self._locks[username] = asyncio.Lock()
-        return self._locks[username]
-    
-    async def _execute_keyring_operation(self, username: str, operation_name: str, error_msg: str, *args, **kwargs):
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.abandoned = 0
+        # Sync backends such as Secret Service block on D-Bus, keep them off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="keyring")
+        # Locks only live while an operation holds them, so the table cannot grow unbounded
+        self._locks = weakref.WeakValueDictionary()
+
+    def _get_lock(self, username: str) -> asyncio.Lock:
+        lock = self._locks.get(username)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[username] = lock
+        return lock
+
+    def _hold(self, *usernames) -> _KeyLocks:
+        # A fixed order keeps holders sharing users from deadlocking
+        return _KeyLocks([self._get_lock(username) for username in sorted(set(usernames))])
+
+    async def _call_blocking(self, hold: _KeyLocks, func, timeout: float, abandoned=None):
+        """
+        Runs func on a keyring worker thread. On timeout the call is left to finish in the background,
+        hold keeps its locks until then and abandoned is called once it has.
+        """
+        if self.abandoned >= self.max_workers:
+            raise keyring.errors.KeyringError(
+                f"Keyring backend is not responding, {self.abandoned} timed out calls still hold every worker")
+        future = asyncio.get_running_loop().run_in_executor(self._executor, func)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            self.abandoned += 1
+            hold.abandoned.append(future)
+
+            def finished(_):
+                self.abandoned -= 1
+                if abandoned is not None:
+                    abandoned()
+            future.add_done_callback(finished)
+            raise
+
+    def _get_backend(self):
+        return self.keyring if self.keyring is not None else keyring.get_keyring()
+
+    def _map_error(self, operation_name: str, template_key: str, service_name: str, username: str):
+        mapping = self.OPERATION_MAPPING.get(operation_name, self.DEFAULT_MAPPING)
+        message = mapping[template_key].format(service=service_name, username=username)
+        return mapping['exception'], message
+
+    async def _execute_keyring_operation(self, service_name: str, username: str, operation_name: str, *args,
+                                         hold: _KeyLocks = None, **kwargs):
         """Generic Method to execute keyring operations with proper locking and error handling
         Args:
+            service_name: Service the credential belongs to, used in error messages
             username: Username to acquire lock for
             operation_name: Name of the keyring method
-            error_msg: Base error messae for the exceptions
+            hold: locks the caller already holds for username, acquired here when None
             *args, **kwargs: Arguments to pass to the keyring method
         """
-        async with self._get_lock(username):
-            try:
-                if not hasattr(self.keyring, operation_name):
-                    raise AttributeError(f"Keyring has no method for {operation_name}.")
-                method = getattr(self.keyring, operation_name)
-                if asyncio.iscoroutinefunction(method):
-                    return await method(*args, **kwargs)
-                else:
-                    return methodd(*args, **kwargs)
-            except keyring.errors.KeyringError as error:
-                match operation_name:
-                    case op if op in self.OPERATION_MAPPING:
-                        mapping = self.OPERATION_EXCEPTIONS[op]
-                        template = mapping['error_template']
-                        exception_class = mapping['exception']
-                    case _:
-                        mapping = self.DEFAULT_MAPPING
-                        template = mapping['error_template']
-                        exception_class = mapping['exception']
-                message = template.format(serivce=service, username=username)
-                raise exception_class(f"{message}:\n{error}")
-            except Exception as error:
-                match operation_name:
-                    case op if op in self.OPERATION_MAPPING:
-                        mapping = self.OPERATION_MAPPING[op]
-                        template = mapping['unexpected_template']
-                        exception_class = mapping['exception']
-                    case _:
-                        mapping = self.DEFAULT_MAPPING
-                        template = mapping['unexpected_template']
-                        exception_class = mapping['exception']
-                message = template.format(serivce=service, username=username)
-                raise exception_class(f"{message}:\n{error}")
+        if hold is None:
+            async with self._hold(username) as hold:
+                return await self._execute_keyring_operation(
+                    service_name, username, operation_name, *args, hold=hold, **kwargs)
+        try:
+            backend = self._get_backend()
+            if not hasattr(backend, operation_name):
+                raise AttributeError(f"Keyring has no method for {operation_name}.")
+            method = getattr(backend, operation_name)
+            # keyring wraps set_password in a sync validator, look through it
+            if inspect.iscoroutinefunction(inspect.unwrap(method)):
+                return await asyncio.wait_for(method(*args, **kwargs), self.timeout)
+            # A write that lands after its timeout must still reach the caches
+            landed = None if operation_name == 'get_password' else functools.partial(self._invalidate, service_name, username)
+            return await self._call_blocking(hold, functools.partial(method, *args, **kwargs), self.timeout, landed)
+        except asyncio.TimeoutError:
+            exception_class, message = self._map_error(operation_name, 'error_template', service_name, username)
+            raise exception_class(f"{message}:\ntimed out after {self.timeout}s")
+        except keyring.errors.KeyringError as error:
+            exception_class, message = self._map_error(operation_name, 'error_template', service_name, username)
+            raise exception_class(f"{message}:\n{error}")
+        except Exception as error:
+            exception_class, message = self._map_error(operation_name, 'unexpected_template', service_name, username)
+            raise exception_class(f"{message}:\n{error}")
 
     async def save_login(self, service_name: str, username: str, password: str):
-        await self._execute_keyring_operation(
-            username, 'set_password', service_name, *[service_name, username, password]
+        """Saves the username & password in the keyring"""
+        try:
+            await self._execute_keyring_operation(
+                service_name, username, 'set_password', *[service_name, username, password]
+                )
+        finally:
+            self._invalidate(service_name, username)
+
+    async def load_login(self, service_name: str, username: str) -> str:
+        """Retrieves the password for username from the keyring"""
+        return await self._execute_keyring_operation(
+            service_name, username, 'get_password', *[service_name, username]
             )
-    
-    async def load_login(service_name: str, username: str, password: str) -> str:
-        return "false"
+
+    async def delete_login(self, service_name: str, username: str):
+        """Removes the password for username from the keyring"""
+        try:
+            await self._execute_keyring_operation(
+                service_name, username, 'delete_password', *[service_name, username]
+                )
+        finally:
+            self._invalidate(service_name, username)
+
+    async def reset_login(self, service_name: str, username: str, password: str):
+        """Resets a stored login, restoring the original password if the reset fails"""
+        original_password = None
+
+        async def run(operation_name, *args):
+            return await self._execute_keyring_operation(
+                service_name, username, operation_name, service_name, username, *args, hold=hold)
+
+        async def handle_restoration(error_message, error_type, error):
+            """Helper function to handle error and restoration logic"""
+            if original_password:
+                try:
+                    await run('set_password', original_password)
+                except Exception:
+                    pass
+            return error_type(f"{error_message}\n{error}")
+
+        # One hold over the whole sequence so no other reset or write interleaves with it
+        async with self._hold(username) as hold:
+            try:
+                original_password = await run('get_password')
+                await run('delete_password')
+                await run('set_password', password)
+            except keyring.errors.PasswordDeleteError as e:
+                raise await handle_restoration(
+                    f"Unable to remove password for {username}",
+                    keyring.errors.PasswordDeleteError,
+                    e
+                )
+            except keyring.errors.PasswordSetError as e:
+                raise await handle_restoration(
+                    "Saving the new password failed!",
+                    keyring.errors.PasswordSetError,
+                    e
+                )
+            except Exception as e:
+                raise await handle_restoration(
+                    f"Unexpected error resetting login {username}:",
+                    keyring.errors.KeyringError,
+                    e
+                )
+            finally:
+                self._invalidate(service_name, username)
+
+    async def _run_group(self, result: BatchResult, backend, service_name: str, usernames: list,
+                         operation_name: str, arguments: dict):
+        """Runs one service's keys in a single keyring session while holding the lock of every user in it"""
+        def invalidate():
+            if operation_name != 'get_password':
+                for username in usernames:
+                    self._invalidate(service_name, username)
+
+        async with self._hold(*usernames) as hold:
+            # The group shares one timeout budget, self.timeout per key
+            timeout = self.timeout * len(usernames)
+            try:
+                values, errors = await self._call_blocking(hold, functools.partial(
+                    _run_group, backend, service_name, usernames, operation_name, arguments), timeout, invalidate)
+            except asyncio.TimeoutError:
+                values, errors = {}, {username: f"timed out after {timeout}s" for username in usernames}
+            except keyring.errors.KeyringError as e:
+                values, errors = {}, {username: e for username in usernames}
+            finally:
+                invalidate()
+        for username, value in values.items():
+            result.values[(service_name, username)] = True if operation_name != 'get_password' else value
+        for username, error in errors.items():
+            exception_class, message = self._map_error(operation_name, 'error_template', service_name, username)
+            result.errors[(service_name, username)] = exception_class(f"{message}:\n{error}")
+
+    async def _run_batch(self, keys, operation, operation_name: str, arguments=None) -> BatchResult:
+        """
+        Runs operation(service_name, username) for every key.
+        Sync Secret Service backends run each service's keys in one session, see _run_group.
+        Otherwise keys of the same user run in order under that user's lock, different users run concurrently.
+        Args:
+            operation_name: keyring method behind operation
+            arguments: function returning the extra keyring arguments of a key
+        """
+        result = BatchResult()
+        groups = _group_by_service(keys)
+        backend = self._get_backend()
+        if isinstance(backend, SecretService.Keyring):
+            await asyncio.gather(*(
+                self._run_group(result, backend, service_name, usernames, operation_name,
+                                {username: arguments(service_name, username) for username in usernames} if arguments else None)
+                for service_name, usernames in groups.items()))
+            return result
+
+        by_user = {}
+        for service_name, usernames in groups.items():
+            for username in usernames:
+                by_user.setdefault(username, []).append(service_name)
+
+        async def run_user(username, service_names):
+            for service_name in service_names:
+                try:
+                    result.values[(service_name, username)] = await operation(service_name, username)
+                except Exception as e:
+                    result.errors[(service_name, username)] = e
+
+        await asyncio.gather(*(run_user(username, services) for username, services in by_user.items()))
+        return result
+
+    async def get_many(self, keys) -> BatchResult:
+        """Retrieves passwords for (service_name, username) keys"""
+        return await self._run_batch(keys, self.load_login, 'get_password')
+
+    async def set_many(self, credentials: dict) -> BatchResult:
+        """Saves a {(service_name, username): password} mapping"""
+        async def save(service_name, username):
+            await self.save_login(service_name, username, credentials[(service_name, username)])
+            return True
+        return await self._run_batch(credentials, save, 'set_password',
+                                     lambda service_name, username: (credentials[(service_name, username)],))
+
+    async def delete_many(self, keys) -> BatchResult:
+        """Removes passwords for (service_name, username) keys"""
+        async def delete(service_name, username):
+            await self.delete_login(service_name, username)
+            return True
+        return await self._run_batch(keys, delete, 'delete_password')
+
+    def close(self):
+        """Releases the keyring worker threads"""
+        self._executor.shutdown(wait=False)
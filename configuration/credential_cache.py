@@ -0,0 +1,107 @@
+import hashlib
+import hmac
+import keyring
+import os
+import time
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from configuration.config_manager import ConfigManager
+
+# AES-GCM nonce size, random per entry
+NONCE_SIZE = 12
+
+class CredentialCacheError(keyring.errors.KeyringError):
+    """Raised when the cache key can't be derived or a cached entry fails authentication"""
+
+class CredentialCache():
+    """
+    Read-through cache in front of ConfigManager for credentials on hot paths such as RPC auth.
+    Entries are held AES-GCM encrypted under a key derived from the TPM generated HMAC key and
+    a per instance salt, so plaintext credentials only exist in memory while being handed out.
+    Args:
+        config_manager: ConfigManager the credentials are read from
+        ttl: seconds a cached credential stays valid
+        hmac_key_path: TPM generated key file, defaults to the HMAC_KEY_PATH environment variable
+    """
+    def __init__(self, config_manager: ConfigManager = None, ttl: float = 30.0, hmac_key_path: str = None):
+        self.config_manager = config_manager or ConfigManager()
+        # Writes made through the manager directly bypass this wrapper, let them invalidate entries too
+        self.config_manager.register_cache(self, self.config_manager.service_name)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._cipher = AESGCM(self._derive_key(hmac_key_path or os.environ.get("HMAC_KEY_PATH")))
+
+    @staticmethod
+    def _derive_key(hmac_key_path: str) -> bytes:
+        if not hmac_key_path:
+            raise CredentialCacheError("HMAC_KEY_PATH is not set, the credential cache needs the TPM HMAC key")
+        try:
+            with open(hmac_key_path, 'rb') as file:
+                tpm_key = file.read()
+        except OSError as e:
+            raise CredentialCacheError(f"Unable to read the TPM HMAC key:\n{e}")
+        if not tpm_key:
+            raise CredentialCacheError("The TPM HMAC key file is empty")
+        # A fresh salt per instance keeps the derived key out of any other process
+        return hmac.new(tpm_key, b"brunnen-g credential cache" + os.urandom(32), hashlib.sha256).digest()
+
+    def _seal(self, username: str, secret: str) -> tuple:
+        # The username is authenticated too, so an entry cannot be moved to another user
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce, self._cipher.encrypt(nonce, secret.encode(), username.encode())
+
+    def _unseal(self, username: str, nonce: bytes, ciphertext: bytes) -> str:
+        try:
+            return self._cipher.decrypt(nonce, ciphertext, username.encode()).decode()
+        except InvalidTag:
+            raise CredentialCacheError("Cached credential failed authentication")
+
+    def load_emercoin_login(self, username: str):
+        """Retrieves the emercoin login, going to the keyring only on a miss or expired entry"""
+        entry = self._entries.get(username)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return self._unseal(username, *entry[1:])
+        self.misses += 1
+        password = self.config_manager.load_emercoin_login(username)
+        if password is not None:
+            self._entries[username] = (time.monotonic() + self.ttl, *self._seal(username, password))
+        else:
+            self._entries.pop(username, None)
+        return password
+
+    def save_emercoin_login(self, username: str, password: str):
+        try:
+            self.config_manager.save_emercoin_login(username, password)
+        finally:
+            self.invalidate(username)
+
+    def remove_emercoin_password(self, username: str):
+        try:
+            self.config_manager.remove_emercoin_password(username)
+        finally:
+            self.invalidate(username)
+
+    def reset_emercoin_login(self, username: str, password: str):
+        # A failed reset may still have restored or removed the stored password
+        try:
+            self.config_manager.reset_emercoin_login(username, password)
+        finally:
+            self.invalidate(username)
+
+    def invalidate(self, username: str = None):
+        """Drops the cached credential for username, or every credential when no username is given"""
+        if username is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(username, None)
+
+    def get_info(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
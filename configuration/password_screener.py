@@ -2,6 +2,7 @@ import hashlib
 import mmh3
 import numpy as np
 from typing import Set, List
+from metrics.registry import REGISTRY
 
 class BloomFilter():
     """Creates a bloom filter for detecting breached passwords from a list"""
@@ -17,5 +18,6 @@ class PasswordScreener():
     def __init__(self, common_password_file: str, rare_password_file: str = None):
          pass
 
+    @REGISTRY.timed("password_screener_check_seconds", "Time spent screening one password")
     def is_password_compromised(self, password):
         pass
@@ -1,9 +1,77 @@
+import base64
+import itertools
+import json
+import aiohttp
+from metrics.registry import REGISTRY
+
+class EmercoinRpcError(Exception):
+    """Raised when the node is unreachable or answers a call with an error"""
+    def __init__(self, message: str, code: int = None):
+        super().__init__(message)
+        self.code = code
+
+# Returned by name_show when the name does not exist
+NAME_NOT_FOUND = -4
 
 class EmercoinRpcClient():
-    def __init__(self, rpc_url: str, rpc_user: str, rpc_password: str):
+    def __init__(self, rpc_url: str, rpc_user: str, rpc_password: str, timeout: float = 10.0):
         self.user = rpc_user
         self.password = rpc_password
         self.url = rpc_url
+        self.timeout = timeout
+        self._session = None
+        self._ids = itertools.count(1)
 
     def get_info():
-        return False
\ No newline at end of file
+        return False
+
+    async def call(self, method: str, *params):
+        """Makes a JSON-RPC call on the node and returns its result"""
+        if not REGISTRY.enabled:
+            return await self._call(method, params)
+        with REGISTRY.histogram("emercoin_rpc_seconds", "Emercoin JSON-RPC round trip time", method=method).time():
+            try:
+                return await self._call(method, params)
+            except EmercoinRpcError:
+                REGISTRY.counter("emercoin_rpc_errors_total", "Emercoin JSON-RPC calls that failed", method=method).inc()
+                raise
+
+    async def _call(self, method: str, params: tuple):
+        if self._session is None or self._session.closed:
+            credentials = base64.b64encode(f"{self.user}:{self.password}".encode()).decode()
+            self._session = aiohttp.ClientSession(
+                headers={"Authorization": f"Basic {credentials}"},
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        payload = {"jsonrpc": "1.0", "id": next(self._ids), "method": method, "params": list(params)}
+        try:
+            async with self._session.post(self.url, json=payload) as response:
+                body = await response.text()
+        except (aiohttp.ClientError, TimeoutError) as e:
+            raise EmercoinRpcError(f"Emercoin node unreachable during {method}:\n{e}")
+        try:
+            reply = json.loads(body)
+        except ValueError:
+            raise EmercoinRpcError(f"Emercoin node returned HTTP {response.status} for {method}")
+        error = reply.get("error")
+        if error:
+            raise EmercoinRpcError(error.get("message", str(error)), error.get("code"))
+        return reply.get("result")
+
+    async def name_show(self, name: str) -> dict:
+        """Current NVS record for name, None when the name does not exist"""
+        try:
+            return await self.call("name_show", name)
+        except EmercoinRpcError as e:
+            if e.code == NAME_NOT_FOUND:
+                return None
+            raise
+
+    async def name_update(self, name: str, value: str, days: int = 365) -> str:
+        """Updates the NVS record of name, a paid transaction, returns its txid"""
+        return await self.call("name_update", name, value, days)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,115 @@
+"""
+HTTP lookup API for user@domain.coin identities.
+Run from the repository root: python -m identity.api --db <hash>.tmp --port 8080
+"""
+import argparse
+import asyncio
+from aiohttp import web
+from emercoin.rpc_client import EmercoinRpcError
+from identity.resolver import EmercoinResolver
+from identity.store import IdentityStore
+from metrics.exporter import metrics_handler
+from metrics.registry import REGISTRY
+
+MAX_BATCH = 1000
+# Shared caches may keep responses but must revalidate them with the ETag
+CACHE_CONTROL = "public, no-cache"
+
+class IdentityApi():
+    """
+    aiohttp handlers over an IdentityStore. Every response carries an ETag derived from the
+    db_root root and the address_keys root, GET requests whose If-None-Match still matches
+    get a 304 without a body. Proofs lead to the address_keys root, db_root_proof leads from it
+    to the published db_root and is null while local writes are not yet published. Addresses
+    missing locally are looked up on Emercoin so clients learn where the domain publishes its database.
+    Args:
+        store: identity store backing the lookups
+        resolver: optional Emercoin resolver for addresses not in the local store
+    """
+    def __init__(self, store: IdentityStore, resolver: EmercoinResolver = None):
+        self.store = store
+        self.resolver = resolver
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v1/identity/{address}", self.get_identity)
+        app.router.add_post("/v1/identities:lookup", self.lookup_identities)
+        app.router.add_get("/metrics", metrics_handler())
+        return app
+
+    async def _refresh(self):
+        # Only PRAGMA data_version runs when nothing changed, a reload goes to a worker thread
+        await asyncio.get_running_loop().run_in_executor(None, self.store.refresh)
+
+    def _not_modified(self, request: web.Request, etag: str) -> bool:
+        # If-None-Match is a comma separated list of tags, weak ones match by their opaque part
+        tags = [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]
+        return any(tag == "*" or tag.removeprefix("W/") == etag for tag in tags)
+
+    def _headers(self, etag: str) -> dict:
+        return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    async def _published(self, address: str) -> dict:
+        if self.resolver is None or "@" not in address:
+            return None
+        try:
+            return await self.resolver.resolve(address.rsplit("@", 1)[1])
+        except EmercoinRpcError as e:
+            print(f"Emercoin lookup for {address} failed:\n{e}")
+            return None
+
+    async def get_identity(self, request: web.Request) -> web.Response:
+        await self._refresh()
+        address = request.match_info["address"]
+        results, roots, etag = self.store.lookup_many([address])
+        headers = self._headers(etag)
+        if self._not_modified(request, etag):
+            return web.Response(status=304, headers=headers)
+        result = results[address]
+        if result is None:
+            body = {"error": "identity not found", "address": address}
+            published = await self._published(address)
+            if published is not None:
+                body["published"] = published
+            return web.json_response(body, status=404, headers=headers)
+        result.update(roots)
+        return web.json_response(result, headers=headers)
+
+    async def lookup_identities(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+            addresses = body["addresses"]
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text='expected {"addresses": [...]}')
+        if not isinstance(addresses, list) or not all(isinstance(address, str) for address in addresses):
+            raise web.HTTPBadRequest(text="addresses must be a list of strings")
+        if len(addresses) > MAX_BATCH:
+            raise web.HTTPRequestEntityTooLarge(max_size=MAX_BATCH, actual_size=len(addresses))
+        await self._refresh()
+        results, roots, etag = self.store.lookup_many(addresses)
+        return web.json_response({**roots, "results": results}, headers=self._headers(etag))
+
+def main():
+    from configuration.config_manager import ConfigManager
+    from emercoin.rpc_client import EmercoinRpcClient
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="identity database created by brunnen-cli.sh")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rpc-url", help="Emercoin JSON-RPC url, lookups stay local without it")
+    parser.add_argument("--rpc-user", default="emercoin")
+    parser.add_argument("--metrics", action="store_true", help="record metrics served on /metrics")
+    args = parser.parse_args()
+
+    if args.metrics:
+        REGISTRY.enable()
+
+    resolver = None
+    if args.rpc_url:
+        password = ConfigManager().load_emercoin_login(args.rpc_user)
+        resolver = EmercoinResolver(EmercoinRpcClient(args.rpc_url, args.rpc_user, password))
+    web.run_app(IdentityApi(IdentityStore(args.db), resolver).create_app(), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import json
+import aiohttp
+
+DEFAULT_API_URL = "http://127.0.0.1:5001"
+
+class IpfsError(Exception):
+    """Raised when the IPFS daemon is unreachable or rejects a request"""
+
+class IpfsClient():
+    """
+    Minimal async client of the IPFS (kubo) HTTP RPC API, enough to publish identity databases
+    and snapshots and read them back. Every RPC endpoint of the daemon only accepts POST.
+    Args:
+        api_url: base url of the daemon RPC API
+        timeout: seconds allowed for a single request
+    """
+    def __init__(self, api_url: str = DEFAULT_API_URL, timeout: float = 60.0):
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def _post(self, endpoint: str, params: dict, data=None) -> bytes:
+        try:
+            async with self._get_session().post(f"{self.api_url}/api/v0/{endpoint}", params=params, data=data) as response:
+                body = await response.read()
+        except (aiohttp.ClientError, TimeoutError) as e:
+            raise IpfsError(f"IPFS daemon unreachable during {endpoint}:\n{e}")
+        if response.status != 200:
+            raise IpfsError(f"IPFS {endpoint} failed with HTTP {response.status}: {body.decode(errors='replace')}")
+        return body
+
+    async def add(self, data: bytes, filename: str = "data", pin: bool = True) -> str:
+        """Adds data to the node and returns its CID"""
+        form = aiohttp.FormData()
+        form.add_field("file", data, filename=filename, content_type="application/octet-stream")
+        body = await self._post("add", {"pin": str(pin).lower(), "quiet": "true"}, form)
+        try:
+            # add streams one JSON object per line, the last one is the added file
+            return json.loads(body.decode().strip().splitlines()[-1])["Hash"]
+        except (ValueError, KeyError, IndexError):
+            raise IpfsError(f"Unexpected IPFS add response: {body[:200]!r}")
+
+    async def add_file(self, path: str, pin: bool = True) -> str:
+        with open(path, "rb") as file:
+            data = file.read()
+        return await self.add(data, filename=path.rsplit("/", 1)[-1], pin=pin)
+
+    async def cat(self, cid: str) -> bytes:
+        return await self._post("cat", {"arg": cid})
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,88 @@
+import hashlib
+
+# Python port of calculate_row_hash/build_table_merkle in cli/brunnen-cli.sh, hashes are hex strings
+# and parents are the sha256 of the concatenated child hex, so roots match the ones the CLI stores
+
+def row_hash(*fields) -> str:
+    """Hashes a row the way the CLI does, NULL columns become empty strings and booleans 1/0"""
+    values = []
+    for field in fields:
+        if field is None:
+            values.append("")
+        elif isinstance(field, bool):
+            values.append(str(int(field)))
+        else:
+            values.append(str(field))
+    return hashlib.sha256("|".join(values).encode()).hexdigest()
+
+def address_keys_row_hash(address: str, pubkey: str, tpm_key: str = None, tpm_key_hash: str = None,
+                          tpm_enable: bool = False) -> str:
+    return row_hash(address, pubkey, tpm_key, tpm_key_hash, tpm_enable)
+
+def db_root_row_hash(table_name: str, root: str) -> str:
+    """Hash of a table's row in db_root, the CLI hashes table_name || '|' || hex(root), the hex of the root's text"""
+    return row_hash(table_name, root.encode().hex().upper())
+
+def combine(left: str, right: str) -> str:
+    return hashlib.sha256((left + right).encode()).hexdigest()
+
+def merkle_root(hashes: list) -> str:
+    """Root over row hashes in id order, an odd level repeats its last hash; None for an empty table"""
+    level = list(hashes)
+    if not level:
+        return None
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [combine(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+    return level[0]
+
+def merkle_levels(hashes: list) -> list:
+    """Every level of the tree from the leaves up, odd levels padded with their last hash"""
+    levels = [list(hashes)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        if len(level) % 2:
+            level.append(level[-1])
+        levels.append([combine(level[i], level[i + 1]) for i in range(0, len(level), 2)])
+    return levels
+
+def merkle_update(levels: list, hashes: list) -> list:
+    """merkle_levels(hashes) built from the levels of an earlier tree, only the nodes above changed,
+    added or removed leaves are hashed again"""
+    if not hashes or not levels[0]:
+        return merkle_levels(hashes)
+    level = list(hashes)
+    previous = levels[0]
+    changed = {index for index, (new, old) in enumerate(zip(level, previous)) if new != old}
+    changed.update(range(len(previous), len(level)))
+    updated = [level]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+            changed.add(len(level) - 1)
+        previous = levels[len(updated)] if len(updated) < len(levels) else []
+        size = len(level) // 2
+        parents = {index // 2 for index in changed} | set(range(len(previous), size))
+        parent_level = previous[:size] + [None] * (size - len(previous))
+        for index in parents:
+            parent_level[index] = combine(level[2 * index], level[2 * index + 1])
+        changed = parents
+        level = parent_level
+        updated.append(level)
+    return updated
+
+def merkle_proof(levels: list, index: int) -> list:
+    """Sibling hashes from leaf index up to the root, each tagged with the side it is combined on"""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        proof.append({"hash": level[sibling], "position": "left" if sibling < index else "right"})
+        index //= 2
+    return proof
+
+def verify_proof(leaf: str, proof: list, root: str) -> bool:
+    current = leaf
+    for step in proof:
+        current = combine(step["hash"], current) if step["position"] == "left" else combine(current, step["hash"])
+    return current == root
@@ -0,0 +1,351 @@
+"""
+Debounced publishing of the identity database: root recompute, IPFS upload and name_update.
+Run from the repository root next to the process writing the database:
+python -m identity.publisher --db <hash>.tmp --domain example.coin --rpc-url http://127.0.0.1:6662/wallet/main
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from emercoin.rpc_client import EmercoinRpcClient, EmercoinRpcError
+from identity.ipfs import IpfsClient, IpfsError
+from identity.merkle import address_keys_row_hash, db_root_row_hash, merkle_root, row_hash
+from identity.snapshot import export_snapshot
+from metrics.registry import REGISTRY
+
+# Days a name_update keeps the record alive, the value publish_to_emercoin in brunnen-cli.sh uses
+NAME_DAYS = 365
+# Failures a stage is retried on, anything else fails the publish without retrying
+RETRYABLE_ERRORS = (EmercoinRpcError, IpfsError, sqlite3.Error, OSError)
+
+class PublishError(Exception):
+    """Raised when a publish stage still fails after every retry"""
+
+def _table_root(hashes: list) -> str:
+    # build_table_merkle stores an empty root for an empty table
+    return merkle_root(hashes) or ""
+
+def update_merkle_roots(db_path: str) -> str:
+    """
+    Port of update_all_merkle_roots in brunnen-cli.sh in a single transaction: refreshes the
+    row hashes that changed, rewrites db_root with the table roots and returns the final root.
+    Nothing is written when the stored hashes and roots are current, a write would bump
+    PRAGMA data_version and look like a new change to _watch.
+    """
+    connection = sqlite3.connect(db_path)
+    try:
+        with connection:
+            address_hashes, address_changed = [], []
+            for row_id, address, pubkey, tpm_key, tpm_key_hash, tpm_enable, stored in connection.execute(
+                    "SELECT id, address, pubkey, TPM_key, TPM_key_hash, TPM_enable, row_hash FROM address_keys ORDER BY id"):
+                current = address_keys_row_hash(address, pubkey, tpm_key, tpm_key_hash, tpm_enable)
+                address_hashes.append(current)
+                if stored != current:
+                    address_changed.append((current, row_id))
+
+            domain_hashes, domain_changed = [], []
+            for row_id, domain, tpm_enable, stored in connection.execute(
+                    "SELECT id, domain, TPM_enable, row_hash FROM tpm_domain_settings ORDER BY id"):
+                current = row_hash(domain, tpm_enable)
+                domain_hashes.append(current)
+                if stored != current:
+                    domain_changed.append((current, row_id))
+
+            rows = []
+            for table, hashes in (("address_keys", address_hashes), ("tpm_domain_settings", domain_hashes)):
+                root = _table_root(hashes)
+                rows.append((table, root, db_root_row_hash(table, root)))
+            final_root = _table_root([row[2] for row in rows])
+            rows.append(("db_root", final_root, None))
+
+            stored_rows = connection.execute("SELECT table_name, root, row_hash FROM db_root ORDER BY id").fetchall()
+            if address_changed or domain_changed or stored_rows != rows:
+                connection.executemany("UPDATE address_keys SET row_hash = ? WHERE id = ?", address_changed)
+                connection.executemany("UPDATE tpm_domain_settings SET row_hash = ? WHERE id = ?", domain_changed)
+                connection.execute("DELETE FROM db_root")
+                connection.executemany("INSERT INTO db_root (table_name, root, row_hash) VALUES (?, ?, ?)", rows)
+        return final_root
+    finally:
+        connection.close()
+
+def _copy_database(db_path: str, path: str):
+    # The backup API gives a consistent copy while the CLI keeps writing
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+class PublishScheduler():
+    """
+    Accumulates changes to the identity database and publishes them in one go once window
+    seconds passed since the first unpublished change, or as soon as max_changes piled up.
+    A publish recomputes the Merkle roots, uploads the database or a snapshot of it to IPFS
+    and points the dns: NVS record of the domain at {"cid", "merkle_root"}, plus "snapshot_root"
+    when a snapshot is uploaded. Publishes run one
+    at a time in a single worker, changes made meanwhile go into the next one, and a root
+    that is already published is not uploaded or paid for again. Each stage is retried with
+    exponential backoff, so a locked wallet only repeats the name_update.
+    Args:
+        db_path: identity database written by brunnen-cli.sh
+        domain: domain whose dns: record is updated
+        ipfs: client of the IPFS daemon
+        rpc: client of the Emercoin wallet owning the domain
+        window: seconds between the first unpublished change and its publish
+        max_changes: unpublished changes that trigger a publish before the window ends
+        snapshot: upload a snapshot file instead of a copy of the SQLite database
+        retry_delay: seconds before the first retry of a failed stage, doubled on each retry
+        max_retry_delay: upper bound of the delay between retries
+        max_attempts: attempts per stage before the publish is given up until the next window
+        days: days the updated name stays registered
+    """
+    def __init__(self, db_path: str, domain: str, ipfs: IpfsClient, rpc: EmercoinRpcClient,
+                 window: float = 300.0, max_changes: int = 1000, snapshot: bool = False,
+                 retry_delay: float = 5.0, max_retry_delay: float = 300.0, max_attempts: int = 5,
+                 days: int = NAME_DAYS):
+        if window < 0 or max_changes < 1 or max_attempts < 1:
+            raise ValueError("window must not be negative, max_changes and max_attempts must be positive")
+        self.db_path = db_path
+        self.name = f"dns:{domain}"
+        self.ipfs = ipfs
+        self.rpc = rpc
+        self.window = window
+        self.max_changes = max_changes
+        self.snapshot = snapshot
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.days = days
+        self.published = None
+        self.pending = 0
+        self.stats = {"changes": 0, "publishes": 0, "skipped": 0, "failures": 0, "retries": 0,
+                      "changes_published": 0, "last_publish": None}
+        self._due = asyncio.Event()
+        self._timer = None
+        self._waiters = []
+        self._worker = None
+
+    async def start(self):
+        """Starts the worker and reads the currently published record so unchanged roots are skipped"""
+        if self._worker is not None:
+            return
+        try:
+            record = await self.rpc.name_show(self.name)
+            value = json.loads(record["value"]) if record else None
+            if isinstance(value, dict) and "merkle_root" in value:
+                self.published = value
+        except (EmercoinRpcError, ValueError) as e:
+            print(f"Could not read the published record of {self.name}:\n{e}")
+        self._worker = asyncio.ensure_future(self._run())
+        if self.pending:
+            # Changes recorded before start are published like any others
+            self._schedule()
+
+    async def stop(self, flush: bool = True):
+        """Stops the worker, publishing pending changes first unless flush is False"""
+        if self._worker is None:
+            return
+        if flush and self.pending:
+            try:
+                await self.flush()
+            except PublishError as e:
+                print(f"Final publish of {self.name} failed:\n{e}")
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Publish worker of {self.name} had stopped:\n{e!r}")
+        self._worker = None
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.cancel()
+        self._waiters = []
+
+    def notify(self, changes: int = 1):
+        """Records changes written to the database, call it after every committed write"""
+        self.pending += changes
+        self.stats["changes"] += changes
+        if self._worker is not None:
+            self._schedule()
+
+    def _schedule(self):
+        if self.pending >= self.max_changes:
+            self._due.set()
+        else:
+            self._arm()
+
+    def _arm(self):
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._due.set)
+
+    async def flush(self) -> dict:
+        """Publishes now, or right after the running publish, and returns the published value"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._due.set()
+        return await waiter
+
+    async def _run(self):
+        while True:
+            await self._due.wait()
+            self._due.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            changes, self.pending = self.pending, 0
+            waiters, self._waiters = self._waiters, []
+            try:
+                result = await self._publish()
+            except Exception as e:
+                if isinstance(e, PublishError):
+                    print(f"Publishing {self.name} failed, retrying in the next window:\n{e}")
+                else:
+                    print(f"Publishing {self.name} failed unexpectedly, retrying in the next window:\n{e!r}")
+                self.stats["failures"] += 1
+                REGISTRY.counter("publish_failures_total", "Publishes given up after every retry").inc()
+                if changes:
+                    self.pending += changes
+                    self._arm()
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            self.stats["changes_published"] += changes
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(result)
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    async def _retry(self, stage: str, attempt):
+        delay = self.retry_delay
+        for number in range(1, self.max_attempts + 1):
+            try:
+                with REGISTRY.histogram("publish_stage_seconds", "Duration of one publish stage", stage=stage).time():
+                    return await attempt()
+            except RETRYABLE_ERRORS as e:
+                if number == self.max_attempts:
+                    raise PublishError(f"{stage} failed after {number} attempts: {e}") from e
+                print(f"{stage} of {self.name} failed, attempt {number} of {self.max_attempts}:\n{e}")
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    async def _upload(self) -> tuple:
+        # Returns the CID and the snapshot root, None when the SQLite file is uploaded
+        loop = asyncio.get_running_loop()
+        directory = os.path.dirname(os.path.abspath(self.db_path))
+        descriptor, path = tempfile.mkstemp(prefix=".publish-", dir=directory)
+        os.close(descriptor)
+        try:
+            snapshot_root = None
+            if self.snapshot:
+                summary = await loop.run_in_executor(None, export_snapshot, self.db_path, path)
+                snapshot_root = summary["root"]
+            else:
+                await loop.run_in_executor(None, _copy_database, self.db_path, path)
+            return await self.ipfs.add_file(path), snapshot_root
+        finally:
+            os.remove(path)
+
+    def _name_updater(self, encoded: str):
+        # A failed name_update may still have been broadcast, e.g. when the reply timed out,
+        # so a retry first checks the record and does not pay for the same update twice
+        sent = False
+
+        async def update():
+            nonlocal sent
+            if sent:
+                record = await self.rpc.name_show(self.name)
+                if record is not None and record.get("value") == encoded:
+                    return None
+            sent = True
+            return await self.rpc.name_update(self.name, encoded, self.days)
+        return update
+
+    async def _publish(self) -> dict:
+        loop = asyncio.get_running_loop()
+        root = await self._retry("recompute", lambda: loop.run_in_executor(None, update_merkle_roots, self.db_path))
+        if self.published is not None and self.published.get("merkle_root") == root:
+            self.stats["skipped"] += 1
+            return self.published
+        cid, snapshot_root = await self._retry("upload", self._upload)
+        value = {"cid": cid, "merkle_root": root}
+        if snapshot_root is not None:
+            # Snapshot proofs verify against their own root, not the CLI's db_root
+            value["snapshot_root"] = snapshot_root
+        # Same compact JSON publish_to_emercoin writes
+        encoded = json.dumps(value, separators=(",", ":"))
+        await self._retry("name_update", self._name_updater(encoded))
+        self.published = value
+        self.stats["publishes"] += 1
+        self.stats["last_publish"] = time.time()
+        REGISTRY.counter("publishes_total", "name_update transactions sent for the identity database").inc()
+        return value
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "pending": self.pending, "published": self.published}
+
+async def _watch(scheduler: PublishScheduler, db_path: str, interval: float):
+    # Another process writes the database, PRAGMA data_version tells when it committed
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        version = connection.execute("PRAGMA data_version").fetchone()[0]
+        while scheduler.running:
+            await asyncio.sleep(interval)
+            current = connection.execute("PRAGMA data_version").fetchone()[0]
+            if current != version:
+                version = current
+                scheduler.notify()
+        print(f"Publish worker of {scheduler.name} stopped, no longer watching {db_path}")
+    finally:
+        connection.close()
+
+async def _serve(args, password: str):
+    rpc = EmercoinRpcClient(args.rpc_url, args.rpc_user, password)
+    ipfs = IpfsClient(args.ipfs_url)
+    scheduler = PublishScheduler(args.db, args.domain, ipfs, rpc, window=args.window,
+                                 max_changes=args.max_changes, snapshot=args.snapshot)
+    await scheduler.start()
+    try:
+        await _watch(scheduler, args.db, args.poll_interval)
+    finally:
+        await scheduler.stop()
+        await ipfs.close()
+        await rpc.close()
+
+def main():
+    from configuration.config_manager import ConfigManager
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="identity database created by brunnen-cli.sh")
+    parser.add_argument("--domain", required=True, help="domain whose dns: record points at the database")
+    parser.add_argument("--rpc-url", required=True, help="Emercoin JSON-RPC url of the wallet owning the domain")
+    parser.add_argument("--rpc-user", default="emercoin")
+    parser.add_argument("--ipfs-url", default="http://127.0.0.1:5001")
+    parser.add_argument("--window", type=float, default=300.0, help="seconds changes are collected per publish")
+    parser.add_argument("--max-changes", type=int, default=1000, help="changes that publish before the window ends")
+    parser.add_argument("--snapshot", action="store_true", help="upload a snapshot instead of the SQLite file")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between database change checks")
+    args = parser.parse_args()
+
+    password = ConfigManager().load_emercoin_login(args.rpc_user)
+    try:
+        asyncio.run(_serve(args, password))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
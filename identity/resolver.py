@@ -0,0 +1,43 @@
+import asyncio
+import json
+import time
+from emercoin.rpc_client import EmercoinRpcClient
+
+class EmercoinResolver():
+    """
+    Resolves the published {"cid", "merkle_root"} of a domain from its dns: NVS record, the value
+    publish_to_emercoin in brunnen-cli.sh writes. Answers, including misses, are cached for ttl
+    seconds and concurrent lookups of the same domain share one name_show call.
+    Args:
+        client: RPC client of the local Emercoin node
+        ttl: seconds a resolved record is reused
+    """
+    def __init__(self, client: EmercoinRpcClient, ttl: float = 60.0):
+        self.client = client
+        self.ttl = ttl
+        self._cache = {}
+        self._pending = {}
+
+    async def resolve(self, domain: str) -> dict:
+        entry = self._cache.get(domain)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        pending = self._pending.get(domain)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch(domain))
+            self._pending[domain] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(domain, None))
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, domain: str) -> dict:
+        record = await self.client.name_show(f"dns:{domain}")
+        published = None
+        if record is not None:
+            try:
+                published = json.loads(record.get("value", ""))
+            except ValueError:
+                published = {"value": record.get("value")}
+            if not isinstance(published, dict):
+                published = {"value": published}
+        self._cache[domain] = (time.monotonic() + self.ttl, published)
+        return published
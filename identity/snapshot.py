@@ -0,0 +1,340 @@
+"""
+Read-only snapshot of the identity database, the unit that is published to and fetched from IPFS.
+
+Layout, all integers big-endian:
+    header   MAGIC, VERSION
+    blocks   zlib compressed runs of records, sorted by the sha256 of their key
+    indexes  per table one entry per block: first key, offset, compressed length, record count
+    sections per table: table id, index offset, block count, record count, Merkle root
+    footer   sections offset, section count, snapshot root, MAGIC
+
+Row hashes are the ones brunnen-cli.sh computes, but the table roots are built over the rows in
+key order rather than id order so the snapshot of a given set of identities is always the same.
+Export/lookup from the repository root:
+    python -m identity.snapshot export <hash>.tmp identities.snap
+    python -m identity.snapshot get identities.snap user@domain.coin
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import mmap
+import sqlite3
+import struct
+import zlib
+from collections import OrderedDict
+from identity.merkle import address_keys_row_hash, combine, merkle_root, row_hash
+
+MAGIC = b"BGSNAP"
+VERSION = 1
+HEADER = struct.Struct(">6sB")
+INDEX_ENTRY = struct.Struct(">32sQII")
+SECTION = struct.Struct(">BQII32s")
+FOOTER = struct.Struct(">QB32s6s")
+ADDRESS_RECORD = struct.Struct(">32sHHHHB")
+DOMAIN_RECORD = struct.Struct(">32sHB")
+ADDRESS_KEYS = 1
+TPM_DOMAIN_SETTINGS = 2
+EMPTY_ROOT = bytes(32)
+DEFAULT_BLOCK_SIZE = 4096
+
+class SnapshotError(ValueError):
+    """Raised for files that are not snapshots, are truncated or fail verification"""
+
+def record_key(value: str) -> bytes:
+    return hashlib.sha256(value.encode()).digest()
+
+def _encode_address(address: str, pubkey: str, tpm_key: str, tpm_key_hash: str, tpm_enable) -> bytes:
+    fields = [(value or "").encode() for value in (address, pubkey, tpm_key, tpm_key_hash)]
+    return ADDRESS_RECORD.pack(record_key(address), *(len(field) for field in fields), bool(tpm_enable)) + b"".join(fields)
+
+def _decode_address(block: bytes, offset: int) -> tuple:
+    """Returns (record, next offset)"""
+    _, *lengths, tpm_enable = ADDRESS_RECORD.unpack_from(block, offset)
+    offset += ADDRESS_RECORD.size
+    values = []
+    for length in lengths:
+        values.append(block[offset:offset + length].decode())
+        offset += length
+    address, pubkey, tpm_key, tpm_key_hash = values
+    record = {
+        "address": address,
+        "pubkey": pubkey,
+        "tpm_key": tpm_key or None,
+        "tpm_key_hash": tpm_key_hash or None,
+        "tpm_enable": bool(tpm_enable),
+    }
+    return record, offset
+
+def _encode_domain(domain: str, tpm_enable) -> bytes:
+    encoded = domain.encode()
+    return DOMAIN_RECORD.pack(record_key(domain), len(encoded), bool(tpm_enable)) + encoded
+
+def _decode_domain(block: bytes, offset: int) -> tuple:
+    _, length, tpm_enable = DOMAIN_RECORD.unpack_from(block, offset)
+    offset += DOMAIN_RECORD.size
+    domain = block[offset:offset + length].decode()
+    return {"domain": domain, "tpm_enable": bool(tpm_enable)}, offset + length
+
+ADDRESS_LENGTHS = struct.Struct(">HHHH")
+DOMAIN_LENGTH = struct.Struct(">H")
+
+def _address_size(block: bytes, offset: int) -> int:
+    return ADDRESS_RECORD.size + sum(ADDRESS_LENGTHS.unpack_from(block, offset + 32))
+
+def _domain_size(block: bytes, offset: int) -> int:
+    return DOMAIN_RECORD.size + DOMAIN_LENGTH.unpack_from(block, offset + 32)[0]
+
+DECODERS = {ADDRESS_KEYS: _decode_address, TPM_DOMAIN_SETTINGS: _decode_domain}
+SIZERS = {ADDRESS_KEYS: _address_size, TPM_DOMAIN_SETTINGS: _domain_size}
+
+def _row_hash(table: int, record: dict) -> str:
+    if table == ADDRESS_KEYS:
+        return address_keys_row_hash(record["address"], record["pubkey"], record["tpm_key"],
+                                     record["tpm_key_hash"], record["tpm_enable"])
+    return row_hash(record["domain"], record["tpm_enable"])
+
+def _root_bytes(hashes: list) -> bytes:
+    root = merkle_root(hashes)
+    return bytes.fromhex(root) if root else EMPTY_ROOT
+
+def snapshot_root(address_root: bytes, domain_root: bytes) -> bytes:
+    return bytes.fromhex(combine(address_root.hex(), domain_root.hex()))
+
+def write_snapshot(path: str, addresses: list, domains: list, block_size: int = DEFAULT_BLOCK_SIZE,
+                   level: int = 6) -> dict:
+    """
+    Writes a snapshot file.
+    Args:
+        path: file to write
+        addresses: (address, pubkey, TPM_key, TPM_key_hash, TPM_enable) rows, first one wins per address
+        domains: (domain, TPM_enable) rows, first one wins per domain
+        block_size: uncompressed bytes per block, smaller blocks make single lookups cheaper
+        level: zlib compression level
+    """
+    tables = {ADDRESS_KEYS: {}, TPM_DOMAIN_SETTINGS: {}}
+    for row in addresses:
+        key = record_key(row[0])
+        if key not in tables[ADDRESS_KEYS]:
+            tables[ADDRESS_KEYS][key] = (_encode_address(*row), address_keys_row_hash(*row[:4], bool(row[4])))
+    for row in domains:
+        key = record_key(row[0])
+        if key not in tables[TPM_DOMAIN_SETTINGS]:
+            tables[TPM_DOMAIN_SETTINGS][key] = (_encode_domain(*row), row_hash(row[0], bool(row[1])))
+
+    sections = []
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION))
+        indexes = {}
+        for table, records in tables.items():
+            entries = []
+            keys = sorted(records)
+            start = 0
+            while start < len(keys):
+                end, size = start, 0
+                while end < len(keys) and (size < block_size or end == start):
+                    size += len(records[keys[end]][0])
+                    end += 1
+                data = zlib.compress(b"".join(records[key][0] for key in keys[start:end]), level)
+                entries.append(INDEX_ENTRY.pack(keys[start], file.tell(), len(data), end - start))
+                file.write(data)
+                start = end
+            indexes[table] = (entries, _root_bytes([records[key][1] for key in keys]), len(keys))
+        for table, (entries, root, count) in indexes.items():
+            sections.append(SECTION.pack(table, file.tell(), len(entries), count, root))
+            file.write(b"".join(entries))
+        sections_offset = file.tell()
+        file.write(b"".join(sections))
+        root = snapshot_root(indexes[ADDRESS_KEYS][1], indexes[TPM_DOMAIN_SETTINGS][1])
+        file.write(FOOTER.pack(sections_offset, len(sections), root, MAGIC))
+        size = file.tell()
+    return {
+        "root": root.hex(),
+        "address_keys": indexes[ADDRESS_KEYS][2],
+        "tpm_domain_settings": indexes[TPM_DOMAIN_SETTINGS][2],
+        "bytes": size,
+    }
+
+def export_snapshot(db_path: str, path: str, **kwargs) -> dict:
+    """Exports address_keys and tpm_domain_settings of the SQLite identity database"""
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        addresses = connection.execute(
+            "SELECT address, pubkey, TPM_key, TPM_key_hash, TPM_enable FROM address_keys ORDER BY id").fetchall()
+        try:
+            domains = connection.execute("SELECT domain, TPM_enable FROM tpm_domain_settings ORDER BY id").fetchall()
+        except sqlite3.OperationalError:
+            domains = []
+    finally:
+        connection.close()
+    return write_snapshot(path, addresses, domains, **kwargs)
+
+class _Section():
+    __slots__ = ("table", "first_keys", "entries", "count", "root")
+
+    def __init__(self, table: int, entries: list, count: int, root: bytes):
+        self.table = table
+        self.entries = entries
+        self.first_keys = [entry[0] for entry in entries]
+        self.count = count
+        self.root = root
+
+class SnapshotReader():
+    """
+    Looks records up in a snapshot through mmap, only the footer and the sparse indexes are read
+    up front. A lookup binary searches the index, inflates one block and binary searches it,
+    recently used blocks are kept decoded.
+    Args:
+        path: snapshot file
+        cache_blocks: decoded blocks kept in memory
+    """
+    def __init__(self, path: str, cache_blocks: int = 64):
+        self.path = path
+        self.cache_blocks = cache_blocks
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SnapshotError(f"{path} is empty")
+        self._blocks = OrderedDict()
+        try:
+            self._sections, self.root = self._read_layout()
+        except (struct.error, SnapshotError):
+            self.close()
+            raise
+
+    def _read_layout(self) -> tuple:
+        if len(self._map) < HEADER.size + FOOTER.size:
+            raise SnapshotError("File is too short to be a snapshot")
+        magic, version = HEADER.unpack_from(self._map, 0)
+        sections_offset, section_count, root, end_magic = FOOTER.unpack_from(self._map, len(self._map) - FOOTER.size)
+        if magic != MAGIC or end_magic != MAGIC:
+            raise SnapshotError("Not a snapshot or truncated")
+        if version > VERSION:
+            raise SnapshotError(f"Snapshot version {version} is newer than the supported version {VERSION}")
+        if sections_offset + section_count * SECTION.size != len(self._map) - FOOTER.size:
+            raise SnapshotError("Snapshot section table is corrupt")
+        sections = {}
+        for number in range(section_count):
+            table, index_offset, block_count, count, table_root = SECTION.unpack_from(
+                self._map, sections_offset + number * SECTION.size)
+            if index_offset + block_count * INDEX_ENTRY.size > sections_offset:
+                raise SnapshotError("Snapshot index is corrupt")
+            entries = [INDEX_ENTRY.unpack_from(self._map, index_offset + i * INDEX_ENTRY.size) for i in range(block_count)]
+            sections[table] = _Section(table, entries, count, table_root)
+        return sections, root
+
+    def close(self):
+        self._blocks.clear()
+        if not self._map.closed:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _block(self, section: _Section, number: int) -> tuple:
+        """Inflated block as (keys, offsets, data), cached. Records are decoded only when returned."""
+        cache_key = (section.table, number)
+        cached = self._blocks.get(cache_key)
+        if cached is not None:
+            self._blocks.move_to_end(cache_key)
+            return cached
+        _, offset, length, count = section.entries[number]
+        try:
+            data = zlib.decompress(self._map[offset:offset + length])
+        except zlib.error as e:
+            raise SnapshotError(f"Block {number} is corrupt: {e}")
+        size = SIZERS[section.table]
+        keys, offsets, position = [], [], 0
+        try:
+            for _ in range(count):
+                keys.append(data[position:position + 32])
+                offsets.append(position)
+                position += size(data, position)
+        except struct.error:
+            raise SnapshotError(f"Block {number} is corrupt")
+        cached = (keys, offsets, data)
+        self._blocks[cache_key] = cached
+        if len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return cached
+
+    def _get(self, table: int, value: str) -> dict:
+        section = self._sections.get(table)
+        if section is None or not section.entries:
+            return None
+        key = record_key(value)
+        number = bisect.bisect_right(section.first_keys, key) - 1
+        if number < 0:
+            return None
+        keys, offsets, data = self._block(section, number)
+        position = bisect.bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            return DECODERS[table](data, offsets[position])[0]
+        return None
+
+    def get(self, address: str) -> dict:
+        """address_keys record for user@domain.coin, None if the snapshot does not contain it"""
+        return self._get(ADDRESS_KEYS, address)
+
+    def get_domain(self, domain: str) -> dict:
+        return self._get(TPM_DOMAIN_SETTINGS, domain)
+
+    def records(self, table: int = ADDRESS_KEYS):
+        """Every record of a table in key order"""
+        section = self._sections.get(table)
+        if section is None:
+            return
+        decode = DECODERS[table]
+        for number in range(len(section.entries)):
+            _, offsets, data = self._block(section, number)
+            for offset in offsets:
+                yield decode(data, offset)[0]
+
+    def __len__(self) -> int:
+        section = self._sections.get(ADDRESS_KEYS)
+        return section.count if section else 0
+
+    def verify(self) -> bool:
+        """Recomputes the table roots from every record and checks them against the footer"""
+        roots = {}
+        for table, section in self._sections.items():
+            roots[table] = _root_bytes([_row_hash(table, record) for record in self.records(table)])
+            if roots[table] != section.root:
+                return False
+        return snapshot_root(roots.get(ADDRESS_KEYS, EMPTY_ROOT), roots.get(TPM_DOMAIN_SETTINGS, EMPTY_ROOT)) == self.root
+
+    def get_info(self) -> dict:
+        return {
+            "root": self.root.hex(),
+            "tables": {table: {"records": section.count, "blocks": len(section.entries), "root": section.root.hex()}
+                       for table, section in self._sections.items()},
+            "cached_blocks": len(self._blocks),
+            "bytes": len(self._map),
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write a snapshot of an identity database")
+    export.add_argument("db")
+    export.add_argument("snapshot")
+    export.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    get = commands.add_parser("get", help="look an address up in a snapshot")
+    get.add_argument("snapshot")
+    get.add_argument("address")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(json.dumps(export_snapshot(args.db, args.snapshot, block_size=args.block_size), indent=2))
+        return
+    with SnapshotReader(args.snapshot) as reader:
+        print(json.dumps(reader.get(args.address), indent=2))
+
+if __name__ == "__main__":
+    main()
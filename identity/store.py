@@ -0,0 +1,138 @@
+import hashlib
+import sqlite3
+import threading
+from identity.merkle import address_keys_row_hash, db_root_row_hash, merkle_levels, merkle_proof, merkle_update
+from metrics.registry import REGISTRY
+
+ADDRESS_KEYS_QUERY = ("SELECT id, address, pubkey, TPM_key, TPM_key_hash, TPM_enable FROM address_keys "
+                      "WHERE id > ? ORDER BY id")
+LOADED_ROWS_QUERY = "SELECT count(*) FROM address_keys WHERE id <= ?"
+DB_ROOT_QUERY = "SELECT table_name, root FROM db_root ORDER BY id"
+
+class IdentityStore():
+    """
+    Read-only view of the address_keys table built by brunnen-cli.sh. The table is loaded into
+    memory together with its Merkle tree and reloaded only when SQLite reports another
+    connection has written to the database, so lookups and proofs never scan the table.
+    The CLI only appends to address_keys, so a reload reads and hashes the new rows and the
+    tree nodes above them, it starts over only when rows were deleted. Proofs lead to the
+    address_keys root, which db_root_proof links to the published db_root while that root is
+    the one db_root was computed from.
+    Args:
+        db_path: path of the identity database, the <hash>.tmp file the CLI creates
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._data_version = None
+        # Id of the last row loaded and the number of rows up to it
+        self._last_id = None
+        self._row_count = 0
+        # (records, levels, root, db_root, db_root_proof, etag) swapped as one so readers never mix two loads
+        self._snapshot = ({}, [[]], None, None, None, None)
+
+    def close(self):
+        self._connection.close()
+
+    def refresh(self) -> bool:
+        """Reloads the table if the database changed since the last load, returns True if it did"""
+        with self._lock:
+            data_version = self._connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return False
+            with REGISTRY.histogram("merkle_rebuild_seconds", "Time to reload a table and rebuild its Merkle tree",
+                                    table="address_keys").time():
+                self._load()
+            REGISTRY.gauge("identity_records", "Identities in the local address_keys table").set(len(self))
+            self._data_version = data_version
+            return True
+
+    def _load(self):
+        records, levels = self._snapshot[:2]
+        last_id, row_count = self._last_id, self._row_count
+        if last_id is None or self._connection.execute(LOADED_ROWS_QUERY, (last_id,)).fetchone()[0] != row_count:
+            records, leaves, last_id, row_count = {}, [], 0, 0
+        else:
+            # Copied so readers of the current snapshot keep a consistent view
+            records, leaves = dict(records), levels[0][:row_count]
+        for row_id, address, pubkey, tpm_key, tpm_key_hash, tpm_enable in self._connection.execute(
+                ADDRESS_KEYS_QUERY, (last_id,)):
+            row_hash = address_keys_row_hash(address, pubkey, tpm_key, tpm_key_hash, tpm_enable)
+            leaves.append(row_hash)
+            # The CLI does not enforce unique addresses, the first registration wins like in query_user
+            records.setdefault(address, {
+                "address": address,
+                "pubkey": pubkey,
+                "tpm_key": tpm_key,
+                "tpm_key_hash": tpm_key_hash,
+                "tpm_enable": bool(tpm_enable),
+                "row_hash": row_hash,
+                "index": row_count,
+            })
+            last_id, row_count = row_id, row_count + 1
+        levels = merkle_update(levels, leaves)
+        root = levels[-1][0] if leaves else None
+        db_root, db_root_proof = self._published(root)
+        # db_root is what gets published, the table root changes with local writes before a republish
+        etag = '"' + hashlib.sha256(f"{db_root}:{root}".encode()).hexdigest()[:32] + '"'
+        self._last_id, self._row_count = last_id, row_count
+        self._snapshot = (records, levels, root, db_root, db_root_proof, etag)
+
+    def _published(self, root: str) -> tuple:
+        """The published db_root and the proof of the address_keys root under it, None while
+        the table has local writes db_root was not computed from"""
+        try:
+            rows = self._connection.execute(DB_ROOT_QUERY).fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        db_root, tables = None, []
+        for table_name, table_root in rows:
+            if isinstance(table_root, bytes):
+                table_root = table_root.hex()
+            if table_name == "db_root":
+                db_root = table_root
+            else:
+                tables.append((table_name, table_root))
+        # build_table_merkle stores an empty root for an empty table
+        published = ("address_keys", root or "")
+        if published not in tables:
+            return db_root, None
+        levels = merkle_levels([db_root_row_hash(table_name, table_root) for table_name, table_root in tables])
+        if levels[-1][0] != db_root:
+            return db_root, None
+        return db_root, merkle_proof(levels, tables.index(published))
+
+    @property
+    def root(self) -> str:
+        return self._snapshot[2]
+
+    @property
+    def db_root(self) -> str:
+        return self._snapshot[3]
+
+    @property
+    def etag(self) -> str:
+        return self._snapshot[5]
+
+    def __len__(self) -> int:
+        return len(self._snapshot[0])
+
+    def lookup_many(self, addresses: list) -> tuple:
+        """Records with Merkle proofs against the address_keys root, None for unknown addresses.
+        Returns (results, roots, etag) all taken from the same load of the table, roots holds the
+        address_keys root, the published db_root and db_root_proof linking the two."""
+        records, levels, root, db_root, db_root_proof, etag = self._snapshot
+        results = {}
+        for address in addresses:
+            record = records.get(address)
+            if record is None:
+                results[address] = None
+                continue
+            result = {key: value for key, value in record.items() if key != "index"}
+            result["proof"] = merkle_proof(levels, record["index"])
+            results[address] = result
+        return results, {"root": root, "db_root": db_root, "db_root_proof": db_root_proof}, etag
+
+    def lookup(self, address: str) -> dict:
+        return self.lookup_many([address])[0][address]
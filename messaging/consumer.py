@@ -0,0 +1,163 @@
+import asyncio
+import json
+import aio_pika
+from messaging import envelope
+from plugin.plugin_manager import PluginManager, PluginUnavailableError
+
+DEAD_LETTER_EXCHANGE = "brunnen.dead-letter"
+
+class PluginEventConsumer():
+    """
+    Consumes events from a queue and dispatches them in batches into the PluginManager.
+    Deliveries are acknowledged in bulk once the plugins have processed them, events a
+    plugin fails on are rejected without requeueing and routed to the dead letter queue.
+    Events turned away by an open circuit breaker are held for requeue_delay and then
+    requeued, since the plugin may accept them once it recovers.
+    The batch acknowledgement assumes this consumer is the only one on its channel.
+    Args:
+        manager: PluginManager the events are dispatched into
+        channel: aio_pika channel, or a channel from the in memory broker
+        queue_name: queue to consume from
+        plugin_name: plugin every event goes to, the "plugin" message header names it when None
+        prefetch_count: unacknowledged deliveries the broker may push ahead
+        batch_size: deliveries dispatched together
+        batch_timeout: seconds to wait for a batch to fill before dispatching it anyway
+        requeue_delay: seconds breaker-rejected deliveries are held before being requeued
+    """
+    def __init__(self, manager: PluginManager, channel, queue_name: str, plugin_name: str = None,
+                 prefetch_count: int = 256, batch_size: int = 64, batch_timeout: float = 0.01,
+                 requeue_delay: float = 1.0):
+        self.manager = manager
+        self.channel = channel
+        self.queue_name = queue_name
+        self.plugin_name = plugin_name
+        self.prefetch_count = prefetch_count
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.requeue_delay = requeue_delay
+        self.acknowledged = 0
+        self.dead_lettered = 0
+        self.requeued = 0
+        self.queue = None
+        self._deliveries = asyncio.Queue()
+        self._consumer_tag = None
+        self._task = None
+
+    async def start(self):
+        await self.channel.set_qos(prefetch_count=self.prefetch_count)
+        dead_letter = await self.channel.declare_exchange(
+            DEAD_LETTER_EXCHANGE, aio_pika.ExchangeType.DIRECT, durable=True
+        )
+        dead_letter_queue = await self.channel.declare_queue(f"{self.queue_name}.dead", durable=True)
+        await dead_letter_queue.bind(dead_letter, routing_key=self.queue_name)
+        self.queue = await self.channel.declare_queue(
+            self.queue_name,
+            durable=True,
+            arguments={
+                "x-dead-letter-exchange": DEAD_LETTER_EXCHANGE,
+                "x-dead-letter-routing-key": self.queue_name,
+            }
+        )
+        self._consumer_tag = await self.queue.consume(self._deliveries.put)
+        self._task = asyncio.create_task(self._batch_loop())
+        self._task.add_done_callback(self._loop_done)
+
+    async def stop(self):
+        """Stops consuming, deliveries not yet acknowledged are redelivered by the broker"""
+        if self._consumer_tag is not None:
+            await self.queue.cancel(self._consumer_tag)
+            self._consumer_tag = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _next_batch(self) -> list:
+        batch = [await self._deliveries.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_timeout
+        while len(batch) < self.batch_size:
+            if not self._deliveries.empty():
+                batch.append(self._deliveries.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._deliveries.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self.process_batch(batch)
+            except Exception as e:
+                print(f"Batch of {len(batch)} events on {self.queue_name} failed, dead lettering it: {e}")
+                await self._dead_letter(batch)
+
+    async def _dead_letter(self, batch: list):
+        """Rejects the deliveries of a failed batch that were not settled before it failed"""
+        for message in batch:
+            if message.processed:
+                continue
+            try:
+                await message.nack(requeue=False)
+                self.dead_lettered += 1
+            except Exception as e:
+                print(f"Could not dead letter event on {self.queue_name}: {e}")
+
+    def _loop_done(self, task: asyncio.Task):
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None:
+            print(f"Consumer on {self.queue_name} stopped: {error}")
+
+    async def _dispatch(self, message):
+        """Returns whether the event was processed, or None when the plugin turned it away for now"""
+        try:
+            if message.content_type == envelope.CONTENT_TYPE:
+                event = envelope.decode(message.body)
+            else:
+                event = json.loads(message.body)
+        except ValueError as e:
+            print(f"Undecodable event on {self.queue_name}: {e}")
+            return False
+        plugin_name = self.plugin_name or (message.headers or {}).get("plugin")
+        if plugin_name is None:
+            print(f"Event on {self.queue_name} does not name a plugin")
+            return False
+        try:
+            return await self.manager.route(plugin_name, event)
+        except PluginUnavailableError:
+            return None
+
+    async def process_batch(self, batch: list):
+        results = await asyncio.gather(*(self._dispatch(message) for message in batch))
+        last_processed = None
+        rejected = []
+        for message, processed in zip(batch, results):
+            if processed is None:
+                rejected.append(message)
+            elif processed:
+                if last_processed is None or message.delivery_tag > last_processed.delivery_tag:
+                    last_processed = message
+            else:
+                await message.nack(requeue=False)
+                self.dead_lettered += 1
+        if rejected:
+            # Holding the deliveries backs off the open breaker instead of redelivering them straight away
+            await asyncio.sleep(self.requeue_delay)
+            for message in rejected:
+                await message.nack(requeue=True)
+            self.requeued += len(rejected)
+        # Failed and rejected deliveries are settled above, so one multiple ack covers the rest of the batch
+        if last_processed is not None:
+            await last_processed.ack(multiple=True)
+            self.acknowledged += results.count(True)
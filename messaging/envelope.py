@@ -0,0 +1,158 @@
+import base64
+import struct
+
+MAGIC = b"BG"
+VERSION = 1
+CONTENT_TYPE = "application/x-brunnen-envelope"
+
+# magic, version, event type
+HEADER = struct.Struct(">2sBB")
+DIGEST_SIZE = 32
+# tpm_enable, address length, TPM_key length, followed by pubkey and TPM_key_hash
+IDENTITY_FIELDS = struct.Struct(">BHH")
+# days, domain length, cid length, followed by the merkle root
+NVS_UPDATE_FIELDS = struct.Struct(">IHH")
+
+class EnvelopeError(ValueError):
+    """Raised when a buffer is not a valid event envelope"""
+
+class IdentityEvent():
+    """An address_keys row being registered or changed"""
+    __slots__ = ("address", "pubkey", "tpm_key", "tpm_key_hash", "tpm_enable")
+    EVENT_TYPE = 1
+
+    def __init__(self, address: str, pubkey: bytes, tpm_key: bytes = b"", tpm_key_hash: bytes = bytes(32),
+                 tpm_enable: bool = False):
+        self.address = address
+        self.pubkey = pubkey
+        self.tpm_key = tpm_key
+        self.tpm_key_hash = tpm_key_hash
+        self.tpm_enable = tpm_enable
+
+    def to_dict(self) -> dict:
+        event = {
+            "type": "identity",
+            "address": self.address,
+            "pubkey": bytes(self.pubkey).hex(),
+            "TPM_key_hash": bytes(self.tpm_key_hash).hex(),
+            "TPM_enable": self.tpm_enable,
+        }
+        tpm_key = bytes(self.tpm_key)
+        try:
+            # The TPM_key column holds text, legacy consumers get it unchanged
+            event["TPM_key"] = tpm_key.decode()
+        except UnicodeDecodeError:
+            event["TPM_key"] = base64.b64encode(tpm_key).decode()
+            event["TPM_key_encoding"] = "base64"
+        return event
+
+    @classmethod
+    def from_dict(cls, event: dict) -> "IdentityEvent":
+        tpm_key = event.get("TPM_key", "")
+        return cls(
+            event["address"],
+            bytes.fromhex(event["pubkey"]),
+            base64.b64decode(tpm_key) if event.get("TPM_key_encoding") == "base64" else tpm_key.encode(),
+            bytes.fromhex(event.get("TPM_key_hash") or "00" * 32),
+            bool(event.get("TPM_enable", False))
+        )
+
+class NvsUpdateEvent():
+    """A new CID and merkle root published to an Emercoin NVS record"""
+    __slots__ = ("domain", "cid", "merkle_root", "days")
+    EVENT_TYPE = 2
+
+    def __init__(self, domain: str, cid: str, merkle_root: bytes, days: int = 365):
+        self.domain = domain
+        self.cid = cid
+        self.merkle_root = merkle_root
+        self.days = days
+
+    def to_dict(self) -> dict:
+        return {
+            "type": "nvs_update",
+            "domain": self.domain,
+            "cid": self.cid,
+            "merkle_root": bytes(self.merkle_root).hex(),
+            "days": self.days,
+        }
+
+    @classmethod
+    def from_dict(cls, event: dict) -> "NvsUpdateEvent":
+        return cls(event["domain"], event["cid"], bytes.fromhex(event["merkle_root"]), event.get("days", 365))
+
+def _digest(value, name: str) -> bytes:
+    if len(value) != DIGEST_SIZE:
+        raise EnvelopeError(f"{name} must be {DIGEST_SIZE} bytes")
+    return value
+
+def encode(event) -> bytes:
+    """Encodes a typed event into a versioned binary envelope"""
+    if isinstance(event, IdentityEvent):
+        address = event.address.encode()
+        return b"".join((
+            HEADER.pack(MAGIC, VERSION, IdentityEvent.EVENT_TYPE),
+            IDENTITY_FIELDS.pack(event.tpm_enable, len(address), len(event.tpm_key)),
+            _digest(event.pubkey, "pubkey"),
+            _digest(event.tpm_key_hash, "TPM_key_hash"),
+            address,
+            event.tpm_key,
+        ))
+    if isinstance(event, NvsUpdateEvent):
+        domain = event.domain.encode()
+        cid = event.cid.encode()
+        return b"".join((
+            HEADER.pack(MAGIC, VERSION, NvsUpdateEvent.EVENT_TYPE),
+            NVS_UPDATE_FIELDS.pack(event.days, len(domain), len(cid)),
+            _digest(event.merkle_root, "merkle_root"),
+            domain,
+            cid,
+        ))
+    raise EnvelopeError(f"Cannot encode {type(event).__name__}")
+
+def decode(data):
+    """
+    Decodes an envelope into a typed event.
+    Binary fields are returned as memoryview slices of data rather than copies,
+    so data must stay alive and unmodified while the event is in use.
+    """
+    view = memoryview(data)
+    try:
+        magic, version, event_type = HEADER.unpack_from(view)
+        offset = HEADER.size
+        if magic != MAGIC:
+            raise EnvelopeError("Not a brunnen-g envelope")
+        if version > VERSION:
+            raise EnvelopeError(f"Unsupported envelope version {version}")
+        if event_type == IdentityEvent.EVENT_TYPE:
+            tpm_enable, address_length, tpm_key_length = IDENTITY_FIELDS.unpack_from(view, offset)
+            offset += IDENTITY_FIELDS.size
+            address_start = offset + 2 * DIGEST_SIZE
+            tpm_key_start = address_start + address_length
+            end = tpm_key_start + tpm_key_length
+            if end > len(view):
+                raise EnvelopeError("Truncated identity event")
+            return IdentityEvent(
+                str(view[address_start:tpm_key_start], "utf-8"),
+                view[offset:offset + DIGEST_SIZE],
+                view[tpm_key_start:end],
+                view[offset + DIGEST_SIZE:address_start],
+                bool(tpm_enable)
+            )
+        if event_type == NvsUpdateEvent.EVENT_TYPE:
+            days, domain_length, cid_length = NVS_UPDATE_FIELDS.unpack_from(view, offset)
+            offset += NVS_UPDATE_FIELDS.size
+            domain_start = offset + DIGEST_SIZE
+            cid_start = domain_start + domain_length
+            end = cid_start + cid_length
+            if end > len(view):
+                raise EnvelopeError("Truncated NVS update event")
+            return NvsUpdateEvent(
+                str(view[domain_start:cid_start], "utf-8"),
+                str(view[cid_start:end], "utf-8"),
+                view[offset:domain_start],
+                days
+            )
+    except struct.error as e:
+        raise EnvelopeError(f"Truncated envelope: {e}")
+    raise EnvelopeError(f"Unknown event type {event_type}")
@@ -0,0 +1,172 @@
+import asyncio
+import itertools
+from collections import deque
+
+class MemoryMessage():
+    """Delivered message with the acknowledgement interface of aio_pika's IncomingMessage"""
+    def __init__(self, channel, queue, body: bytes, routing_key: str, headers: dict, content_type: str,
+                 delivery_tag: int):
+        self.body = body
+        self.routing_key = routing_key
+        self.headers = headers
+        self.content_type = content_type
+        self.delivery_tag = delivery_tag
+        self.processed = False
+        self._channel = channel
+        self._queue = queue
+
+    async def ack(self, multiple: bool = False):
+        self._channel._settle(self, multiple, lambda message: None)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True):
+        self._channel._settle(self, multiple, lambda message: message._queue._reject(message, requeue))
+
+    async def reject(self, requeue: bool = False):
+        await self.nack(requeue=requeue)
+
+class MemoryExchange():
+    def __init__(self, broker, name: str, exchange_type: str = "direct"):
+        self.name = name
+        self.type = exchange_type
+        self._broker = broker
+        self._bindings = []
+
+    async def publish(self, message, routing_key: str, **kwargs):
+        self._broker.published.append((self.name, routing_key, message.body))
+        self._route(message.body, routing_key, dict(message.headers or {}), message.content_type)
+
+    def _route(self, body: bytes, routing_key: str, headers: dict, content_type: str = None):
+        if self.name == "":
+            queue = self._broker.queues.get(routing_key)
+            targets = [queue] if queue is not None else []
+        elif self.type == "fanout":
+            targets = [queue for queue, _ in self._bindings]
+        else:
+            targets = [queue for queue, key in self._bindings if key == routing_key]
+        for queue in targets:
+            queue._enqueue(body, routing_key, headers, content_type)
+
+class MemoryQueue():
+    def __init__(self, broker, name: str, arguments: dict = None):
+        self.name = name
+        self.arguments = arguments or {}
+        self._broker = broker
+        self._channel = None
+        self._ready = deque()
+        self._consumers = {}
+
+    def __len__(self) -> int:
+        return len(self._ready)
+
+    async def bind(self, exchange, routing_key: str = None, **kwargs):
+        exchange = exchange if isinstance(exchange, MemoryExchange) else self._broker.exchanges[exchange]
+        exchange._bindings.append((self, routing_key or self.name))
+
+    async def consume(self, callback, no_ack: bool = False, **kwargs) -> str:
+        tag = f"ctag-{next(self._broker._tags)}"
+        self._consumers[tag] = callback
+        self._broker._wake()
+        return tag
+
+    async def cancel(self, consumer_tag: str, **kwargs):
+        self._consumers.pop(consumer_tag, None)
+
+    def _enqueue(self, body: bytes, routing_key: str, headers: dict, content_type: str):
+        self._ready.append((body, routing_key, headers, content_type))
+        self._broker._wake()
+
+    def _reject(self, message: MemoryMessage, requeue: bool):
+        if requeue:
+            self._ready.appendleft((message.body, message.routing_key, message.headers, message.content_type))
+            self._broker._wake()
+            return
+        exchange_name = self.arguments.get("x-dead-letter-exchange")
+        if exchange_name in self._broker.exchanges:
+            routing_key = self.arguments.get("x-dead-letter-routing-key", message.routing_key)
+            self._broker.exchanges[exchange_name]._route(
+                message.body, routing_key, message.headers, message.content_type
+            )
+
+class MemoryChannel():
+    """Channel with the subset of aio_pika's channel interface used by the consumer and publisher"""
+    def __init__(self, broker):
+        self.prefetch_count = 0
+        self._broker = broker
+        self._delivery_tags = itertools.count(1)
+        self._unacked = {}
+
+    @property
+    def default_exchange(self) -> MemoryExchange:
+        return self._broker.exchanges[""]
+
+    async def set_qos(self, prefetch_count: int = 0, **kwargs):
+        self.prefetch_count = prefetch_count
+        self._broker._wake()
+
+    async def declare_exchange(self, name: str, type="direct", **kwargs) -> MemoryExchange:
+        exchange_type = getattr(type, "value", type)
+        return self._broker.exchanges.setdefault(name, MemoryExchange(self._broker, name, exchange_type))
+
+    async def get_exchange(self, name: str, **kwargs) -> MemoryExchange:
+        return self._broker.exchanges[name]
+
+    async def declare_queue(self, name: str, arguments: dict = None, **kwargs) -> MemoryQueue:
+        queue = self._broker.queues.setdefault(name, MemoryQueue(self._broker, name, arguments))
+        queue._channel = self
+        return queue
+
+    def _has_capacity(self) -> bool:
+        return not self.prefetch_count or len(self._unacked) < self.prefetch_count
+
+    def _settle(self, message: MemoryMessage, multiple: bool, settle):
+        tags = [tag for tag in self._unacked if tag <= message.delivery_tag] if multiple else [message.delivery_tag]
+        for tag in tags:
+            settled = self._unacked.pop(tag, None)
+            if settled is not None:
+                settled.processed = True
+                settle(settled)
+        self._broker._wake()
+
+class MemoryBroker():
+    """
+    In process stand-in for RabbitMQ used by tests and benchmarks.
+    Supports the default exchange, direct and fanout exchanges, prefetch limits,
+    multiple acknowledgements and dead lettering of rejected messages.
+    """
+    def __init__(self):
+        self.queues = {}
+        self.published = []
+        self._tags = itertools.count(1)
+        self.exchanges = {"": MemoryExchange(self, "")}
+        self._pending_wake = False
+
+    async def channel(self) -> MemoryChannel:
+        return MemoryChannel(self)
+
+    def _wake(self):
+        if not self._pending_wake:
+            self._pending_wake = True
+            asyncio.get_running_loop().call_soon(self._deliver)
+
+    def _deliver(self):
+        self._pending_wake = False
+        for queue in self.queues.values():
+            channel = queue._channel
+            if channel is None or not queue._consumers:
+                continue
+            consumers = itertools.cycle(list(queue._consumers.values()))
+            while queue._ready and channel._has_capacity():
+                body, routing_key, headers, content_type = queue._ready.popleft()
+                message = MemoryMessage(
+                    channel, queue, body, routing_key, headers, content_type, next(channel._delivery_tags)
+                )
+                channel._unacked[message.delivery_tag] = message
+                asyncio.ensure_future(next(consumers)(message))
+
+    async def join(self, timeout: float = 5.0):
+        """Waits until every queue is empty and every delivery is settled"""
+        async def drained():
+            while any(queue._ready or queue._channel._unacked
+                      for queue in self.queues.values() if queue._consumers):
+                await asyncio.sleep(0.001)
+        await asyncio.wait_for(drained(), timeout)
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import aio_pika
+from messaging import envelope
+
+class PublishError(Exception):
+    """Raised when the broker did not confirm every event of a batch"""
+
+class ConfirmingPublisher():
+    """
+    Publishes events as persistent messages with publisher confirms.
+    Typed events are sent as binary envelopes, plain dicts as JSON.
+    Events are buffered and published as a batch whose confirms are awaited together,
+    so the broker round trip is paid once per batch instead of once per message.
+    Args:
+        channel: aio_pika channel opened with publisher confirms, or an in memory broker channel
+        exchange_name: exchange to publish to, the default exchange when None
+        batch_size: buffered events that trigger a flush
+    """
+    def __init__(self, channel, exchange_name: str = None, batch_size: int = 100):
+        self.channel = channel
+        self.exchange_name = exchange_name
+        self.batch_size = batch_size
+        self.confirmed = 0
+        self._exchange = None
+        self._buffer = []
+
+    async def _get_exchange(self):
+        if self._exchange is None:
+            if self.exchange_name is None:
+                self._exchange = self.channel.default_exchange
+            else:
+                self._exchange = await self.channel.get_exchange(self.exchange_name)
+        return self._exchange
+
+    @staticmethod
+    def _build_message(event, plugin_name: str) -> aio_pika.Message:
+        if isinstance(event, dict):
+            body, content_type = json.dumps(event).encode(), "application/json"
+        else:
+            body, content_type = envelope.encode(event), envelope.CONTENT_TYPE
+        return aio_pika.Message(
+            body,
+            content_type=content_type,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            headers={"plugin": plugin_name} if plugin_name else None
+        )
+
+    async def publish(self, event, routing_key: str, plugin_name: str = None) -> int:
+        """Buffers an event, returns the number of events confirmed if this filled the batch"""
+        self._buffer.append((event, routing_key, plugin_name))
+        if len(self._buffer) >= self.batch_size:
+            return await self.flush()
+        return 0
+
+    async def flush(self) -> int:
+        """
+        Publishes every buffered event and waits for all of their confirms.
+        Unconfirmed events go back into the buffer for the next flush before PublishError is raised.
+        """
+        if not self._buffer:
+            return 0
+        batch, self._buffer = self._buffer, []
+        exchange = await self._get_exchange()
+        results = await asyncio.gather(*(
+            exchange.publish(self._build_message(event, plugin_name), routing_key=routing_key)
+            for event, routing_key, plugin_name in batch
+        ), return_exceptions=True)
+        failed = [item for item, result in zip(batch, results) if isinstance(result, Exception)]
+        self.confirmed += len(batch) - len(failed)
+        if failed:
+            self._buffer = failed + self._buffer
+            error = next(result for result in results if isinstance(result, Exception))
+            raise PublishError(f"{len(failed)} of {len(batch)} events were not confirmed:\n{error}")
+        return len(batch)
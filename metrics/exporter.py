@@ -0,0 +1,60 @@
+"""
+Prometheus text exposition of a MetricsRegistry. The registry lives in the process being measured,
+so the endpoint is mounted on that process' own aiohttp app or served next to it with create_app.
+"""
+import math
+from aiohttp import web
+from metrics.registry import DEFAULT_QUANTILES, REGISTRY, Counter, Gauge, Histogram, MetricsRegistry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+def _number(value: float) -> str:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render(registry: MetricsRegistry = REGISTRY) -> str:
+    """Every metric of the registry in the Prometheus text format, histograms as summaries"""
+    families = {}
+    for (name, labels), metric in list(registry.metrics.items()):
+        families.setdefault(name, []).append((labels, metric))
+    lines = []
+    for name in sorted(families):
+        metrics = families[name]
+        kind = MetricsRegistry.KINDS[type(metrics[0][1])]
+        if name in registry.help:
+            lines.append(f"# HELP {name} {_escape(registry.help[name])}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, metric in metrics:
+            if isinstance(metric, Histogram):
+                for quantile in DEFAULT_QUANTILES:
+                    lines.append(f"{name}{_labels(labels, (('quantile', quantile),))} {_number(metric.quantile(quantile))}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(metric.sum)}")
+                lines.append(f"{name}_count{_labels(labels)} {metric.count}")
+            elif isinstance(metric, Gauge):
+                lines.append(f"{name}{_labels(labels)} {_number(metric.read())}")
+            elif isinstance(metric, Counter):
+                lines.append(f"{name}{_labels(labels)} {_number(metric.value)}")
+    return "\n".join(lines) + "\n"
+
+def metrics_handler(registry: MetricsRegistry = REGISTRY):
+    """aiohttp handler serving the registry, mount it on any app as GET /metrics"""
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(body=render(registry).encode(), headers={"Content-Type": CONTENT_TYPE})
+    return handle
+
+def create_app(registry: MetricsRegistry = REGISTRY) -> web.Application:
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler(registry))
+    return app
@@ -0,0 +1,253 @@
+import functools
+import inspect
+import math
+import os
+import threading
+import time
+
+# Sub-bucket bits of the histograms, the mantissa keeps its top bit set so a power of two has
+# 2^(PRECISION_BITS - 1) = 64 sub-buckets, and a bucket midpoint is within 1% of its values
+PRECISION_BITS = 7
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+class _Metric():
+    __slots__ = ("registry", "name", "labels")
+
+    def __init__(self, registry, name: str, labels: tuple):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+class Counter(_Metric):
+    """Monotonic count, such as events processed or RPC errors"""
+    __slots__ = ("value",)
+
+    def __init__(self, registry, name: str, labels: tuple):
+        super().__init__(registry, name, labels)
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        if self.registry.enabled:
+            self.value += amount
+
+class Gauge(_Metric):
+    """Value that goes up and down, optionally read from a callback when exported"""
+    __slots__ = ("value", "callback")
+
+    def __init__(self, registry, name: str, labels: tuple):
+        super().__init__(registry, name, labels)
+        self.value = 0
+        self.callback = None
+
+    def set(self, value: float):
+        if self.registry.enabled:
+            self.value = value
+
+    def inc(self, amount: float = 1):
+        if self.registry.enabled:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        if self.registry.enabled:
+            self.value -= amount
+
+    def track_in_progress(self):
+        """Context manager counting its block as in progress, the decrement is applied exactly when
+        the increment was, even if metrics are switched on or off while the block runs"""
+        return _InProgress(self) if self.registry.enabled else _NULL_TIMER
+
+    def set_function(self, callback):
+        """Reads the gauge from callback at export time instead of storing a value"""
+        self.callback = callback
+
+    def read(self) -> float:
+        return self.callback() if self.callback is not None else self.value
+
+class _NullTimer():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _InProgress():
+    __slots__ = ("gauge",)
+
+    def __init__(self, gauge):
+        self.gauge = gauge
+
+    def __enter__(self):
+        self.gauge.value += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self.gauge.value -= 1
+        return False
+
+class _Timer():
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.record(time.perf_counter() - self.started)
+        return False
+
+class Histogram(_Metric):
+    """
+    HDR-style latency histogram. Values are stored as integer multiples of unit in log-linear
+    buckets, a power of two split into 2^(PRECISION_BITS - 1) sub-buckets, so memory stays small
+    and any quantile is within 1% of the recorded value.
+    """
+    __slots__ = ("unit", "counts", "count", "sum", "min", "max", "_lock")
+
+    def __init__(self, registry, name: str, labels: tuple, unit: float = 1e-6):
+        super().__init__(registry, name, labels)
+        self.unit = unit
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(units: int) -> tuple:
+        shift = max(units.bit_length() - PRECISION_BITS, 0)
+        return shift, units >> shift
+
+    def record(self, value: float):
+        if not self.registry.enabled:
+            return
+        bucket = self._bucket(max(int(value / self.unit), 0))
+        with self._lock:
+            self.counts[bucket] = self.counts.get(bucket, 0) + 1
+            self.count += 1
+            self.sum += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def time(self):
+        """Context manager recording the seconds spent in its block"""
+        return _Timer(self) if self.registry.enabled else _NULL_TIMER
+
+    def quantile(self, fraction: float) -> float:
+        """Value at the given quantile, the midpoint of its bucket clamped to the recorded range"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = max(math.ceil(fraction * self.count), 1)
+            seen = 0
+            for shift, mantissa in sorted(self.counts):
+                seen += self.counts[(shift, mantissa)]
+                if seen >= rank:
+                    low = mantissa << shift
+                    high = ((mantissa + 1) << shift) - 1
+                    return min(max((low + high) / 2 * self.unit, self.min), self.max)
+        return self.max
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.count = 0
+            self.sum = 0.0
+            self.min = math.inf
+            self.max = 0.0
+
+class MetricsRegistry():
+    """
+    In-process registry of counters, gauges and histograms. Metrics are identified by name and
+    labels and created on first use. While disabled every update returns after a single flag
+    check, so instrumented code paths cost close to nothing.
+    Args:
+        enabled: whether updates are recorded
+    """
+    KINDS = {Counter: "counter", Gauge: "gauge", Histogram: "summary"}
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.help = {}
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def _get(self, kind, name: str, help_text: str, labels: dict, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    for (existing, _), other in self.metrics.items():
+                        if existing == name and type(other) is not kind:
+                            raise ValueError(f"Metric {name} is already registered as a {self.KINDS[type(other)]}")
+                    metric = kind(self, name, key[1], **kwargs)
+                    self.metrics[key] = metric
+                    if help_text:
+                        self.help.setdefault(name, help_text)
+        return metric
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = "", **labels) -> Gauge:
+        return self._get(Gauge, name, help_text, labels)
+
+    def histogram(self, name: str, help_text: str = "", **labels) -> Histogram:
+        return self._get(Histogram, name, help_text, labels)
+
+    def timed(self, name: str, help_text: str = "", **labels):
+        """Decorator recording the duration of every call, sync or async, in a histogram"""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+                    with self.histogram(name, help_text, **labels).time():
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.histogram(name, help_text, **labels).time():
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        """Current values keyed by (name, labels), histograms as their count, sum and quantiles"""
+        result = {}
+        for key, metric in list(self.metrics.items()):
+            if isinstance(metric, Histogram):
+                result[key] = {
+                    "count": metric.count,
+                    "sum": metric.sum,
+                    **{f"p{q * 100:g}": metric.quantile(q) for q in DEFAULT_QUANTILES},
+                }
+            elif isinstance(metric, Gauge):
+                result[key] = metric.read()
+            else:
+                result[key] = metric.value
+        return result
+
+# Shared registry the instrumented modules report to, off unless BRUNNEN_METRICS is set
+REGISTRY = MetricsRegistry(enabled=os.environ.get("BRUNNEN_METRICS", "") not in ("", "0"))
@@ -1,8 +1,17 @@
 from abc import ABC, abstractmethod
 from enum import Enum
 import aiorwlock
+import asyncio
 import importlib
+import importlib.util
 import json
+import os
+import sys
+import time
+from metrics.registry import REGISTRY
+
+class PluginUnavailableError(Exception):
+    """Raised by PluginManager.route when a plugin's circuit breaker turns an event away"""
 
 class PluginStates(Enum):
     """Plugin lifecycle states monitoring availiablity"""
@@ -20,6 +29,8 @@ class HealthStates(Enum):
     RECOVERING = "recovering"
 
 class AbstractPlugin(ABC):
+    # Plugins that set this receive typed envelope events instead of dicts
+    typed_events = False
 
     def __init__(self, plugin_name: str):
         self.name = plugin_name
@@ -48,42 +59,258 @@ class AbstractPlugin(ABC):
 
 class PluginLifecycleFSM():
     """Finite state machine that manages plugin states"""
+    TRANSITIONS = {
+        PluginStates.INACTIVE: {PluginStates.LOADING},
+        PluginStates.LOADING: {PluginStates.ACTIVE, PluginStates.INACTIVE},
+        PluginStates.ACTIVE: {PluginStates.STOPPING},
+        PluginStates.STOPPING: {PluginStates.INACTIVE},
+    }
+
+    def __init__(self):
+        self.state = PluginStates.INACTIVE
+
     async def can_transition(self, new_state: PluginStates) -> bool:
-        pass
+        return new_state in self.TRANSITIONS[self.state]
+
     async def transition_to(self, new_state: PluginStates) -> bool:
-        pass
+        if not await self.can_transition(new_state):
+            return False
+        self.state = new_state
+        return True
+
+class SlidingWindowCounter():
+    """
+    Counts successes and errors over a sliding time window using a ring buffer of time buckets.
+    Running totals are kept alongside the buckets and a bucket's counts are taken out of them as
+    it rotates out of the window, so recording and reading the totals are both O(1).
+    Args:
+        window_seconds: length of the window
+        bucket_count: number of buckets the window is divided into
+        clock: monotonic time source
+    """
+    def __init__(self, window_seconds: float = 60.0, bucket_count: int = 12, clock=time.monotonic):
+        self.bucket_count = bucket_count
+        self.bucket_width = window_seconds / bucket_count
+        self._clock = clock
+        self.reset()
+
+    def reset(self):
+        self._successes = [0] * self.bucket_count
+        self._errors = [0] * self.bucket_count
+        self._total_successes = 0
+        self._total_errors = 0
+        self._head = None
+
+    def _current_bucket(self) -> int:
+        epoch = int(self._clock() / self.bucket_width)
+        if self._head is None or epoch - self._head >= self.bucket_count:
+            # Idle for a whole window, nothing recorded is still inside it
+            self.reset()
+        else:
+            # At most bucket_count buckets rotate out, however many events arrive
+            for stale in range(self._head + 1, epoch + 1):
+                index = stale % self.bucket_count
+                self._total_successes -= self._successes[index]
+                self._total_errors -= self._errors[index]
+                self._successes[index] = 0
+                self._errors[index] = 0
+        if self._head is None or epoch > self._head:
+            self._head = epoch
+        return self._head % self.bucket_count
+
+    def record_success(self):
+        index = self._current_bucket()
+        self._successes[index] += 1
+        self._total_successes += 1
+
+    def record_error(self):
+        index = self._current_bucket()
+        self._errors[index] += 1
+        self._total_errors += 1
+
+    def totals(self) -> tuple:
+        """Returns (successes, errors) for the buckets still inside the window"""
+        self._current_bucket()
+        return self._total_successes, self._total_errors
 
 class PluginHealthFSM():
-    """Finite state machine that manages plugin health status"""
+    """
+    Finite state machine that manages plugin health status as a circuit breaker.
+    The error rate over a sliding window moves the plugin between HEALTHY, DEGRADED and
+    UNHEALTHY, and trips it to FAILED. A FAILED plugin receives no events until the
+    recovery timeout has passed, then RECOVERING lets a few probe events through
+    which either close the breaker again or trip it back to FAILED.
+    Args:
+        window_seconds: length of the error rate window
+        bucket_count: time buckets in the window
+        min_requests: events needed in the window before the error rate is trusted
+        degraded_rate, unhealthy_rate, failed_rate: error rate thresholds for each state
+        recovery_timeout: seconds a FAILED plugin is left alone before probing
+        probe_successes: successful probes needed to return to HEALTHY
+        clock: monotonic time source
+    """
+    TRANSITIONS = {
+        HealthStates.HEALTHY: {HealthStates.DEGRADED, HealthStates.UNHEALTHY, HealthStates.FAILED},
+        HealthStates.DEGRADED: {HealthStates.HEALTHY, HealthStates.UNHEALTHY, HealthStates.FAILED},
+        HealthStates.UNHEALTHY: {HealthStates.HEALTHY, HealthStates.DEGRADED, HealthStates.FAILED},
+        HealthStates.FAILED: {HealthStates.RECOVERING},
+        HealthStates.RECOVERING: {HealthStates.HEALTHY, HealthStates.FAILED},
+    }
+
+    def __init__(self, window_seconds: float = 60.0, bucket_count: int = 12, min_requests: int = 10,
+                 degraded_rate: float = 0.1, unhealthy_rate: float = 0.25, failed_rate: float = 0.5,
+                 recovery_timeout: float = 30.0, probe_successes: int = 3, clock=time.monotonic):
+        self.state = HealthStates.HEALTHY
+        self.window = SlidingWindowCounter(window_seconds, bucket_count, clock)
+        self.min_requests = min_requests
+        self.degraded_rate = degraded_rate
+        self.unhealthy_rate = unhealthy_rate
+        self.failed_rate = failed_rate
+        self.recovery_timeout = recovery_timeout
+        self.probe_successes = probe_successes
+        self._clock = clock
+        self._failed_at = 0.0
+        self._probes_issued = 0
+        self._probes_passed = 0
+
+    def error_rate(self) -> float:
+        successes, errors = self.window.totals()
+        total = successes + errors
+        return errors / total if total else 0.0
+
+    def allow_request(self) -> bool:
+        """Whether an event may be routed to the plugin, issuing probes while RECOVERING"""
+        if self.state == HealthStates.FAILED:
+            if self._clock() - self._failed_at < self.recovery_timeout:
+                return False
+            self._enter(HealthStates.RECOVERING)
+        if self.state == HealthStates.RECOVERING:
+            if self._probes_issued >= self.probe_successes:
+                return False
+            self._probes_issued += 1
+        return True
+
     async def report_error(self):
-        pass
+        if self.state == HealthStates.RECOVERING:
+            await self.transition_to(HealthStates.FAILED)
+            return
+        if self.state == HealthStates.FAILED:
+            return
+        self.window.record_error()
+        await self._evaluate()
+
     async def report_success(self):
-        pass
+        if self.state == HealthStates.RECOVERING:
+            self._probes_passed += 1
+            if self._probes_passed >= self.probe_successes:
+                await self.transition_to(HealthStates.HEALTHY)
+            else:
+                # Free the slot so the next probe can be issued
+                self._probes_issued -= 1
+            return
+        if self.state == HealthStates.FAILED:
+            return
+        self.window.record_success()
+        await self._evaluate()
+
+    async def can_transition(self, new_state: HealthStates) -> bool:
+        return new_state in self.TRANSITIONS[self.state]
+
     async def transition_to(self, new_state: HealthStates) -> bool:
-        pass
+        if not await self.can_transition(new_state):
+            return False
+        self._enter(new_state)
+        return True
+
+    def _enter(self, new_state: HealthStates):
+        if new_state == HealthStates.FAILED:
+            self._failed_at = self._clock()
+        elif new_state == HealthStates.RECOVERING:
+            self._probes_issued = 0
+            self._probes_passed = 0
+        elif new_state == HealthStates.HEALTHY and self.state == HealthStates.RECOVERING:
+            # Errors from before the breaker tripped should not trip it again
+            self.window.reset()
+        self.state = new_state
+
+    async def _evaluate(self):
+        successes, errors = self.window.totals()
+        if successes + errors < self.min_requests:
+            return
+        rate = errors / (successes + errors)
+        if rate >= self.failed_rate:
+            new_state = HealthStates.FAILED
+        elif rate >= self.unhealthy_rate:
+            new_state = HealthStates.UNHEALTHY
+        elif rate >= self.degraded_rate:
+            new_state = HealthStates.DEGRADED
+        else:
+            new_state = HealthStates.HEALTHY
+        if new_state != self.state:
+            await self.transition_to(new_state)
 
 class PluginManager():
     """Manages plugins for application"""
     def __init__(self):
         self.registry = {}
+        self.manifests = {}
+        self.startup_timings = {}
+        self._started = set()
+        self._load_locks = {}
+        self._in_flight = {}
+        self._drained = {}
         self._lock = aiorwlock.RWLock()
-    
-    async def register(self, json_file_path: str) -> bool:
-        try:
-            with open(json_file_path, 'r') as file:
-                config = json.load(file)
-            # File Data
-            class_path = config["class_path"]
-            plugin_name = config["name"]
+        # Shared by every manager and moved with inc/dec, a callback would keep this manager alive
+        self._in_flight_gauge = REGISTRY.gauge("plugin_events_in_flight", "Events currently being processed by plugins")
+
+    @staticmethod
+    def _read_manifest(json_file_path: str) -> dict:
+        with open(json_file_path, 'r') as file:
+            config = json.load(file)
+        # Fail early on manifests that can never be loaded
+        for key in ("name", "class_path"):
+            if key not in config:
+                raise KeyError(key)
+        config.setdefault("isolation", "inline")
+        config.setdefault("depends_on", [])
+        return config
+
+    @staticmethod
+    def _create_plugin(config: dict, reload_module: bool = False) -> AbstractPlugin:
+        # File Data
+        class_path = config["class_path"]
+        plugin_name = config["name"]
+        isolation = config.get("isolation", "inline")
+        if isolation == "process":
+            # Imported here, the worker proxy module depends on this one
+            from plugin.process_isolation import ProcessPlugin
+            return ProcessPlugin(plugin_name, class_path)
+        elif isolation == "inline":
             module_name, class_name = class_path.rsplit('.', 1)
-            # Load python file
-            module = importlib.import_module(module_name)
+            # Load python file, a new version is executed into a new module object
+            # so instances of the old class keep running against the old code
+            if reload_module and module_name in sys.modules:
+                importlib.invalidate_caches()
+                spec = importlib.util.find_spec(module_name)
+                module = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(module)
+                sys.modules[module_name] = module
+            else:
+                module = importlib.import_module(module_name)
 
             # Get the class and create instance
             pulgin_class = getattr(module, class_name)
-            plugin_instance = pulgin_class(plugin_name)
+            return pulgin_class(plugin_name)
+        raise ValueError(f"Unknown isolation mode {isolation}")
+
+    async def register(self, json_file_path: str) -> bool:
+        try:
+            config = self._read_manifest(json_file_path)
+            plugin_instance = self._create_plugin(config)
             # Store it
-            self.registry[plugin_name] = plugin_instance
+            async with self._lock.writer_lock:
+                self.manifests[config["name"]] = config
+                self.registry[config["name"]] = plugin_instance
             return True
         except KeyError as e:
             print(f"Mising key: {e}")
@@ -91,9 +318,264 @@ class PluginManager():
         except Exception as e:
             print(f"exception: {e}")
             return False
+
+    async def scan(self, manifest_dir: str) -> list:
+        """Records the metadata of every plugin manifest in a directory without importing the plugins"""
+        found = []
+        for entry in sorted(os.scandir(manifest_dir), key=lambda e: e.name):
+            if not entry.is_file() or not entry.name.endswith('.json'):
+                continue
+            try:
+                config = self._read_manifest(entry.path)
+            except KeyError as e:
+                print(f"Mising key: {e} in {entry.name}")
+                continue
+            except Exception as e:
+                print(f"exception: {e} in {entry.name}")
+                continue
+            async with self._lock.writer_lock:
+                self.manifests[config["name"]] = config
+            found.append(config["name"])
+        return found
+
+    async def _load(self, plugin_name: str) -> AbstractPlugin:
+        """Returns the plugin instance, importing it from its manifest on first use"""
+        async with self._lock.reader_lock:
+            plugin = self.registry.get(plugin_name)
+        if plugin is not None:
+            return plugin
+        if plugin_name not in self.manifests:
+            raise KeyError(plugin_name)
+        async with self._load_locks.setdefault(plugin_name, asyncio.Lock()):
+            async with self._lock.reader_lock:
+                plugin = self.registry.get(plugin_name)
+            if plugin is not None:
+                return plugin
+            began = time.perf_counter()
+            plugin = self._create_plugin(self.manifests[plugin_name])
+            self._record_timing(plugin_name, "import", began)
+            async with self._lock.writer_lock:
+                self.registry[plugin_name] = plugin
+            return plugin
+
+    def _record_timing(self, plugin_name: str, phase: str, began: float):
+        self.startup_timings.setdefault(plugin_name, {})[phase] = time.perf_counter() - began
+
+    async def start(self, plugin_name: str) -> bool:
+        """Loads, initializes and starts a plugin, recording how long each phase took"""
+        if plugin_name in self._started:
+            return True
+        try:
+            plugin = await self._load(plugin_name)
+            async with self._load_locks.setdefault(plugin_name, asyncio.Lock()):
+                if plugin_name in self._started:
+                    return True
+                await plugin.lifecycle.transition_to(PluginStates.LOADING)
+                began = time.perf_counter()
+                initialized = await plugin.initialize()
+                self._record_timing(plugin_name, "initialize", began)
+                started = False
+                if initialized:
+                    began = time.perf_counter()
+                    started = await plugin.start()
+                    self._record_timing(plugin_name, "start", began)
+                if not started:
+                    await plugin.lifecycle.transition_to(PluginStates.INACTIVE)
+                    return False
+                await plugin.lifecycle.transition_to(PluginStates.ACTIVE)
+                self._started.add(plugin_name)
+                return True
+        except KeyError as e:
+            print(f"Unknown plugin: {e}")
+            return False
+        except Exception as e:
+            print(f"exception: {e}")
+            return False
+
+    def _dependency_levels(self) -> list:
+        """Groups plugins so every plugin comes after the plugins it depends on"""
+        remaining = {}
+        for name, config in self.manifests.items():
+            missing = [dep for dep in config.get("depends_on", []) if dep not in self.manifests]
+            if missing:
+                raise ValueError(f"Plugin {name} depends on unknown plugins {missing}")
+            remaining[name] = set(config.get("depends_on", []))
+        levels = []
+        while remaining:
+            ready = sorted(name for name, deps in remaining.items() if not deps)
+            if not ready:
+                raise ValueError(f"Dependency cycle between plugins {sorted(remaining)}")
+            levels.append(ready)
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return levels
+
+    async def start_all(self) -> dict:
+        """Starts every known plugin, running each dependency level concurrently"""
+        results = {}
+        for level in self._dependency_levels():
+            runnable = [
+                name for name in level
+                if all(results.get(dep) for dep in self.manifests[name].get("depends_on", []))
+            ]
+            for name in level:
+                if name not in runnable:
+                    print(f"Skipping {name}, a dependency failed to start")
+                    results[name] = False
+            outcomes = await asyncio.gather(*(self.start(name) for name in runnable))
+            results.update(zip(runnable, outcomes))
+        return results
+
+    def get_startup_report(self) -> list:
+        """Per plugin startup timings in seconds, slowest first"""
+        report = []
+        for name, phases in self.startup_timings.items():
+            entry = {"name": name, "import": 0.0, "initialize": 0.0, "start": 0.0}
+            entry.update(phases)
+            entry["total"] = entry["import"] + entry["initialize"] + entry["start"]
+            report.append(entry)
+        return sorted(report, key=lambda entry: entry["total"], reverse=True)
+
+    async def dispatch(self, plugin_name: str, event: dict) -> bool:
+        """
+        Routes an event to a plugin, starting it first if it has not been started yet.
+        Events are not routed to FAILED plugins, and only probe events reach RECOVERING ones.
+        """
+        try:
+            return await self.route(plugin_name, event)
+        except PluginUnavailableError:
+            return False
+
+    async def route(self, plugin_name: str, event) -> bool:
+        """
+        Same as dispatch, but raises PluginUnavailableError instead of returning False when the
+        plugin's circuit breaker rejects the event, so callers can retry it later rather than drop it.
+        """
+        if not REGISTRY.enabled:
+            return await self._dispatch(plugin_name, event)
+        with REGISTRY.histogram("plugin_dispatch_seconds", "Time to route and process one event", plugin=plugin_name).time():
+            try:
+                result = await self._dispatch(plugin_name, event)
+            except PluginUnavailableError:
+                REGISTRY.counter("plugin_events_total", "Events dispatched to plugins by outcome",
+                                 plugin=plugin_name, result="rejected").inc()
+                raise
+        REGISTRY.counter("plugin_events_total", "Events dispatched to plugins by outcome",
+                         plugin=plugin_name, result="ok" if result else "failed").inc()
+        return result
+
+    async def _dispatch(self, plugin_name: str, event) -> bool:
+        if plugin_name not in self._started and not await self.start(plugin_name):
+            return False
+        async with self._lock.reader_lock:
+            plugin = self.registry[plugin_name]
+            # Counted under the read lock so a reload cannot swap the plugin out uncounted
+            self._in_flight[plugin] = self._in_flight.get(plugin, 0) + 1
+        try:
+            with self._in_flight_gauge.track_in_progress():
+                if not plugin.health.allow_request():
+                    raise PluginUnavailableError(f"Plugin {plugin_name} is {plugin.health.state.value}")
+                try:
+                    if not plugin.typed_events and not isinstance(event, dict):
+                        event = event.to_dict()
+                    result = await plugin.process_event(event)
+                except Exception as e:
+                    print(f"Plugin {plugin_name} failed processing event: {e}")
+                    result = False
+                if result:
+                    await plugin.health.report_success()
+                else:
+                    await plugin.health.report_error()
+                return bool(result)
+        finally:
+            self._in_flight[plugin] -= 1
+            if not self._in_flight[plugin]:
+                del self._in_flight[plugin]
+                if plugin in self._drained:
+                    self._drained.pop(plugin).set()
+
+    async def _drain(self, plugin: AbstractPlugin, timeout: float) -> bool:
+        """Waits until the plugin has no events in flight"""
+        if plugin not in self._in_flight:
+            return True
+        drained = self._drained.setdefault(plugin, asyncio.Event())
+        try:
+            await asyncio.wait_for(drained.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._drained.pop(plugin, None)
+            return False
+
+    async def reload(self, plugin_name: str, drain_timeout: float = 30.0) -> bool:
+        """
+        Replaces a running plugin with a freshly imported version of its class.
+        The new instance is started next to the old one and swapped into the registry
+        under the write lock, the old instance is moved to STOPPING and stopped once
+        the events it already received have finished.
+        """
+        try:
+            config = self.manifests[plugin_name]
+            async with self._lock.reader_lock:
+                old_plugin = self.registry.get(plugin_name)
+            new_plugin = self._create_plugin(config, reload_module=True)
+        except KeyError as e:
+            print(f"Unknown plugin: {e}")
+            return False
+        except Exception as e:
+            print(f"exception: {e}")
+            return False
+
+        async with self._load_locks.setdefault(plugin_name, asyncio.Lock()):
+            if old_plugin is None or plugin_name not in self._started:
+                # Nothing running, the new version is picked up on the next start
+                async with self._lock.writer_lock:
+                    self.registry[plugin_name] = new_plugin
+                return True
+
+            await new_plugin.lifecycle.transition_to(PluginStates.LOADING)
+            try:
+                started = await new_plugin.initialize() and await new_plugin.start()
+            except Exception as e:
+                print(f"exception: {e}")
+                started = False
+            if not started:
+                print(f"New version of {plugin_name} failed to start, keeping the old one")
+                await new_plugin.lifecycle.transition_to(PluginStates.INACTIVE)
+                return False
+            await new_plugin.lifecycle.transition_to(PluginStates.ACTIVE)
+
+            await old_plugin.lifecycle.transition_to(PluginStates.STOPPING)
+            async with self._lock.writer_lock:
+                self.registry[plugin_name] = new_plugin
+
+        if not await self._drain(old_plugin, drain_timeout):
+            print(f"Old version of {plugin_name} still had events in flight after {drain_timeout}s")
+        try:
+            await old_plugin.stop()
+        except Exception as e:
+            print(f"exception stopping old version of {plugin_name}: {e}")
+        await old_plugin.lifecycle.transition_to(PluginStates.INACTIVE)
+        return True
+
     async def unregister(self) -> bool:
         pass
+
     async def get_ready_state(self, plugin_name: str) -> PluginStates:
-        pass
+        async with self._lock.reader_lock:
+            plugin = self.registry.get(plugin_name)
+        if plugin is None:
+            if plugin_name in self.manifests:
+                return PluginStates.INACTIVE
+            raise KeyError(plugin_name)
+        return plugin.lifecycle.state
+
     async def get_plugin_health(self, plugin_name: str) -> HealthStates:
-        pass
+        async with self._lock.reader_lock:
+            plugin = self.registry.get(plugin_name)
+        if plugin is None:
+            if plugin_name in self.manifests:
+                return HealthStates.HEALTHY
+            raise KeyError(plugin_name)
+        return plugin.health.state
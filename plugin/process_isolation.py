@@ -0,0 +1,154 @@
+import asyncio
+import importlib
+import multiprocessing
+from plugin.plugin_manager import AbstractPlugin, HealthStates
+
+# Only the plugin interface can be invoked across the pipe
+PLUGIN_METHODS = frozenset({"initialize", "start", "process_event", "get_status", "stop"})
+
+class PluginWorkerError(Exception):
+    """Raised when a plugin worker process fails, hangs or returns an error"""
+
+def _worker_main(class_path: str, plugin_name: str, conn):
+    """Entry point of the worker process, hosts the plugin in its own event loop"""
+    module_name, class_name = class_path.rsplit('.', 1)
+    module = importlib.import_module(module_name)
+    plugin = getattr(module, class_name)(plugin_name)
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                method_name, args = conn.recv()
+            except EOFError:
+                break
+            try:
+                if method_name not in PLUGIN_METHODS:
+                    raise AttributeError(f"{method_name} is not part of the plugin interface")
+                result = loop.run_until_complete(getattr(plugin, method_name)(*args))
+                conn.send((True, result))
+            except Exception as e:
+                conn.send((False, f"{type(e).__name__}: {e}"))
+            if method_name == "stop":
+                break
+    finally:
+        loop.close()
+        conn.close()
+
+class ProcessPlugin(AbstractPlugin):
+    """
+    Hosts a plugin in a worker process and forwards the plugin interface over a pipe.
+    Worker failures surface as PluginWorkerError so the manager can report them to the
+    health FSM, a dead worker is replaced on the next call unless the plugin is FAILED.
+    Args:
+        plugin_name: name the plugin is registered under
+        class_path: dotted path to the plugin class, imported inside the worker
+        call_timeout: seconds to wait on the worker before it is considered hung
+    """
+    def __init__(self, plugin_name: str, class_path: str, call_timeout: float = 30.0):
+        super().__init__(plugin_name)
+        self.class_path = class_path
+        self.call_timeout = call_timeout
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._process = None
+        self._conn = None
+        self._initialized = False
+        self._started = False
+        self._call_lock = asyncio.Lock()
+
+    async def initialize(self) -> bool:
+        result = await self._call("initialize")
+        self._initialized = bool(result)
+        return result
+
+    async def start(self) -> bool:
+        result = await self._call("start")
+        self._started = bool(result)
+        return result
+
+    async def process_event(self, event: dict) -> bool:
+        return await self._call("process_event", event)
+
+    async def get_status(self) -> dict:
+        status = await self._call("get_status")
+        status.update({
+            "isolation": "process",
+            "pid": self._process.pid if self._process else None,
+            "restarts": self.restarts,
+        })
+        return status
+
+    async def stop(self) -> bool:
+        if not self._worker_alive():
+            self._initialized = False
+            self._started = False
+            return True
+        result = await self._call("stop")
+        self._initialized = False
+        self._started = False
+        await asyncio.get_running_loop().run_in_executor(None, self._process.join, self.call_timeout)
+        self._terminate_worker()
+        return result
+
+    def _worker_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def _spawn_worker(self):
+        parent_conn, child_conn = self._context.Pipe()
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(self.class_path, self.name, child_conn),
+            name=f"plugin-{self.name}",
+            daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+        self._conn = parent_conn
+
+    def _terminate_worker(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._process is not None:
+            if self._process.is_alive():
+                self._process.kill()
+            self._process.join()
+            self._process = None
+
+    def _roundtrip(self, method_name: str, args: tuple):
+        """Blocking request/response over the pipe, run off the event loop"""
+        self._conn.send((method_name, args))
+        if not self._conn.poll(self.call_timeout):
+            raise TimeoutError(f"no reply within {self.call_timeout}s")
+        return self._conn.recv()
+
+    async def _restart_worker(self):
+        """Replaces a dead worker unless the health FSM has given up on the plugin"""
+        if self.health.state == HealthStates.FAILED:
+            raise PluginWorkerError(f"Plugin {self.name} is FAILED, worker will not be restarted")
+        replay = [name for name, done in (("initialize", self._initialized), ("start", self._started)) if done]
+        self._terminate_worker()
+        self._spawn_worker()
+        if not replay:
+            return
+        self.restarts += 1
+        # Replay the lifecycle so the replacement worker is in the same state as the old one
+        loop = asyncio.get_running_loop()
+        for method_name in replay:
+            ok, result = await loop.run_in_executor(None, self._roundtrip, method_name, ())
+            if not ok or not result:
+                raise PluginWorkerError(f"Restarted worker for {self.name} failed to {method_name}")
+
+    async def _call(self, method_name: str, *args):
+        async with self._call_lock:
+            if not self._worker_alive():
+                await self._restart_worker()
+            loop = asyncio.get_running_loop()
+            try:
+                ok, result = await loop.run_in_executor(None, self._roundtrip, method_name, args)
+            except (EOFError, OSError, TimeoutError) as e:
+                self._terminate_worker()
+                raise PluginWorkerError(f"Worker for {self.name} failed during {method_name}: {e}")
+        if not ok:
+            raise PluginWorkerError(f"Plugin {self.name} raised in {method_name}: {result}")
+        return result
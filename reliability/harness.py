@@ -0,0 +1,262 @@
+"""
+Parallel replacement for reliability_test.sh. Every iteration starts its own container with its own
+/tpmdata state dir, follows the container log to time each startup stage, checks the TPM and the
+Yggdrasil address, and writes a CSV row. Runs stop early once a TPM lockout is seen.
+Containers run in DEV_MODE so they stay up, build the image with the dev dependencies already
+installed or every iteration repeats the install: docker build --build-arg DEV_MODE=1 .
+Run from the repository root: python -m reliability.harness -n 1000 -j 8
+"""
+import argparse
+import asyncio
+import csv
+import json
+import math
+import os
+import re
+import time
+
+CONTAINER_IMAGE = "kiljoy001/brunnen-g:dev-latest"
+# Log lines the bootstrapper prints when each stage is ready, several stages start concurrently
+STAGES = (
+    ("dbus", "DBus is ready"),
+    ("swtpm", "SWTPM is ready"),
+    ("rabbitmq", "RabbitMQ is ready"),
+    ("abrmd", "tpm2-abrmd is ready"),
+    ("tpm2_startup", "TPM startup complete"),
+    ("yggdrasil", "Yggdrasil started with IPv6"),
+)
+# Printed by the bootstrapper when the image stamp did not match and pipenv ran during startup
+DEPENDENCY_INSTALL_MARKER = "Installed dependencies from Pipfile.lock"
+ADDRESS_PATTERN = re.compile(r"20[01]:[0-9a-f:]+")
+TPM_ERROR_PATTERN = re.compile(r"ERROR|failed|lockout", re.IGNORECASE)
+IN_LOCKOUT_PATTERN = re.compile(r"inLockout:\s*1")
+CSV_FIELDS = ["timestamp", "iteration", "address", "tpm_status", "container_status", "dependencies_installed",
+              "total"] + [name for name, _ in STAGES]
+
+class StageTimer():
+    """
+    Turns container log lines into the seconds from container start until each stage was ready.
+    Stages run concurrently, so the gap between two markers says nothing about either stage.
+    """
+    def __init__(self, started: float):
+        self.started = started
+        self.reached = {}
+        self.lockout = False
+        self.dependencies_installed = False
+
+    def feed(self, line: str, now: float) -> bool:
+        """Records the stage a log line marks, returns True once every stage is ready"""
+        if "TPM_RC_LOCKOUT" in line:
+            self.lockout = True
+        if DEPENDENCY_INSTALL_MARKER in line:
+            self.dependencies_installed = True
+        for name, marker in STAGES:
+            if name not in self.reached and marker in line:
+                self.reached[name] = now - self.started
+        return len(self.reached) == len(STAGES)
+
+    @property
+    def total(self) -> float:
+        return max(self.reached.values()) if self.reached else None
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile, None when there are no values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(max(math.ceil(fraction * len(ordered)), 1), len(ordered))
+    return ordered[rank - 1]
+
+def summarize(results: list) -> dict:
+    """Percentile summary per stage plus the outcome counts of the run"""
+    summary = {
+        "iterations": len(results),
+        "successful": sum(1 for result in results if result["tpm_status"] == "TPM_OK" and result["address"]),
+        "lockout": any(result["tpm_status"] == "TPM_LOCKOUT" for result in results),
+        # Iterations whose timings include a pipenv install, the image was not built for DEV_MODE
+        "dependency_installs": sum(1 for result in results if result.get("dependencies_installed")),
+        "addresses": sorted({result["address"] for result in results if result["address"]}),
+        "stages": {},
+    }
+    for name in [name for name, _ in STAGES] + ["total"]:
+        values = [result[name] for result in results if result.get(name) is not None]
+        summary["stages"][name] = {
+            "count": len(values),
+            "p50": percentile(values, 0.50),
+            "p90": percentile(values, 0.90),
+            "p99": percentile(values, 0.99),
+            "max": max(values) if values else None,
+        }
+    return summary
+
+class ReliabilityHarness():
+    """
+    Runs container startup iterations concurrently, each against its own TPM state.
+    Args:
+        image: container image under test
+        state_root: directory that receives one state dir per iteration
+        logs_dir: directory for the per-iteration container logs
+        parallelism: number of containers running at the same time
+        startup_timeout: seconds an iteration may take to reach the last stage
+        docker: docker binary to drive
+    """
+    def __init__(self, image: str = CONTAINER_IMAGE, state_root: str = "./reliability_state",
+                 logs_dir: str = "./test_logs", parallelism: int = 4, startup_timeout: float = 120.0,
+                 docker: str = "docker"):
+        self.image = image
+        self.state_root = state_root
+        self.logs_dir = logs_dir
+        self.parallelism = parallelism
+        self.startup_timeout = startup_timeout
+        self.docker = docker
+        self.results = []
+        self._stop = asyncio.Event()
+
+    async def _docker(self, *args, timeout: float = 60.0) -> tuple:
+        process = await asyncio.create_subprocess_exec(
+            self.docker, *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        )
+        try:
+            output, _ = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return 1, "timed out"
+        return process.returncode, output.decode(errors="replace")
+
+    def _state_dirs(self, iteration: int) -> tuple:
+        base = os.path.abspath(os.path.join(self.state_root, f"iteration_{iteration}"))
+        tpmdata = os.path.join(base, "tpmdata")
+        tpm_start = os.path.join(base, "tpm-start")
+        os.makedirs(tpmdata, exist_ok=True)
+        os.makedirs(tpm_start, exist_ok=True)
+        return tpmdata, tpm_start
+
+    async def _follow_startup(self, container_id: str, timer: StageTimer):
+        """Streams the container log until the last stage is reached or the container exits"""
+        process = await asyncio.create_subprocess_exec(
+            self.docker, "logs", "--follow", container_id,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        )
+        try:
+            async for raw in process.stdout:
+                if timer.feed(raw.decode(errors="replace"), time.monotonic()) or timer.lockout:
+                    break
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+
+    async def _check_tpm(self, container_id: str) -> str:
+        _, handles = await self._docker("exec", container_id, "tpm2_getcap", "handles-persistent")
+        _, properties = await self._docker("exec", container_id, "tpm2_getcap", "properties-variable")
+        if IN_LOCKOUT_PATTERN.search(properties) or "TPM_RC_LOCKOUT" in handles:
+            return "TPM_LOCKOUT"
+        if TPM_ERROR_PATTERN.search(handles):
+            return "TPM_WARNING"
+        return "TPM_OK"
+
+    async def _address(self, container_id: str) -> str:
+        _, output = await self._docker("exec", container_id, "yggdrasilctl", "getSelf")
+        match = ADDRESS_PATTERN.search(output)
+        if match is None:
+            _, output = await self._docker("exec", container_id, "ip", "-6", "addr", "show")
+            match = ADDRESS_PATTERN.search(output)
+        return match.group(0) if match else None
+
+    async def run_iteration(self, iteration: int) -> dict:
+        tpmdata, tpm_start = self._state_dirs(iteration)
+        result = {"iteration": iteration, "address": None, "tpm_status": "UNKNOWN", "container_status": "Running"}
+        started = time.monotonic()
+        # No --network host: parallel containers would fight over the swtpm and RabbitMQ ports
+        code, output = await self._docker(
+            "run", "-d", "-e", "DEV_MODE=1",
+            "--cap-add=NET_ADMIN", "--cap-add=NET_RAW",
+            "--device=/dev/net/tun:/dev/net/tun",
+            "-v", f"{tpmdata}:/tpmdata",
+            "-v", f"{tpm_start}:/var/lib/tpm",
+            self.image
+        )
+        container_id = output.strip().splitlines()[-1] if code == 0 and output.strip() else None
+        if container_id is None:
+            result.update(tpm_status="FAILED_START", container_status="Container Failed")
+            return self._finish(result)
+        try:
+            timer = StageTimer(started)
+            try:
+                await asyncio.wait_for(self._follow_startup(container_id, timer), self.startup_timeout)
+            except asyncio.TimeoutError:
+                result["container_status"] = "Startup Timeout"
+            result.update(timer.reached)
+            result["total"] = timer.total
+            result["dependencies_installed"] = timer.dependencies_installed
+            _, running = await self._docker("inspect", "-f", "{{.State.Running}}", container_id)
+            if running.strip() != "true":
+                result["container_status"] = "Container Exited"
+            if timer.lockout:
+                result["tpm_status"] = "TPM_LOCKOUT"
+            elif result["container_status"] != "Container Exited":
+                result["tpm_status"] = await self._check_tpm(container_id)
+                result["address"] = await self._address(container_id)
+        finally:
+            _, logs = await self._docker("logs", container_id)
+            with open(os.path.join(self.logs_dir, f"container_logs_{iteration}.log"), 'w') as file:
+                file.write(logs)
+            await self._docker("stop", "-t", "15", container_id)
+            await self._docker("rm", "-f", container_id)
+        return self._finish(result)
+
+    def _finish(self, result: dict) -> dict:
+        result["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        if result["tpm_status"] == "TPM_LOCKOUT":
+            # A locked out TPM fails every later iteration too, stop scheduling new ones
+            self._stop.set()
+        self.results.append(result)
+        return result
+
+    async def run(self, iterations: int, csv_path: str) -> dict:
+        os.makedirs(self.logs_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.parallelism)
+
+        async def guarded(iteration: int):
+            async with semaphore:
+                if self._stop.is_set():
+                    return None
+                result = await self.run_iteration(iteration)
+                print(f"{result['timestamp']} iteration {iteration}: {result['tpm_status']} "
+                      f"{result['container_status']} {result['address'] or 'NO_VALID_ADDRESS'} total={result.get('total')}")
+                return result
+
+        await asyncio.gather(*(guarded(iteration) for iteration in range(1, iterations + 1)))
+        self.results.sort(key=lambda result: result["iteration"])
+        with open(csv_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(self.results)
+        return summarize(self.results)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--iterations", type=int, default=1000)
+    parser.add_argument("-j", "--parallelism", type=int, default=4)
+    parser.add_argument("--image", default=CONTAINER_IMAGE)
+    parser.add_argument("--state-root", default="./reliability_state")
+    parser.add_argument("--logs-dir", default="./test_logs")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--output", default=f"tpm_reliability_test_{time.strftime('%Y%m%d_%H%M%S')}.csv")
+    args = parser.parse_args()
+
+    harness = ReliabilityHarness(args.image, args.state_root, args.logs_dir, args.parallelism, args.startup_timeout)
+    summary = asyncio.run(harness.run(args.iterations, args.output))
+    summary_path = os.path.splitext(args.output)[0] + "_summary.json"
+    with open(summary_path, 'w') as file:
+        json.dump(summary, file, indent=2)
+    print(json.dumps(summary, indent=2))
+    if summary["lockout"]:
+        print("TPM lockout detected, remaining iterations were skipped")
+    if summary["dependency_installs"]:
+        print(f"{summary['dependency_installs']} iterations installed dependencies during startup, "
+              "rebuild the image with --build-arg DEV_MODE=1 for clean timings")
+
+if __name__ == "__main__":
+    main()
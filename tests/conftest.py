@@ -0,0 +1,64 @@
+import shutil
+import socket
+import subprocess
+import time
+import pytest
+import pytest_asyncio
+
+# Where the swtpm fixture persists its signing key, the first handle tpm_provisioning.sh can pick
+PERSISTENT_HANDLE = 0x81000000
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port: int, process, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("localhost", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                process.kill()
+                pytest.fail("swtpm did not start")
+            time.sleep(0.05)
+
+@pytest.fixture
+def swtpm(tmp_path):
+    """Starts a swtpm simulator like entrypoint.sh does and provisions a persistent signing key"""
+    tpm2_pytss = pytest.importorskip("tpm2_pytss")
+    if shutil.which("swtpm") is None:
+        pytest.skip("swtpm is not installed")
+    port = free_port()
+    process = subprocess.Popen([
+        "swtpm", "socket", "--tpm2",
+        "--tpmstate", f"dir={tmp_path}",
+        "--server", f"type=tcp,port={port}",
+        "--ctrl", f"type=tcp,port={free_port()}",
+        "--flags", "not-need-init,startup-clear"
+    ])
+    wait_for_port(port, process)
+    tcti = f"swtpm:host=localhost,port={port}"
+    attributes = tpm2_pytss.TPMA_OBJECT
+    with tpm2_pytss.ESAPI(tcti) as context:
+        public = tpm2_pytss.TPM2B_PUBLIC.parse(
+            "ecc256:ecdsa-sha256",
+            objectAttributes=attributes.USERWITHAUTH | attributes.SIGN_ENCRYPT | attributes.FIXEDTPM
+            | attributes.FIXEDPARENT | attributes.SENSITIVEDATAORIGIN
+        )
+        key = context.create_primary(None, public)[0]
+        context.evict_control(tpm2_pytss.ESYS_TR.OWNER, key, PERSISTENT_HANDLE)
+        context.flush_context(key)
+    yield tcti
+    process.terminate()
+    process.wait()
+
+@pytest_asyncio.fixture
+async def broker(swtpm):
+    from tpm.broker import TpmBroker
+    tpm_broker = TpmBroker(swtpm)
+    await tpm_broker.start()
+    yield tpm_broker
+    await tpm_broker.stop()
@@ -1,9 +1,16 @@
 import keyring
 import pytest
+import string
+import asyncio
+import threading
+import time
+import types
 import contextlib
 from hypothesis import given, strategies as st, settings
 from keyring.backend import KeyringBackend
 from keyring.errors import KeyringError
+from configuration.config_manager import ConfigManagerAsync, PasswordGetError
+from tests.test_configuration import SecretServiceBackend
 
 class MockKeyringBackendAsync(KeyringBackend):
     """Async version of the mock keyring"""
@@ -23,7 +30,7 @@ class MockKeyringBackendAsync(KeyringBackend):
         else:
             raise keyring.errors.PasswordDeleteError("Password not found!")
 
-class RemoveFailureKeyringAsync(KeyringBackend):
+class RemoveFailureKeyringAsync(MockKeyringBackendAsync):
     """Async version of the remove failure keyring"""
     async def delete_password(self, service_name: str, username: str) -> KeyringError:
         raise KeyringError("Simulated delete failure")
@@ -43,6 +50,68 @@ class ErrorRaisingKeyringBackendAsync(KeyringBackend):
     async def delete_password(self, service_name: str, username: str) -> KeyringError:
         raise KeyringError("Simulated error in delete password method")
 
+class SyncKeyringBackend(KeyringBackend):
+    """Blocking keyring that records which thread served each call"""
+    def __init__(self, delay: float = 0.0):
+        self.passwords = {}
+        self.delay = delay
+        self.threads = set()
+
+    def set_password(self, service_name: str, username: str, password: str) -> None:
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        self.passwords[(service_name, username)] = password
+
+    def get_password(self, service_name: str, username: str) -> str:
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        return self.passwords.get((service_name, username))
+
+    def delete_password(self, service_name: str, username: str) -> None:
+        self.threads.add(threading.get_ident())
+        if (service_name, username) not in self.passwords:
+            raise keyring.errors.PasswordDeleteError("Password not found!")
+        del self.passwords[(service_name, username)]
+
+class RecordingKeyringAsync(MockKeyringBackendAsync):
+    """Yields to the event loop inside every call and records the call order"""
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def set_password(self, service_name: str, username: str, password: str) -> None:
+        self.calls.append(("set", password))
+        await asyncio.sleep(0.01)
+        await super().set_password(service_name, username, password)
+
+    async def get_password(self, service_name: str, username: str) -> str:
+        self.calls.append(("get", None))
+        await asyncio.sleep(0.01)
+        return await super().get_password(service_name, username)
+
+    async def delete_password(self, service_name: str, username: str) -> None:
+        self.calls.append(("delete", None))
+        await asyncio.sleep(0.01)
+        await super().delete_password(service_name, username)
+
+class HangingKeyringBackend(SyncKeyringBackend):
+    """Blocking keyring whose set_password hangs until released"""
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def set_password(self, service_name: str, username: str, password: str) -> None:
+        if password == "hangs":
+            self.release.wait(5)
+        super().set_password(service_name, username, password)
+
+class SaveNewFailureKeyringAsync(MockKeyringBackendAsync):
+    """Refuses to store the new password so the reset has to roll back"""
+    async def set_password(self, service_name: str, username: str, password: str) -> None:
+        if password == "new_password":
+            raise keyring.errors.PasswordSetError("Simulated new password failure")
+        self.passwords[(service_name, username)] = password
+
 @contextlib.asynccontextmanager
 async def keyring_context(backend_instance: KeyringBackend) -> KeyringBackend:
     original_backend = keyring.get_keyring()
@@ -90,12 +159,320 @@ def non_overlapping_credentials(draw):
 @given(username=st.text(min_size=1), password=st.text(min_size=1))
 async def test_config_load_save_credentials(username, password):
     #Arrange
-    with keyring_context(MockKeyringBackendAsync()) as mock_keyring:
+    async with keyring_context(MockKeyringBackendAsync()) as mock_keyring:
         config = ConfigManagerAsync()
         service_name = "emercoin"
-        mock_keyring.set_password(service_name, username, password)
+        await mock_keyring.set_password(service_name, username, password)
         await config.save_login(service_name, username, password)
     #Act
         result = await config.load_login(service_name, username)
     #Assert
-        result == mock_keyring.get_password(service_name, username)
+        assert result == await mock_keyring.get_password(service_name, username)
+        config.close()
+
+@pytest.mark.asyncio
+async def test_sync_backend_runs_off_the_event_loop():
+    # Arrange
+    backend = SyncKeyringBackend()
+    config = ConfigManagerAsync(backend)
+
+    # Act
+    await config.save_login("emercoin", "user", "secret")
+    result = await config.load_login("emercoin", "user")
+    await config.delete_login("emercoin", "user")
+
+    # Assert
+    assert result == "secret"
+    assert backend.passwords == {}
+    assert threading.get_ident() not in backend.threads
+    config.close()
+
+@pytest.mark.asyncio
+async def test_slow_backend_times_out():
+    # Arrange
+    config = ConfigManagerAsync(SyncKeyringBackend(delay=0.5), timeout=0.05)
+
+    # Act
+    with pytest.raises(PasswordGetError) as error_info:
+        await config.load_login("emercoin", "user")
+
+    # Assert
+    assert "Retrieving the password for user failed" in str(error_info.value)
+    assert "timed out" in str(error_info.value)
+    config.close()
+
+@pytest.mark.asyncio
+async def test_slow_backend_does_not_block_other_users():
+    # Arrange
+    backend = SyncKeyringBackend(delay=0.1)
+    config = ConfigManagerAsync(backend, max_workers=4)
+    began = time.perf_counter()
+
+    # Act
+    await asyncio.gather(*(config.save_login("emercoin", f"user{n}", "secret") for n in range(4)))
+    elapsed = time.perf_counter() - began
+
+    # Assert
+    assert elapsed < 0.3
+    assert len(backend.passwords) == 4
+    config.close()
+
+@pytest.mark.asyncio
+async def test_lock_table_does_not_grow():
+    # Arrange
+    config = ConfigManagerAsync(MockKeyringBackendAsync())
+
+    # Act
+    for n in range(100):
+        await config.save_login("emercoin", f"user{n}", "secret")
+
+    # Assert
+    assert len(config._locks) == 0
+    config.close()
+
+@pytest.mark.asyncio
+async def test_reset_login_replaces_password():
+    # Arrange
+    config = ConfigManagerAsync(MockKeyringBackendAsync())
+    await config.save_login("emercoin", "user", "old_password")
+
+    # Act
+    await config.reset_login("emercoin", "user", "new_password")
+
+    # Assert
+    assert await config.load_login("emercoin", "user") == "new_password"
+    config.close()
+
+@pytest.mark.asyncio
+async def test_reset_login_restores_original_password_on_failure():
+    # Arrange
+    backend = SaveNewFailureKeyringAsync()
+    config = ConfigManagerAsync(backend)
+    await config.save_login("emercoin", "user", "old_password")
+
+    # Act
+    with pytest.raises(keyring.errors.PasswordSetError) as error_info:
+        await config.reset_login("emercoin", "user", "new_password")
+
+    # Assert
+    assert "Saving the new password failed" in str(error_info.value)
+    assert "new_password" not in str(error_info.value)
+    assert await config.load_login("emercoin", "user") == "old_password"
+    config.close()
+
+@pytest.mark.asyncio
+async def test_reset_login_reports_remove_failure():
+    # Arrange
+    config = ConfigManagerAsync(RemoveFailureKeyringAsync())
+
+    # Act
+    with pytest.raises(keyring.errors.PasswordDeleteError) as error_info:
+        await config.reset_login("emercoin", "user", "new_password")
+
+    # Assert
+    assert "Unable to remove password for user" in str(error_info.value)
+    assert "Simulated delete failure" in str(error_info.value)
+    config.close()
+
+@pytest.mark.asyncio
+async def test_backend_errors_are_mapped():
+    # Arrange
+    config = ConfigManagerAsync(ErrorRaisingKeyringBackendAsync())
+
+    # Act & Assert
+    with pytest.raises(keyring.errors.PasswordSetError, match="Saving the emercoin password failed"):
+        await config.save_login("emercoin", "user", "secret")
+    with pytest.raises(PasswordGetError, match="Retrieving the password for user failed"):
+        await config.load_login("emercoin", "user")
+    with pytest.raises(keyring.errors.PasswordDeleteError, match="Unable to remove password for emercoin"):
+        await config.delete_login("emercoin", "user")
+    config.close()
+
+class ClosingConnection():
+    """D-Bus connection stand-in, refuses calls once closed"""
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class CollectionKeyringBackend(SyncKeyringBackend):
+    """
+    Sync mock of a collection based keyring such as Secret Service. Like keyring's backend every
+    operation opens the collection and closes it with closing(collection.connection).
+    """
+    def __init__(self, delay: float = 0.0):
+        super().__init__(delay)
+        self.connections = []
+
+    def get_preferred_collection(self):
+        connection = ClosingConnection()
+        self.connections.append(connection)
+        return types.SimpleNamespace(connection=connection)
+
+    def _call(self, operation, *args):
+        collection = self.get_preferred_collection()
+        with contextlib.closing(collection.connection):
+            if collection.connection.closed:
+                raise KeyringError("connection closed")
+            return operation(*args)
+
+    def set_password(self, service_name: str, username: str, password: str) -> None:
+        return self._call(super().set_password, service_name, username, password)
+
+    def get_password(self, service_name: str, username: str) -> str:
+        return self._call(super().get_password, service_name, username)
+
+    def delete_password(self, service_name: str, username: str) -> None:
+        return self._call(super().delete_password, service_name, username)
+
+@pytest.mark.asyncio
+async def test_batched_operations_run_users_concurrently():
+    # Arrange
+    backend = CollectionKeyringBackend(delay=0.1)
+    config = ConfigManagerAsync(backend, max_workers=4)
+    credentials = {("emercoin", f"wallet{n}"): f"secret{n}" for n in range(4)}
+    began = time.perf_counter()
+
+    # Act
+    saved = await config.set_many(credentials)
+    elapsed = time.perf_counter() - began
+    loaded = await config.get_many(credentials.keys())
+
+    # Assert
+    assert saved.ok and loaded.ok
+    assert loaded.values == credentials
+    assert elapsed < 0.3
+    assert len(backend.connections) == 8
+    assert all(connection.closed for connection in backend.connections)
+    config.close()
+
+@pytest.mark.asyncio
+async def test_batched_operations_report_failures_per_key_async():
+    # Arrange
+    config = ConfigManagerAsync(MockKeyringBackendAsync())
+    await config.save_login("emercoin", "wallet1", "secret1")
+
+    # Act
+    deleted = await config.delete_many([("emercoin", "wallet1"), ("emercoin", "missing"), ("plugin", "wallet1")])
+
+    # Assert
+    assert deleted.values == {("emercoin", "wallet1"): True}
+    assert set(deleted.errors) == {("emercoin", "missing"), ("plugin", "wallet1")}
+    assert all(isinstance(error, keyring.errors.PasswordDeleteError) for error in deleted.errors.values())
+    config.close()
+
+@pytest.mark.asyncio
+async def test_batched_operations_share_one_secret_service_session_per_service_async():
+    # Arrange
+    backend = SecretServiceBackend()
+    config = ConfigManagerAsync(backend)
+    credentials = {("emercoin", f"wallet{n}"): f"secret{n}" for n in range(4)}
+    credentials[("plugin", "wallet0")] = "plugin secret"
+
+    # Act
+    saved = await config.set_many(credentials)
+    loaded = await config.get_many(credentials.keys())
+    deleted = await config.delete_many([("emercoin", "wallet1"), ("emercoin", "missing")])
+
+    # Assert
+    assert saved.ok and loaded.ok
+    assert loaded.values == credentials
+    assert deleted.values == {("emercoin", "wallet1"): True}
+    assert isinstance(deleted.errors[("emercoin", "missing")], keyring.errors.PasswordDeleteError)
+    assert len(backend.collections) == 2 + 2 + 1
+    assert all(collection.connection.closed for collection in backend.collections)
+    config.close()
+
+class RecordingCache():
+    def __init__(self):
+        self.invalidated = []
+
+    def invalidate(self, username: str = None):
+        self.invalidated.append(username)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", [MockKeyringBackendAsync(), SecretServiceBackend()])
+async def test_every_write_invalidates_registered_caches(backend):
+    # Arrange
+    config = ConfigManagerAsync(backend)
+    cache = RecordingCache()
+    other = RecordingCache()
+    config.register_cache(cache)
+    config.register_cache(other, "plugin")
+    await config.save_login("emercoin", "saved", "secret")
+    await config.save_login("emercoin", "reset", "secret")
+    await config.save_login("emercoin", "deleted", "secret")
+    cache.invalidated.clear()
+
+    # Act
+    await config.save_login("emercoin", "saved", "new secret")
+    await config.reset_login("emercoin", "reset", "new secret")
+    await config.delete_login("emercoin", "deleted")
+    await config.set_many({("emercoin", "batched"): "secret"})
+    await config.delete_many([("emercoin", "batched")])
+    await config.load_login("emercoin", "saved")
+    await config.get_many([("emercoin", "saved")])
+
+    # Assert
+    assert cache.invalidated == ["saved", "reset", "deleted", "batched", "batched"]
+    assert other.invalidated == []
+    config.close()
+
+@pytest.mark.asyncio
+async def test_concurrent_resets_do_not_interleave():
+    # Arrange
+    backend = RecordingKeyringAsync()
+    config = ConfigManagerAsync(backend)
+    await config.save_login("emercoin", "user", "original")
+    backend.calls.clear()
+
+    # Act
+    await asyncio.gather(config.reset_login("emercoin", "user", "first"),
+                         config.reset_login("emercoin", "user", "second"))
+
+    # Assert
+    assert [call for call, _ in backend.calls] == ["get", "delete", "set"] * 2
+    assert await config.load_login("emercoin", "user") == "second"
+    config.close()
+
+@pytest.mark.asyncio
+async def test_timed_out_write_keeps_the_lock_until_it_finishes():
+    # Arrange
+    backend = HangingKeyringBackend()
+    config = ConfigManagerAsync(backend, timeout=0.05)
+    loop = asyncio.get_running_loop()
+
+    # Act
+    with pytest.raises(keyring.errors.PasswordSetError, match="timed out"):
+        await config.save_login("emercoin", "user", "hangs")
+    later = asyncio.ensure_future(config.save_login("emercoin", "user", "later"))
+    await asyncio.sleep(0.1)
+    waiting = not later.done()
+    loop.call_soon(backend.release.set)
+    await later
+
+    # Assert
+    assert waiting
+    assert backend.passwords[("emercoin", "user")] == "later"
+    assert config.abandoned == 0
+    config.close()
+
+@pytest.mark.asyncio
+async def test_calls_fail_fast_once_every_worker_is_stuck():
+    # Arrange
+    backend = HangingKeyringBackend()
+    config = ConfigManagerAsync(backend, max_workers=1, timeout=0.05)
+
+    # Act
+    with pytest.raises(keyring.errors.PasswordSetError, match="timed out"):
+        await config.save_login("emercoin", "user", "hangs")
+    began = time.perf_counter()
+    with pytest.raises(PasswordGetError, match="not responding"):
+        await config.load_login("emercoin", "other")
+    elapsed = time.perf_counter() - began
+    backend.release.set()
+
+    # Assert
+    assert elapsed < 0.05
+    config.close()
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import sys
+import time
+import pytest
+from bootstrap.deps import ensure_dependencies, write_stamp
+from bootstrap.readiness import ReadinessTimeout, wait_for_path, wait_for_port
+from bootstrap.runner import Bootstrapper, BootstrapError, Step, run_until_exit
+
+def sleeper(seconds: float, log: list, name: str):
+    async def action():
+        log.append(f"{name} started")
+        await asyncio.sleep(seconds)
+        log.append(f"{name} ready")
+    return action
+
+async def broken():
+    raise RuntimeError("socket never appeared")
+
+class TestBootstrapper():
+
+    @pytest.mark.asyncio
+    async def test_independent_steps_run_concurrently(self):
+        # Arrange
+        log = []
+        bootstrapper = Bootstrapper([Step(name, sleeper(0.2, log, name)) for name in ("dbus", "swtpm", "rabbitmq")])
+
+        # Act
+        started = time.monotonic()
+        timeline = await bootstrapper.run()
+
+        # Assert
+        assert time.monotonic() - started < 0.5
+        assert log[:3] == ["dbus started", "swtpm started", "rabbitmq started"]
+        assert all(entry["status"] == "ready" for entry in timeline.values())
+
+    @pytest.mark.asyncio
+    async def test_steps_wait_for_their_dependencies(self):
+        # Arrange
+        log = []
+        bootstrapper = Bootstrapper([
+            Step("abrmd", sleeper(0, log, "abrmd"), depends_on=("dbus", "swtpm")),
+            Step("dbus", sleeper(0.05, log, "dbus")),
+            Step("swtpm", sleeper(0.1, log, "swtpm")),
+        ])
+
+        # Act
+        timeline = await bootstrapper.run()
+
+        # Assert
+        assert log.index("abrmd started") > log.index("swtpm ready")
+        assert timeline["abrmd"]["start"] >= timeline["swtpm"]["ready"]
+        assert "abrmd" in bootstrapper.format_timeline()
+
+    @pytest.mark.asyncio
+    async def test_failure_skips_dependents_and_reports_timeline(self):
+        # Arrange
+        log = []
+        bootstrapper = Bootstrapper([
+            Step("dbus", broken),
+            Step("abrmd", sleeper(0, log, "abrmd"), depends_on=("dbus",)),
+            Step("rabbitmq", sleeper(0, log, "rabbitmq")),
+            Step("slow", sleeper(1, log, "slow"), timeout=0.05),
+        ])
+
+        # Act & Assert
+        with pytest.raises(BootstrapError) as error:
+            await bootstrapper.run()
+        assert "socket never appeared" in str(error.value)
+        assert bootstrapper.timeline["abrmd"]["status"] == "skipped"
+        assert bootstrapper.timeline["rabbitmq"]["status"] == "ready"
+        assert bootstrapper.timeline["slow"]["status"] == "failed"
+        assert "abrmd started" not in log
+
+    def test_invalid_graphs_are_rejected(self):
+        # Act & Assert
+        with pytest.raises(ValueError):
+            Bootstrapper([Step("abrmd", broken, depends_on=("dbus",))])
+        with pytest.raises(ValueError):
+            Bootstrapper([Step("a", broken, depends_on=("b",)), Step("b", broken, depends_on=("a",))])
+
+class TestRunUntilExit():
+
+    @pytest.mark.asyncio
+    async def test_returns_when_command_exits_despite_background_children(self, tmp_path):
+        # Arrange
+        log_path = str(tmp_path / "startup.log")
+        started = time.monotonic()
+
+        # Act
+        output = await run_until_exit("bash", "-c", "sleep 3 & echo launched", log_path=log_path)
+
+        # Assert
+        assert time.monotonic() - started < 1.0
+        assert output == "launched\n"
+
+    @pytest.mark.asyncio
+    async def test_failure_raises_with_log(self, tmp_path):
+        # Act / Assert
+        with pytest.raises(BootstrapError, match="broken"):
+            await run_until_exit("bash", "-c", "echo broken; exit 3", log_path=str(tmp_path / "startup.log"))
+
+class TestReadiness():
+
+    @pytest.mark.asyncio
+    async def test_wait_for_path_wakes_on_creation(self, tmp_path):
+        # Arrange
+        path = tmp_path / "system_bus_socket"
+        asyncio.get_running_loop().call_later(0.1, path.write_text, "")
+
+        # Act
+        started = time.monotonic()
+        await wait_for_path(str(path), timeout=5)
+
+        # Assert
+        assert path.exists()
+        assert time.monotonic() - started < 1
+
+    @pytest.mark.asyncio
+    async def test_wait_for_path_times_out(self, tmp_path):
+        # Act & Assert
+        with pytest.raises(ReadinessTimeout):
+            await wait_for_path(str(tmp_path / "never"), timeout=0.1)
+
+    @pytest.mark.asyncio
+    async def test_wait_for_port_returns_once_listening(self):
+        # Arrange
+        servers = []
+
+        async def listen():
+            servers.append(await asyncio.start_server(lambda reader, writer: writer.close(), "localhost", port))
+
+        probe = await asyncio.start_server(lambda reader, writer: writer.close(), "localhost", 0)
+        port = probe.sockets[0].getsockname()[1]
+        probe.close()
+        await probe.wait_closed()
+        asyncio.get_running_loop().call_later(0.1, lambda: asyncio.ensure_future(listen()))
+
+        # Act
+        await wait_for_port("localhost", port, timeout=5)
+
+        # Assert
+        assert servers
+        servers[0].close()
+        await servers[0].wait_closed()
+
+class TestDependencies():
+
+    @pytest.mark.asyncio
+    async def test_install_is_skipped_while_lockfile_is_unchanged(self, tmp_path):
+        # Arrange
+        lockfile = tmp_path / "Pipfile.lock"
+        lockfile.write_text('{"default": {}}')
+        stamp = str(tmp_path / "state" / "deps.sha256")
+        marker = tmp_path / "installs"
+        command = (sys.executable, "-c", f"open({str(marker)!r}, 'a').write('x')")
+
+        # Act
+        first = await ensure_dependencies(str(lockfile), False, stamp, command)
+        second = await ensure_dependencies(str(lockfile), False, stamp, command)
+        dev = await ensure_dependencies(str(lockfile), True, stamp, command)
+        lockfile.write_text('{"default": {"aiohttp": {}}}')
+        changed = await ensure_dependencies(str(lockfile), True, stamp, command)
+
+        # Assert
+        assert (first, second, dev, changed) == (True, False, True, True)
+        assert marker.read_text() == "xxx"
+
+    @pytest.mark.asyncio
+    async def test_failed_install_does_not_write_stamp(self, tmp_path):
+        # Arrange
+        lockfile = tmp_path / "Pipfile.lock"
+        lockfile.write_text("{}")
+        stamp = str(tmp_path / "deps.sha256")
+
+        # Act & Assert
+        with pytest.raises(BootstrapError):
+            await ensure_dependencies(str(lockfile), False, stamp, (sys.executable, "-c", "raise SystemExit(1)"))
+        assert not os.path.exists(stamp)
+        write_stamp(str(lockfile), False, stamp)
+        assert await ensure_dependencies(str(lockfile), False, stamp, ("false",)) is False
@@ -5,7 +5,8 @@ import string
 import re
 import hashlib
 from keyring.backend import KeyringBackend
-from keyring.errors import KeyringError, PasswordSetError
+from keyring.backends import SecretService
+from keyring.errors import KeyringError, KeyringLocked, PasswordSetError
 from hypothesis import given, strategies as st
 from configuration.config_manager import ConfigManager, PasswordGetError
 
@@ -64,6 +65,114 @@ class ErrorRaisingKeyringBackend(KeyringBackend):
     def delete_password(self, service_name, username):
         raise KeyringError("Simulated error in delete_password")
 
+class ClosingConnection():
+    """D-Bus connection stand-in, refuses calls once closed"""
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+class Collection():
+    """Secret Service collection stand-in bound to the connection it was opened on"""
+    def __init__(self, items: dict):
+        self.connection = ClosingConnection()
+        self._items = items
+
+    @property
+    def items(self) -> dict:
+        if self.connection.closed:
+            raise KeyringError("connection closed")
+        return self._items
+
+class CollectionKeyringBackend(MockKeyringBackend):
+    """
+    Mock of a collection based keyring such as Secret Service. Like keyring's backend every
+    operation opens the collection and closes its connection with closing(collection.connection).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.collections = []
+
+    def get_preferred_collection(self):
+        collection = Collection(self.passwords)
+        self.collections.append(collection)
+        return collection
+
+    def set_password(self, service_name, username, password):
+        collection = self.get_preferred_collection()
+        with contextlib.closing(collection.connection):
+            if username == "locked":
+                raise KeyringError("Simulated locked item")
+            collection.items[(service_name, username)] = password
+
+    def get_password(self, service_name, username):
+        collection = self.get_preferred_collection()
+        with contextlib.closing(collection.connection):
+            if username == "locked":
+                raise KeyringError("Simulated locked item")
+            return collection.items.get((service_name, username))
+
+    def delete_password(self, service_name, username):
+        collection = self.get_preferred_collection()
+        with contextlib.closing(collection.connection):
+            if (service_name, username) not in collection.items:
+                raise keyring.errors.PasswordDeleteError("Password not found!")
+            del collection.items[(service_name, username)]
+
+class SecretItem():
+    def __init__(self, backend, attributes: dict, secret: str):
+        self.backend = backend
+        self.attributes = attributes
+        self.secret = secret
+
+    def is_locked(self) -> bool:
+        return False
+
+    def get_secret(self) -> bytes:
+        return self.secret.encode()
+
+    def delete(self):
+        self.backend.items.remove(self)
+
+class SecretCollection():
+    """secretstorage Collection stand-in, refuses calls once its connection is closed"""
+    def __init__(self, backend):
+        self.connection = ClosingConnection()
+        self.backend = backend
+
+    def search_items(self, attributes: dict) -> list:
+        if self.connection.closed:
+            raise KeyringError("connection closed")
+        return [item for item in list(self.backend.items)
+                if all(item.attributes.get(key) == value for key, value in attributes.items())]
+
+    def create_item(self, label: str, attributes: dict, secret: str, replace: bool = False):
+        if replace:
+            for item in self.search_items(attributes):
+                item.delete()
+        elif self.connection.closed:
+            raise KeyringError("connection closed")
+        self.backend.items.append(SecretItem(self.backend, dict(attributes), secret))
+
+class SecretServiceBackend(SecretService.Keyring):
+    """keyring's Secret Service backend with its collections kept in memory instead of behind D-Bus"""
+    priority = 1
+
+    def __init__(self, locked: bool = False):
+        super().__init__()
+        self.items = []
+        self.collections = []
+        self.locked = locked
+
+    def get_preferred_collection(self):
+        if self.locked:
+            raise KeyringLocked("Failed to unlock the collection!")
+        collection = SecretCollection(self)
+        self.collections.append(collection)
+        return collection
+
 @contextlib.contextmanager
 def keyring_context(backend_instance: KeyringBackend):
     original_backend = keyring.get_keyring()
@@ -266,3 +375,83 @@ def test_appropiate_errors_raised(credentials):
 
         
 
+
+def test_batched_operations_cover_every_key():
+    with keyring_context(CollectionKeyringBackend()) as mock_keyring:
+        # Arrange
+        config = ConfigManager()
+        credentials = {
+            ("emercoin", "wallet1"): "secret1",
+            ("emercoin", "wallet2"): "secret2",
+            ("plugin", "wallet1"): "secret3",
+        }
+
+        # Act
+        saved = config.set_many(credentials)
+        loaded = config.get_many(credentials.keys())
+        deleted = config.delete_many(credentials.keys())
+
+        # Assert
+        assert saved.ok and loaded.ok and deleted.ok
+        assert loaded.values == credentials
+        assert mock_keyring.passwords == {}
+        assert len(mock_keyring.collections) == 9
+        assert all(collection.connection.closed for collection in mock_keyring.collections)
+
+def test_batched_operations_report_failures_per_key():
+    with keyring_context(CollectionKeyringBackend()) as mock_keyring:
+        # Arrange
+        config = ConfigManager()
+        credentials = {("emercoin", "wallet1"): "secret1", ("emercoin", "locked"): "secret2"}
+
+        # Act
+        saved = config.set_many(credentials)
+        loaded = config.get_many(credentials.keys())
+        deleted = config.delete_many([("emercoin", "wallet1"), ("emercoin", "missing")])
+
+        # Assert
+        assert saved.values == {("emercoin", "wallet1"): True}
+        assert isinstance(saved.errors[("emercoin", "locked")], PasswordSetError)
+        assert loaded.values == {("emercoin", "wallet1"): "secret1"}
+        assert "Retriving the password for locked failed" in str(loaded.errors[("emercoin", "locked")])
+        assert list(deleted.errors) == [("emercoin", "missing")]
+        assert "secret2" not in str(saved.errors[("emercoin", "locked")])
+
+def test_batched_operations_share_one_secret_service_session_per_service():
+    with keyring_context(SecretServiceBackend()) as mock_keyring:
+        # Arrange
+        config = ConfigManager()
+        credentials = {
+            ("emercoin", "wallet1"): "secret1",
+            ("emercoin", "wallet2"): "secret2",
+            ("emercoin", "wallet3"): "secret3",
+            ("plugin", "wallet1"): "secret4",
+        }
+
+        # Act
+        saved = config.set_many(credentials)
+        loaded = config.get_many(credentials.keys())
+        single = keyring.get_password("emercoin", "wallet2")
+        deleted = config.delete_many([("emercoin", "wallet1"), ("emercoin", "missing")])
+
+        # Assert
+        assert saved.ok and loaded.ok
+        assert loaded.values == credentials
+        assert single == "secret2"
+        assert deleted.values == {("emercoin", "wallet1"): True}
+        assert isinstance(deleted.errors[("emercoin", "missing")], keyring.errors.PasswordDeleteError)
+        assert len(mock_keyring.collections) == 2 + 2 + 1 + 1
+        assert all(collection.connection.closed for collection in mock_keyring.collections)
+
+def test_batched_operations_report_a_locked_collection_for_every_key():
+    with keyring_context(SecretServiceBackend(locked=True)):
+        # Arrange
+        config = ConfigManager()
+
+        # Act
+        loaded = config.get_many([("emercoin", "wallet1"), ("emercoin", "wallet2")])
+
+        # Assert
+        assert loaded.values == {}
+        assert set(loaded.errors) == {("emercoin", "wallet1"), ("emercoin", "wallet2")}
+        assert "Failed to unlock the collection" in str(loaded.errors[("emercoin", "wallet1")])
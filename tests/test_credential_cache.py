@@ -0,0 +1,177 @@
+import os
+import pytest
+import keyring
+from keyring.backend import KeyringBackend
+from hypothesis import given, settings, HealthCheck, strategies as st
+from configuration.config_manager import ConfigManager
+from configuration.credential_cache import CredentialCache, CredentialCacheError
+
+class CountingKeyringBackend(KeyringBackend):
+    """Mock keyring that counts round trips"""
+    priority = 1
+
+    def __init__(self):
+        self.passwords = {}
+        self.reads = 0
+
+    def set_password(self, service_name, username, password):
+        self.passwords[(service_name, username)] = password
+
+    def get_password(self, service_name, username):
+        self.reads += 1
+        return self.passwords.get((service_name, username))
+
+    def delete_password(self, service_name, username):
+        if (service_name, username) not in self.passwords:
+            raise keyring.errors.PasswordDeleteError("Password not found!")
+        del self.passwords[(service_name, username)]
+
+@pytest.fixture
+def hmac_key_path(tmp_path):
+    path = tmp_path / "hmac_key"
+    path.write_bytes(os.urandom(32))
+    return str(path)
+
+@pytest.fixture
+def backend():
+    original_backend = keyring.get_keyring()
+    mock_backend = CountingKeyringBackend()
+    keyring.set_keyring(mock_backend)
+    yield mock_backend
+    keyring.set_keyring(original_backend)
+
+class TestCredentialCache():
+
+    def test_hits_skip_the_keyring(self, backend, hmac_key_path):
+        # Arrange
+        cache = CredentialCache(ConfigManager(), ttl=60, hmac_key_path=hmac_key_path)
+        cache.save_emercoin_login("rpcuser", "rpc secret")
+
+        # Act
+        results = [cache.load_emercoin_login("rpcuser") for _ in range(5)]
+
+        # Assert
+        assert results == ["rpc secret"] * 5
+        assert backend.reads == 1
+        assert cache.get_info()["hits"] == 4
+
+    def test_secrets_are_not_stored_in_plaintext(self, backend, hmac_key_path):
+        # Arrange
+        cache = CredentialCache(ConfigManager(), hmac_key_path=hmac_key_path)
+        cache.save_emercoin_login("rpcuser", "rpc secret")
+
+        # Act
+        cache.load_emercoin_login("rpcuser")
+
+        # Assert
+        assert all(b"rpc secret" not in part for part in cache._entries["rpcuser"][1:])
+
+    def test_expired_entries_are_reloaded(self, backend, hmac_key_path):
+        # Arrange
+        cache = CredentialCache(ConfigManager(), ttl=0, hmac_key_path=hmac_key_path)
+        cache.save_emercoin_login("rpcuser", "rpc secret")
+
+        # Act
+        cache.load_emercoin_login("rpcuser")
+        cache.load_emercoin_login("rpcuser")
+
+        # Assert
+        assert backend.reads == 2
+
+    def test_reset_and_remove_invalidate(self, backend, hmac_key_path):
+        # Arrange
+        cache = CredentialCache(ConfigManager(), ttl=60, hmac_key_path=hmac_key_path)
+        cache.save_emercoin_login("rpcuser", "old secret")
+        cache.load_emercoin_login("rpcuser")
+
+        # Act
+        cache.reset_emercoin_login("rpcuser", "new secret")
+        after_reset = cache.load_emercoin_login("rpcuser")
+        cache.remove_emercoin_password("rpcuser")
+        after_remove = cache.load_emercoin_login("rpcuser")
+
+        # Assert
+        assert after_reset == "new secret"
+        assert after_remove is None
+
+    def test_batched_writes_invalidate(self, backend, hmac_key_path):
+        # Arrange
+        config_manager = ConfigManager()
+        cache = CredentialCache(config_manager, ttl=60, hmac_key_path=hmac_key_path)
+        cache.save_emercoin_login("rpcuser", "old secret")
+        cache.save_emercoin_login("other", "other secret")
+        cache.load_emercoin_login("rpcuser")
+        cache.load_emercoin_login("other")
+
+        # Act
+        config_manager.set_many({("emercoin", "rpcuser"): "new secret", ("plugin", "other"): "plugin secret"})
+        after_set = cache.load_emercoin_login("rpcuser")
+        other = cache.load_emercoin_login("other")
+        config_manager.delete_many([("emercoin", "rpcuser")])
+        after_delete = cache.load_emercoin_login("rpcuser")
+
+        # Assert
+        assert after_set == "new secret"
+        assert after_delete is None
+        assert other == "other secret"
+        assert cache.get_info()["hits"] == 1
+
+    def test_direct_writes_through_the_manager_invalidate(self, backend, hmac_key_path):
+        # Arrange
+        config_manager = ConfigManager()
+        cache = CredentialCache(config_manager, ttl=60, hmac_key_path=hmac_key_path)
+        config_manager.save_emercoin_login("rpcuser", "old secret")
+        cache.load_emercoin_login("rpcuser")
+
+        # Act
+        config_manager.save_emercoin_login("rpcuser", "saved secret")
+        after_save = cache.load_emercoin_login("rpcuser")
+        config_manager.reset_emercoin_login("rpcuser", "reset secret")
+        after_reset = cache.load_emercoin_login("rpcuser")
+        config_manager.remove_emercoin_password("rpcuser")
+        after_remove = cache.load_emercoin_login("rpcuser")
+
+        # Assert
+        assert after_save == "saved secret"
+        assert after_reset == "reset secret"
+        assert after_remove is None
+        assert cache.get_info()["hits"] == 0
+
+    def test_tampered_entry_is_rejected(self, backend, hmac_key_path):
+        # Arrange
+        cache = CredentialCache(ConfigManager(), ttl=60, hmac_key_path=hmac_key_path)
+        cache.save_emercoin_login("rpcuser", "rpc secret")
+        cache.load_emercoin_login("rpcuser")
+        expires, nonce, ciphertext = cache._entries["rpcuser"]
+        cache._entries["rpcuser"] = (expires, nonce, bytes([ciphertext[0] ^ 1]) + ciphertext[1:])
+        cache._entries["other"] = (expires, nonce, ciphertext)
+
+        # Act & Assert
+        with pytest.raises(CredentialCacheError):
+            cache.load_emercoin_login("rpcuser")
+        with pytest.raises(CredentialCacheError):
+            cache.load_emercoin_login("other")
+
+    def test_missing_hmac_key_fails_closed(self, monkeypatch):
+        # Arrange
+        monkeypatch.delenv("HMAC_KEY_PATH", raising=False)
+
+        # Act & Assert
+        with pytest.raises(CredentialCacheError):
+            CredentialCache(ConfigManager())
+        with pytest.raises(CredentialCacheError):
+            CredentialCache(ConfigManager(), hmac_key_path="/invalid/path/hmac_key")
+
+    @settings(suppress_health_check=[HealthCheck.function_scoped_fixture])
+    @given(password=st.text(min_size=1))
+    def test_round_trip(self, backend, hmac_key_path, password):
+        # Arrange
+        cache = CredentialCache(ConfigManager(), ttl=60, hmac_key_path=hmac_key_path)
+        cache.save_emercoin_login("rpcuser", password)
+
+        # Act
+        cache.load_emercoin_login("rpcuser")
+        result = cache.load_emercoin_login("rpcuser")
+
+        # Assert
+        assert result == password
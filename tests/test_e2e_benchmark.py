@@ -0,0 +1,142 @@
+import json
+import pytest
+import pytest_asyncio
+from benchmarks.e2e import E2eBenchmark, compare, format_report, parse_mix
+from benchmarks.fakes import FakeEmercoinNode, FakeIpfsNode, FakeSigner
+from emercoin.rpc_client import EmercoinRpcClient, EmercoinRpcError
+from identity.ipfs import IpfsClient, IpfsError
+
+@pytest_asyncio.fixture
+async def ipfs():
+    node = FakeIpfsNode()
+    await node.start()
+    client = IpfsClient(node.url)
+    yield node, client
+    await client.close()
+    await node.stop()
+
+@pytest_asyncio.fixture
+async def emercoin():
+    node = FakeEmercoinNode({"dns:example.coin": "{}"})
+    await node.start()
+    client = EmercoinRpcClient(node.url, "user", "password")
+    yield node, client
+    await client.close()
+    await node.stop()
+
+class TestFakes():
+
+    @pytest.mark.asyncio
+    async def test_ipfs_add_then_cat_round_trips(self, ipfs):
+        # Arrange
+        node, client = ipfs
+
+        # Act
+        cid = await client.add(b"snapshot bytes", filename="db.bgsnap")
+        data = await client.cat(cid)
+
+        # Assert
+        assert cid.startswith("bafkrei")
+        assert data == b"snapshot bytes"
+        assert node.added_bytes == len(b"snapshot bytes")
+
+    @pytest.mark.asyncio
+    async def test_ipfs_cat_of_unknown_cid_raises(self, ipfs):
+        # Arrange
+        _, client = ipfs
+
+        # Act / Assert
+        with pytest.raises(IpfsError):
+            await client.cat("bafkreinotthere")
+
+    @pytest.mark.asyncio
+    async def test_name_update_changes_what_name_show_returns(self, emercoin):
+        # Arrange
+        node, client = emercoin
+        value = json.dumps({"cid": "bafkreitest", "merkle_root": "ab" * 32})
+
+        # Act
+        txid = await client.name_update("dns:example.coin", value)
+        record = await client.name_show("dns:example.coin")
+
+        # Assert
+        assert len(txid) == 64
+        assert record["value"] == value
+        assert node.transactions == [("name_update", "dns:example.coin", value, txid)]
+
+    @pytest.mark.asyncio
+    async def test_name_update_of_unknown_name_fails(self, emercoin):
+        # Arrange
+        _, client = emercoin
+
+        # Act / Assert
+        with pytest.raises(EmercoinRpcError) as error:
+            await client.name_update("dns:other.coin", "{}")
+        assert error.value.code == -4
+
+    @pytest.mark.asyncio
+    async def test_fake_signer_signatures_verify(self):
+        # Arrange
+        signer = FakeSigner()
+        row_hashes = ["aa" * 32, "bb" * 32]
+
+        # Act
+        signatures = await signer.sign_row_hashes(row_hashes)
+        root, root_signature = await signer.sign_merkle_root(row_hashes)
+
+        # Assert
+        assert all(signer.verify(row_hash, signature) for row_hash, signature in zip(row_hashes, signatures))
+        assert signer.verify(root, root_signature)
+        assert not signer.verify(root, signatures[0])
+        assert signer.get_stats()["signatures"] == 3
+
+class TestE2eBenchmark():
+
+    @pytest.mark.asyncio
+    async def test_smoke_run_exercises_every_operation(self, tmp_path):
+        # Arrange
+        benchmark = E2eBenchmark(str(tmp_path), mix={"register": 1, "lookup": 1, "verify": 1, "republish": 1},
+                                 rate=100, duration=0.5, identities=50, sign_delay=0, seed=7)
+
+        # Act
+        report = await benchmark.run()
+
+        # Assert
+        assert report["operations"] == 50
+        assert report["errors"] == {"register": 0, "lookup": 0, "verify": 0, "republish": 0}
+        assert all(report["counts"].values())
+        for stage in ("register.sign", "register.insert", "lookup.http", "verify.proof",
+                      "republish.snapshot", "republish.ipfs_add", "republish.name_update"):
+            assert report["stages"][stage]["count"] > 0
+            assert report["stages"][stage]["p99_ms"] >= report["stages"][stage]["p50_ms"]
+        assert report["services"]["name_updates"] == report["counts"]["republish"]
+        assert report["services"]["identities"] == 50 + report["counts"]["register"]
+        published = json.loads(benchmark.node.names["dns:example.coin"])
+        assert published["cid"] in benchmark.ipfs.blocks
+        assert "republish.name_update" in format_report(report)
+
+    def test_compare_flags_slower_stages_and_lower_throughput(self):
+        # Arrange
+        baseline = {"throughput": 100.0, "stages": {"lookup": {"p50_ms": 2.0, "p99_ms": 10.0},
+                                                    "verify.proof": {"p50_ms": 0.02, "p99_ms": 0.04}}}
+        report = {"throughput": 80.0, "stages": {"lookup": {"p50_ms": 2.1, "p99_ms": 20.0},
+                                                 "verify.proof": {"p50_ms": 0.05, "p99_ms": 0.09},
+                                                 "register": {"p50_ms": 5.0, "p99_ms": 9.0}}}
+
+        # Act
+        regressions = compare(report, baseline)
+
+        # Assert
+        assert regressions == [("throughput", 100.0, 80.0), ("lookup p99_ms", 10.0, 20.0)]
+        assert compare(baseline, baseline) == []
+
+    def test_parse_mix(self):
+        # Act
+        mix = parse_mix("register=0.2, lookup=0.8,verify")
+
+        # Assert
+        assert mix == {"register": 0.2, "lookup": 0.8, "verify": 1.0}
+        with pytest.raises(ValueError):
+            parse_mix("register=1,delete=1")
+        with pytest.raises(ValueError):
+            parse_mix("lookup=0")
@@ -0,0 +1,112 @@
+import json
+import pytest
+from hypothesis import given, strategies as st
+from messaging import envelope
+from messaging.envelope import IdentityEvent, NvsUpdateEvent, EnvelopeError
+
+digests = st.binary(min_size=32, max_size=32)
+
+class TestEnvelope():
+
+    @given(address=st.text(max_size=200), pubkey=digests, tpm_key=st.binary(max_size=500),
+           tpm_key_hash=digests, tpm_enable=st.booleans())
+    def test_identity_round_trip(self, address, pubkey, tpm_key, tpm_key_hash, tpm_enable):
+        # Arrange
+        event = IdentityEvent(address, pubkey, tpm_key, tpm_key_hash, tpm_enable)
+
+        # Act
+        decoded = envelope.decode(envelope.encode(event))
+
+        # Assert
+        assert decoded.address == address
+        assert bytes(decoded.pubkey) == pubkey
+        assert bytes(decoded.tpm_key) == tpm_key
+        assert bytes(decoded.tpm_key_hash) == tpm_key_hash
+        assert decoded.tpm_enable == tpm_enable
+
+    @given(domain=st.text(max_size=200), cid=st.text(max_size=100), merkle_root=digests,
+           days=st.integers(min_value=0, max_value=2**32 - 1))
+    def test_nvs_update_round_trip(self, domain, cid, merkle_root, days):
+        # Arrange
+        event = NvsUpdateEvent(domain, cid, merkle_root, days)
+
+        # Act
+        decoded = envelope.decode(envelope.encode(event))
+
+        # Assert
+        assert decoded.to_dict() == event.to_dict()
+
+    def test_binary_fields_are_views_of_the_buffer(self):
+        # Arrange
+        buffer = bytearray(envelope.encode(IdentityEvent("a@b.coin", bytes(32), b"key", bytes(32))))
+
+        # Act
+        decoded = envelope.decode(buffer)
+        buffer[-3:] = b"KEY"
+
+        # Assert
+        assert isinstance(decoded.pubkey, memoryview)
+        assert bytes(decoded.tpm_key) == b"KEY"
+
+    def test_dict_form_matches_json_events(self):
+        # Arrange
+        event = {
+            "type": "identity",
+            "address": "a@b.coin",
+            "pubkey": "ab" * 32,
+            "TPM_key": "LS0t",
+            "TPM_key_hash": "cd" * 32,
+            "TPM_enable": True,
+        }
+
+        # Act
+        decoded = envelope.decode(envelope.encode(IdentityEvent.from_dict(event)))
+
+        # Assert
+        assert decoded.to_dict() == event
+
+    @given(tpm_key=st.binary(max_size=500))
+    def test_dict_form_round_trips_any_tpm_key(self, tpm_key):
+        # Arrange
+        event = IdentityEvent("a@b.coin", bytes(32), tpm_key, bytes(32))
+
+        # Act
+        as_dict = json.loads(json.dumps(event.to_dict()))
+        restored = IdentityEvent.from_dict(as_dict)
+
+        # Assert
+        assert bytes(restored.tpm_key) == tpm_key
+
+    def test_non_utf8_tpm_key_is_base64_in_dict_form(self):
+        # Arrange
+        event = envelope.decode(envelope.encode(IdentityEvent("a@b.coin", bytes(32), b"\xff\xfe", bytes(32))))
+
+        # Act
+        as_dict = event.to_dict()
+
+        # Assert
+        assert as_dict["TPM_key"] == "//4="
+        assert as_dict["TPM_key_encoding"] == "base64"
+
+    def test_events_use_slots(self):
+        # Arrange
+        event = NvsUpdateEvent("b.coin", "Qm", bytes(32))
+
+        # Act & Assert
+        with pytest.raises(AttributeError):
+            event.extra = True
+
+    def test_invalid_envelopes_are_rejected(self):
+        # Arrange
+        valid = envelope.encode(NvsUpdateEvent("b.coin", "Qm", bytes(32)))
+        future_version = envelope.HEADER.pack(envelope.MAGIC, envelope.VERSION + 1, 2) + valid[4:]
+        unknown_type = envelope.HEADER.pack(envelope.MAGIC, envelope.VERSION, 99) + valid[4:]
+
+        # Act & Assert
+        for data in (b"", b"{}", valid[:-1], valid[:10], future_version, unknown_type):
+            with pytest.raises(EnvelopeError):
+                envelope.decode(data)
+        with pytest.raises(EnvelopeError):
+            envelope.encode(NvsUpdateEvent("b.coin", "Qm", bytes(31)))
+        with pytest.raises(EnvelopeError):
+            envelope.encode({"type": "identity"})
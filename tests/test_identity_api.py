@@ -0,0 +1,271 @@
+import asyncio
+import sqlite3
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from emercoin.rpc_client import EmercoinRpcClient, EmercoinRpcError
+from identity.api import IdentityApi
+from identity.merkle import db_root_row_hash, merkle_root, verify_proof
+from identity.publisher import update_merkle_roots
+from identity.resolver import EmercoinResolver
+from identity.store import IdentityStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS address_keys (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    address TEXT NOT NULL,
+    pubkey TEXT NOT NULL,
+    TPM_key TEXT,
+    TPM_key_hash BLOB,
+    TPM_enable BOOLEAN DEFAULT 0,
+    row_hash BLOB
+);
+CREATE TABLE IF NOT EXISTS db_root (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    table_name TEXT NOT NULL,
+    root BLOB NOT NULL,
+    row_hash BLOB
+);
+"""
+
+def register(db_path: str, address: str, pubkey: str, tpm: bool = False):
+    connection = sqlite3.connect(db_path)
+    with connection:
+        connection.execute(
+            "INSERT INTO address_keys (address, pubkey, TPM_key, TPM_key_hash, TPM_enable) VALUES (?, ?, ?, ?, ?)",
+            (address, pubkey, "LS0t" if tpm else "", "ab" * 32 if tpm else "", int(tpm))
+        )
+    connection.close()
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "identities.tmp")
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    connection.close()
+    for i in range(5):
+        register(path, f"user{i}@example.coin", f"{i:02x}" * 32, tpm=i % 2 == 0)
+    return path
+
+class FakeEmercoinNode():
+    """Answers name_show like emercoind, dns:published.coin is the only registered name"""
+    def __init__(self):
+        self.calls = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        payload = await request.json()
+        if payload["params"] == ["dns:published.coin"]:
+            value = '{"cid":"QmTest","merkle_root":"' + "cd" * 32 + '"}'
+            return web.json_response({"result": {"name": "dns:published.coin", "value": value}, "error": None, "id": payload["id"]})
+        return web.json_response({"result": None, "error": {"code": -4, "message": "failed to read from name DB"},
+                                  "id": payload["id"]}, status=500)
+
+@pytest_asyncio.fixture
+async def node():
+    fake = FakeEmercoinNode()
+    app = web.Application()
+    app.router.add_post("/", fake.handle)
+    server = TestServer(app)
+    await server.start_server()
+    client = EmercoinRpcClient(str(server.make_url("/")), "user", "password")
+    yield fake, client
+    await client.close()
+    await server.close()
+
+@pytest_asyncio.fixture
+async def api(db_path, node):
+    _, rpc_client = node
+    store = IdentityStore(db_path)
+    client = TestClient(TestServer(IdentityApi(store, EmercoinResolver(rpc_client)).create_app()))
+    await client.start_server()
+    yield client
+    await client.close()
+    store.close()
+
+class TestIdentityApi():
+
+    @pytest.mark.asyncio
+    async def test_lookup_returns_pubkey_and_valid_proof(self, api):
+        # Act
+        response = await api.get("/v1/identity/user3@example.coin")
+        body = await response.json()
+
+        # Assert
+        assert response.status == 200
+        assert body["pubkey"] == "03" * 32
+        assert body["tpm_enable"] is False
+        assert verify_proof(body["row_hash"], body["proof"], body["root"])
+        assert response.headers["ETag"]
+
+    @pytest.mark.asyncio
+    async def test_matching_etag_revalidates_without_body(self, api, db_path):
+        # Arrange
+        first = await api.get("/v1/identity/user1@example.coin")
+        etag = first.headers["ETag"]
+
+        # Act
+        cached = await api.get("/v1/identity/user1@example.coin", headers={"If-None-Match": etag})
+        register(db_path, "late@example.coin", "ff" * 32)
+        changed = await api.get("/v1/identity/user1@example.coin", headers={"If-None-Match": etag})
+
+        # Assert
+        assert cached.status == 304
+        assert await cached.read() == b""
+        assert changed.status == 200
+        assert changed.headers["ETag"] != etag
+        assert (await changed.json())["root"] != (await first.json())["root"]
+
+    @pytest.mark.asyncio
+    async def test_if_none_match_compares_whole_tags(self, api):
+        # Arrange
+        first = await api.get("/v1/identity/user1@example.coin")
+        etag = first.headers["ETag"]
+
+        # Act
+        listed = await api.get("/v1/identity/user1@example.coin", headers={"If-None-Match": f'"other", W/{etag}'})
+        wildcard = await api.get("/v1/identity/user1@example.coin", headers={"If-None-Match": "*"})
+        enclosing = await api.get("/v1/identity/user1@example.coin", headers={"If-None-Match": f'"v2{etag}"'})
+
+        # Assert
+        assert (listed.status, wildcard.status) == (304, 304)
+        assert enclosing.status == 200
+
+    @pytest.mark.asyncio
+    async def test_batch_lookup(self, api):
+        # Act
+        response = await api.post("/v1/identities:lookup",
+                                  json={"addresses": ["user0@example.coin", "user4@example.coin", "nobody@example.coin"]})
+        body = await response.json()
+
+        # Assert
+        assert response.status == 200
+        assert body["results"]["nobody@example.coin"] is None
+        for address in ("user0@example.coin", "user4@example.coin"):
+            result = body["results"][address]
+            assert verify_proof(result["row_hash"], result["proof"], body["root"])
+
+    @pytest.mark.asyncio
+    async def test_bad_batch_requests_are_rejected(self, api):
+        # Act
+        missing = await api.post("/v1/identities:lookup", json={"names": []})
+        wrong_type = await api.post("/v1/identities:lookup", json={"addresses": [1, 2]})
+        too_large = await api.post("/v1/identities:lookup", json={"addresses": ["a"] * 1001})
+
+        # Assert
+        assert (missing.status, wrong_type.status, too_large.status) == (400, 400, 413)
+
+    @pytest.mark.asyncio
+    async def test_unknown_identity_points_at_published_database(self, api, node):
+        # Arrange
+        fake, _ = node
+
+        # Act
+        published = await asyncio.gather(*(api.get("/v1/identity/alice@published.coin") for _ in range(3)))
+        unknown = await api.get("/v1/identity/bob@unregistered.coin")
+
+        # Assert
+        assert all(response.status == 404 for response in published)
+        assert (await published[0].json())["published"]["cid"] == "QmTest"
+        assert "published" not in await unknown.json()
+        assert fake.calls == 2
+
+class TestIdentityStore():
+
+    def test_root_matches_table(self, db_path):
+        # Arrange
+        store = IdentityStore(db_path)
+
+        # Act
+        store.refresh()
+        leaves = [store.lookup(f"user{i}@example.coin")["row_hash"] for i in range(5)]
+
+        # Assert
+        assert store.root == merkle_root(leaves)
+        assert len(store) == 5
+        assert store.refresh() is False
+        store.close()
+
+    def test_reload_hashes_only_new_rows(self, db_path, monkeypatch):
+        # Arrange
+        store = IdentityStore(db_path)
+        store.refresh()
+        hashed = []
+        monkeypatch.setattr("identity.store.address_keys_row_hash", lambda *row: hashed.append(row[0]) or "ab" * 32)
+        register(db_path, "late@example.coin", "ff" * 32)
+
+        # Act
+        reloaded = store.refresh()
+
+        # Assert
+        assert reloaded
+        assert hashed == ["late@example.coin"]
+        assert len(store) == 6
+        store.close()
+
+    def test_deleted_rows_reload_the_table(self, db_path):
+        # Arrange
+        store = IdentityStore(db_path)
+        store.refresh()
+        connection = sqlite3.connect(db_path)
+        with connection:
+            connection.execute("DELETE FROM address_keys WHERE address = 'user1@example.coin'")
+        connection.close()
+        register(db_path, "late@example.coin", "ff" * 32)
+
+        # Act
+        store.refresh()
+        leaves = [store.lookup(address)["row_hash"] for address in
+                  ("user0@example.coin", "user2@example.coin", "user3@example.coin", "user4@example.coin", "late@example.coin")]
+
+        # Assert
+        assert store.lookup("user1@example.coin") is None
+        assert store.root == merkle_root(leaves)
+        store.close()
+
+    @pytest.mark.asyncio
+    async def test_root_proof_leads_to_the_published_db_root(self, api, db_path):
+        # Arrange
+        connection = sqlite3.connect(db_path)
+        connection.execute("CREATE TABLE tpm_domain_settings (id INTEGER PRIMARY KEY AUTOINCREMENT, domain TEXT, "
+                           "TPM_enable BOOLEAN DEFAULT 0, row_hash BLOB)")
+        connection.close()
+        published_root = update_merkle_roots(db_path)
+
+        # Act
+        published = await (await api.get("/v1/identity/user2@example.coin")).json()
+        register(db_path, "late@example.coin", "ff" * 32)
+        unpublished = await (await api.post("/v1/identities:lookup", json={"addresses": ["user2@example.coin"]})).json()
+
+        # Assert
+        assert published["db_root"] == published_root
+        assert verify_proof(published["row_hash"], published["proof"], published["root"])
+        assert verify_proof(db_root_row_hash("address_keys", published["root"]), published["db_root_proof"], published_root)
+        assert unpublished["db_root"] == published_root
+        assert unpublished["db_root_proof"] is None
+
+class TestEmercoinRpcClient():
+
+    @pytest.mark.asyncio
+    async def test_name_show(self, node):
+        # Arrange
+        _, client = node
+
+        # Act
+        record = await client.name_show("dns:published.coin")
+        missing = await client.name_show("dns:unregistered.coin")
+
+        # Assert
+        assert record["name"] == "dns:published.coin"
+        assert missing is None
+
+    @pytest.mark.asyncio
+    async def test_unreachable_node_raises(self):
+        # Arrange
+        client = EmercoinRpcClient("http://127.0.0.1:9", "user", "password", timeout=1)
+
+        # Act & Assert
+        with pytest.raises(EmercoinRpcError):
+            await client.call("getinfo")
+        await client.close()
@@ -0,0 +1,116 @@
+import hashlib
+import subprocess
+import shutil
+import pytest
+from hypothesis import given, settings, strategies as st
+from identity.merkle import (address_keys_row_hash, combine, merkle_levels, merkle_proof, merkle_root,
+                            merkle_update, row_hash, verify_proof)
+
+hex_hashes = st.lists(st.binary(min_size=32, max_size=32).map(bytes.hex), max_size=40)
+
+def shell_merkle_root(hashes: list) -> str:
+    """Runs the hashing loop of build_table_merkle from cli/brunnen-cli.sh"""
+    script = r'''
+    temp_file=$(mktemp)
+    cat > "$temp_file"
+    while [ $(wc -l < "$temp_file") -gt 1 ]; do
+        if [ $(($(wc -l < "$temp_file") % 2)) -eq 1 ]; then
+            tail -1 "$temp_file" >> "$temp_file"
+        fi
+        awk 'NR%2==1{h1=$0; getline h2; print h1 h2}' "$temp_file" | \
+        while read combined; do
+            echo -n "$combined" | sha256sum | cut -d' ' -f1
+        done > "${temp_file}.new"
+        mv "${temp_file}.new" "$temp_file"
+    done
+    cat "$temp_file"
+    rm -f "$temp_file"
+    '''
+    return subprocess.run(["bash", "-c", script], input="".join(h + "\n" for h in hashes),
+                          capture_output=True, text=True, check=True).stdout.strip()
+
+class TestMerkle():
+
+    def test_row_hash_matches_cli_concatenation(self):
+        # Arrange
+        expected = hashlib.sha256(b"alice@example.coin|abcd|||1").hexdigest()
+
+        # Act
+        result = address_keys_row_hash("alice@example.coin", "abcd", None, None, True)
+
+        # Assert
+        assert result == expected
+        assert row_hash("example.coin", 0) == hashlib.sha256(b"example.coin|0").hexdigest()
+
+    def test_odd_levels_repeat_the_last_hash(self):
+        # Arrange
+        a, b, c = (row_hash(name) for name in "abc")
+
+        # Act
+        root = merkle_root([a, b, c])
+
+        # Assert
+        assert root == combine(combine(a, b), combine(c, c))
+        assert merkle_root([a]) == a
+        assert merkle_root([]) is None
+
+    @pytest.mark.skipif(shutil.which("sha256sum") is None, reason="coreutils not available")
+    @settings(max_examples=25, deadline=None)
+    @given(hashes=hex_hashes.filter(lambda hashes: len(hashes) > 0))
+    def test_root_matches_cli(self, hashes):
+        # Act & Assert
+        assert merkle_root(hashes) == shell_merkle_root(hashes)
+
+class TestMerkleProof():
+
+    @given(hashes=hex_hashes.filter(lambda hashes: len(hashes) > 0), data=st.data())
+    def test_every_leaf_proves_against_the_root(self, hashes, data):
+        # Arrange
+        index = data.draw(st.integers(min_value=0, max_value=len(hashes) - 1))
+        levels = merkle_levels(hashes)
+
+        # Act
+        proof = merkle_proof(levels, index)
+
+        # Assert
+        assert levels[-1][0] == merkle_root(hashes)
+        assert verify_proof(hashes[index], proof, merkle_root(hashes))
+
+    def test_tampered_leaf_fails(self):
+        # Arrange
+        hashes = [row_hash(name) for name in "abcde"]
+        proof = merkle_proof(merkle_levels(hashes), 2)
+
+        # Act & Assert
+        assert not verify_proof(row_hash("x"), proof, merkle_root(hashes))
+
+class TestMerkleUpdate():
+
+    @given(previous=hex_hashes, data=st.data())
+    def test_update_matches_a_full_rebuild(self, previous, data):
+        # Arrange
+        kept = data.draw(st.integers(min_value=0, max_value=len(previous)))
+        hashes = previous[:kept] + data.draw(hex_hashes)
+        for index in data.draw(st.lists(st.integers(min_value=0, max_value=max(len(hashes) - 1, 0)), max_size=3)):
+            if hashes:
+                hashes[index] = row_hash(hashes[index])
+
+        # Act
+        levels = merkle_update(merkle_levels(previous), hashes)
+
+        # Assert
+        assert levels == merkle_levels(hashes)
+
+    def test_unchanged_leaves_are_not_hashed_again(self, monkeypatch):
+        # Arrange
+        hashes = [row_hash(str(n)) for n in range(64)]
+        levels = merkle_levels(hashes)
+        combined = []
+        monkeypatch.setattr("identity.merkle.combine", lambda left, right: combined.append(left) or combine(left, right))
+
+        # Act
+        updated = merkle_update(levels, hashes[:10] + [row_hash("changed")] + hashes[11:])
+
+        # Assert
+        assert len(combined) == 6
+        assert updated[-1][0] == merkle_root(hashes[:10] + [row_hash("changed")] + hashes[11:])
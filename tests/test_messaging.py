@@ -0,0 +1,234 @@
+import asyncio
+import json
+import os
+import pytest
+from plugin.plugin_manager import AbstractPlugin, HealthStates, PluginHealthFSM, PluginManager
+from messaging.consumer import PluginEventConsumer
+from messaging.publisher import ConfirmingPublisher
+from messaging.memory_broker import MemoryBroker
+from messaging.envelope import IdentityEvent
+from tests.test_plugin_manager import FakeClock
+
+class RecordingPlugin(AbstractPlugin):
+    """Accepts every event unless it is marked as poison"""
+    received = []
+
+    async def initialize(self) -> bool:
+        return True
+
+    async def start(self) -> bool:
+        return True
+
+    async def process_event(self, event: dict) -> bool:
+        await asyncio.sleep(0.001)
+        RecordingPlugin.received.append(event)
+        return not event.get("poison", False)
+
+    async def get_status(self) -> dict:
+        return {"name": self.name}
+
+    async def stop(self) -> bool:
+        return True
+
+class TypedRecordingPlugin(RecordingPlugin):
+    typed_events = True
+    received = []
+
+    async def process_event(self, event) -> bool:
+        TypedRecordingPlugin.received.append(event)
+        return True
+
+@pytest.fixture
+def manager(tmp_path):
+    RecordingPlugin.received = []
+    TypedRecordingPlugin.received = []
+    with open(os.path.join(tmp_path, "recorder.json"), 'w') as file:
+        json.dump({"name": "recorder", "class_path": "tests.test_messaging.RecordingPlugin"}, file)
+    with open(os.path.join(tmp_path, "typed.json"), 'w') as file:
+        json.dump({"name": "typed", "class_path": "tests.test_messaging.TypedRecordingPlugin"}, file)
+    return PluginManager(), str(tmp_path)
+
+class TestMessagePipeline():
+
+    @pytest.mark.asyncio
+    async def test_events_flow_from_publisher_to_plugin(self, manager):
+        # Arrange
+        p_manager, manifest_dir = manager
+        await p_manager.scan(manifest_dir)
+        broker = MemoryBroker()
+        consumer = PluginEventConsumer(p_manager, await broker.channel(), "events", batch_size=16)
+        await consumer.start()
+        publisher = ConfirmingPublisher(await broker.channel(), batch_size=10)
+
+        # Act
+        for n in range(25):
+            await publisher.publish({"n": n}, routing_key="events", plugin_name="recorder")
+        await publisher.flush()
+        await broker.join()
+        await consumer.stop()
+
+        # Assert
+        assert sorted(event["n"] for event in RecordingPlugin.received) == list(range(25))
+        assert consumer.acknowledged == 25
+        assert publisher.confirmed == 25
+
+    @pytest.mark.asyncio
+    async def test_failed_events_are_dead_lettered(self, manager):
+        # Arrange
+        p_manager, manifest_dir = manager
+        await p_manager.scan(manifest_dir)
+        broker = MemoryBroker()
+        consumer = PluginEventConsumer(p_manager, await broker.channel(), "events", plugin_name="recorder")
+        await consumer.start()
+        publisher = ConfirmingPublisher(await broker.channel())
+
+        # Act
+        for n in range(20):
+            await publisher.publish({"n": n, "poison": n == 7}, routing_key="events")
+        await publisher.flush()
+        await broker.join()
+        await consumer.stop()
+
+        # Assert
+        dead_letters = broker.queues["events.dead"]
+        assert consumer.dead_lettered == 1
+        assert consumer.acknowledged == 19
+        assert len(dead_letters) == 1
+        assert json.loads(dead_letters._ready[0][0])["n"] == 7
+
+    @pytest.mark.asyncio
+    async def test_events_rejected_by_an_open_breaker_are_requeued(self, manager):
+        # Arrange
+        p_manager, manifest_dir = manager
+        await p_manager.scan(manifest_dir)
+        await p_manager.start("recorder")
+        clock = FakeClock()
+        health = PluginHealthFSM(recovery_timeout=30, probe_successes=1, clock=clock)
+        await health.transition_to(HealthStates.FAILED)
+        p_manager.registry["recorder"].health = health
+        broker = MemoryBroker()
+        consumer = PluginEventConsumer(p_manager, await broker.channel(), "events", plugin_name="recorder",
+                                       batch_timeout=0.001, requeue_delay=0.001)
+        await consumer.start()
+        publisher = ConfirmingPublisher(await broker.channel())
+
+        # Act
+        for n in range(5):
+            await publisher.publish({"n": n}, routing_key="events")
+        await publisher.flush()
+        while consumer.requeued < 5:
+            await asyncio.sleep(0.001)
+        received_while_open = len(RecordingPlugin.received)
+        clock.now += 31
+        await broker.join()
+        await consumer.stop()
+
+        # Assert
+        assert received_while_open == 0
+        assert sorted(event["n"] for event in RecordingPlugin.received) == list(range(5))
+        assert consumer.dead_lettered == 0
+        assert consumer.acknowledged == 5
+        assert len(broker.queues["events.dead"]) == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_batch_is_dead_lettered_and_consumer_keeps_running(self, manager):
+        # Arrange
+        p_manager, manifest_dir = manager
+        await p_manager.scan(manifest_dir)
+        route = p_manager.route
+
+        async def failing_route(plugin_name, event):
+            if event["n"] == 3:
+                raise RuntimeError("plugin manager crashed")
+            return await route(plugin_name, event)
+
+        p_manager.route = failing_route
+        broker = MemoryBroker()
+        consumer = PluginEventConsumer(p_manager, await broker.channel(), "events", plugin_name="recorder",
+                                       batch_size=4, batch_timeout=0.05)
+        await consumer.start()
+        publisher = ConfirmingPublisher(await broker.channel())
+
+        # Act
+        for n in range(4):
+            await publisher.publish({"n": n}, routing_key="events")
+        await publisher.flush()
+        await broker.join()
+        for n in range(4, 8):
+            await publisher.publish({"n": n}, routing_key="events")
+        await publisher.flush()
+        await broker.join()
+        running = not consumer._task.done()
+        await consumer.stop()
+
+        # Assert
+        assert running
+        assert consumer.dead_lettered == 4
+        assert consumer.acknowledged == 4
+        assert len(broker.queues["events.dead"]) == 4
+        assert sorted(event["n"] for event in RecordingPlugin.received if event["n"] >= 4) == [4, 5, 6, 7]
+
+    @pytest.mark.asyncio
+    async def test_prefetch_limits_unacknowledged_deliveries(self, manager):
+        # Arrange
+        p_manager, manifest_dir = manager
+        await p_manager.scan(manifest_dir)
+        broker = MemoryBroker()
+        channel = await broker.channel()
+        consumer = PluginEventConsumer(p_manager, channel, "events", plugin_name="recorder",
+                                       prefetch_count=4, batch_size=4)
+        await consumer.start()
+        publisher = ConfirmingPublisher(await broker.channel())
+        in_flight = []
+
+        # Act
+        for n in range(12):
+            await publisher.publish({"n": n}, routing_key="events")
+        await publisher.flush()
+        while len(RecordingPlugin.received) < 12:
+            in_flight.append(len(channel._unacked))
+            await asyncio.sleep(0)
+        await broker.join()
+        await consumer.stop()
+
+        # Assert
+        assert max(in_flight) <= 4
+        assert consumer.acknowledged == 12
+
+    @pytest.mark.asyncio
+    async def test_publisher_buffers_until_batch_is_full(self):
+        # Arrange
+        broker = MemoryBroker()
+        publisher = ConfirmingPublisher(await broker.channel(), batch_size=3)
+
+        # Act
+        first = await publisher.publish({"n": 1}, routing_key="events")
+        second = await publisher.publish({"n": 2}, routing_key="events")
+        third = await publisher.publish({"n": 3}, routing_key="events")
+
+        # Assert
+        assert (first, second, third) == (0, 0, 3)
+        assert len(broker.published) == 3
+
+    @pytest.mark.asyncio
+    async def test_envelope_events_reach_plugins_in_the_form_they_accept(self, manager):
+        # Arrange
+        p_manager, manifest_dir = manager
+        await p_manager.scan(manifest_dir)
+        broker = MemoryBroker()
+        consumer = PluginEventConsumer(p_manager, await broker.channel(), "events")
+        await consumer.start()
+        publisher = ConfirmingPublisher(await broker.channel())
+        event = IdentityEvent("alice@example.coin", bytes(32), b"LS0t", bytes(32), True)
+
+        # Act
+        await publisher.publish(event, routing_key="events", plugin_name="recorder")
+        await publisher.publish(event, routing_key="events", plugin_name="typed")
+        await publisher.flush()
+        await broker.join()
+        await consumer.stop()
+
+        # Assert
+        assert RecordingPlugin.received == [event.to_dict()]
+        assert isinstance(TypedRecordingPlugin.received[0], IdentityEvent)
+        assert TypedRecordingPlugin.received[0].address == "alice@example.coin"
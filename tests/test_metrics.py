@@ -0,0 +1,254 @@
+import asyncio
+import gc
+import json
+import math
+import os
+import sqlite3
+import timeit
+import weakref
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from hypothesis import given, strategies as st
+from metrics.exporter import create_app, render
+from metrics.registry import REGISTRY, MetricsRegistry
+from configuration.password_screener import PasswordScreener
+from identity.store import IdentityStore
+from plugin.plugin_manager import PluginManager
+
+@pytest.fixture
+def shared_registry():
+    """Enables the shared registry for one test and leaves it empty and disabled afterwards"""
+    REGISTRY.metrics.clear()
+    REGISTRY.enable()
+    yield REGISTRY
+    REGISTRY.disable()
+    REGISTRY.metrics.clear()
+
+class TestMetricsRegistry():
+
+    def test_metrics_are_created_once_per_label_set(self):
+        # Arrange
+        registry = MetricsRegistry()
+
+        # Act
+        registry.counter("rpc_errors_total", method="name_show").inc()
+        registry.counter("rpc_errors_total", method="name_show").inc(2)
+        registry.counter("rpc_errors_total", method="getinfo").inc()
+
+        # Assert
+        assert registry.counter("rpc_errors_total", method="name_show").value == 3
+        assert len(registry.metrics) == 2
+        with pytest.raises(ValueError):
+            registry.gauge("rpc_errors_total")
+
+    @given(values=st.lists(st.floats(min_value=1e-6, max_value=100), min_size=1, max_size=500))
+    def test_histogram_quantiles_are_within_one_percent(self, values):
+        # Arrange
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds")
+
+        # Act
+        for value in values:
+            histogram.record(value)
+
+        # Assert
+        ordered = sorted(values)
+        for fraction in (0.5, 0.99, 1.0):
+            exact = ordered[max(math.ceil(fraction * len(ordered)), 1) - 1]
+            assert histogram.quantile(fraction) == pytest.approx(exact, rel=0.01, abs=2e-6)
+        assert histogram.count == len(values)
+
+    def test_disabled_registry_records_nothing(self):
+        # Arrange
+        registry = MetricsRegistry(enabled=False)
+        histogram = registry.histogram("latency_seconds")
+
+        @registry.timed("call_seconds")
+        def call():
+            return 42
+
+        # Act
+        registry.counter("events_total").inc()
+        with histogram.time():
+            pass
+        result = call()
+
+        # Assert
+        assert result == 42
+        assert registry.counter("events_total").value == 0
+        assert histogram.count == 0
+        assert ("call_seconds", ()) not in registry.metrics
+
+    def test_disabled_instrumentation_is_cheap(self):
+        # Arrange
+        registry = MetricsRegistry(enabled=False)
+        counter = registry.counter("events_total")
+        histogram = registry.histogram("latency_seconds")
+
+        def instrumented():
+            counter.inc()
+            with histogram.time():
+                pass
+
+        # Act
+        seconds = min(timeit.repeat(instrumented, number=10000, repeat=3)) / 10000
+
+        # Assert
+        assert seconds < 5e-6
+
+    @pytest.mark.asyncio
+    async def test_timed_supports_coroutines(self):
+        # Arrange
+        registry = MetricsRegistry()
+
+        @registry.timed("sleep_seconds", kind="async")
+        async def sleep():
+            await asyncio.sleep(0.01)
+
+        # Act
+        await sleep()
+
+        # Assert
+        assert registry.histogram("sleep_seconds", kind="async").min >= 0.01
+
+class TestPrometheusExport():
+
+    @pytest.mark.asyncio
+    async def test_endpoint_serves_text_format(self):
+        # Arrange
+        registry = MetricsRegistry()
+        registry.counter("events_total", "Events seen", plugin='say "hi"').inc(3)
+        registry.gauge("queue_depth").set_function(lambda: 7)
+        registry.histogram("rpc_seconds", method="name_show").record(0.25)
+        client = TestClient(TestServer(create_app(registry)))
+        await client.start_server()
+
+        # Act
+        response = await client.get("/metrics")
+        text = await response.text()
+        await client.close()
+
+        # Assert
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert "# HELP events_total Events seen\n# TYPE events_total counter\n" in text
+        assert 'events_total{plugin="say \\"hi\\""} 3' in text
+        assert "queue_depth 7" in text
+        assert "# TYPE rpc_seconds summary" in text
+        assert 'rpc_seconds_count{method="name_show"} 1' in text
+        assert 'rpc_seconds{method="name_show",quantile="0.5"} 0.25' in text
+
+class TestInstrumentation():
+
+    @pytest.mark.asyncio
+    async def test_plugin_dispatch_is_measured(self, shared_registry, tmp_path):
+        # Arrange
+        with open(os.path.join(tmp_path, "mock.json"), 'w') as file:
+            json.dump({"name": "mock", "class_path": "tests.test_plugin_manager.MockPlugin"}, file)
+        manager = PluginManager()
+        await manager.scan(str(tmp_path))
+
+        # Act
+        for _ in range(3):
+            await manager.dispatch("mock", {"type": "identity"})
+
+        # Assert
+        assert shared_registry.histogram("plugin_dispatch_seconds", plugin="mock").count == 3
+        assert shared_registry.counter("plugin_events_total", plugin="mock", result="ok").value == 3
+        assert "plugin_events_in_flight 0" in render(shared_registry)
+
+    @pytest.mark.asyncio
+    async def test_in_flight_gauge_is_shared_and_does_not_keep_managers_alive(self, shared_registry, tmp_path):
+        # Arrange
+        with open(os.path.join(tmp_path, "mock.json"), 'w') as file:
+            json.dump({"name": "mock", "class_path": "tests.test_plugin_manager.MockPlugin"}, file)
+        managers = [PluginManager() for _ in range(2)]
+        for manager in managers:
+            await manager.scan(str(tmp_path))
+            await manager.start("mock")
+        gate = asyncio.Event()
+        seen = []
+
+        async def blocking_process_event(event):
+            seen.append(shared_registry.gauge("plugin_events_in_flight").read())
+            await gate.wait()
+            return True
+
+        for manager in managers:
+            manager.registry["mock"].process_event = blocking_process_event
+
+        # Act
+        dispatches = [asyncio.ensure_future(manager.dispatch("mock", {"type": "identity"})) for manager in managers]
+        await asyncio.sleep(0.01)
+        during = shared_registry.gauge("plugin_events_in_flight").read()
+        gate.set()
+        await asyncio.gather(*dispatches)
+        dropped = weakref.ref(managers.pop(0))
+        dispatches.clear()
+        gc.collect()
+
+        # Assert
+        assert during == 2
+        assert sorted(seen) == [1, 2]
+        assert shared_registry.gauge("plugin_events_in_flight").read() == 0
+        assert dropped() is None
+
+    @pytest.mark.asyncio
+    async def test_in_flight_gauge_survives_metrics_being_toggled(self, shared_registry, tmp_path):
+        # Arrange
+        with open(os.path.join(tmp_path, "mock.json"), 'w') as file:
+            json.dump({"name": "mock", "class_path": "tests.test_plugin_manager.MockPlugin"}, file)
+        manager = PluginManager()
+        await manager.scan(str(tmp_path))
+        await manager.start("mock")
+        gate = asyncio.Event()
+
+        async def blocking_process_event(event):
+            await gate.wait()
+            return True
+
+        manager.registry["mock"].process_event = blocking_process_event
+        gauge = shared_registry.gauge("plugin_events_in_flight")
+
+        # Act
+        counted = asyncio.ensure_future(manager.dispatch("mock", {"type": "identity"}))
+        await asyncio.sleep(0.01)
+        shared_registry.disable()
+        uncounted = asyncio.ensure_future(manager.dispatch("mock", {"type": "identity"}))
+        await asyncio.sleep(0.01)
+        shared_registry.enable()
+        gate.set()
+        await asyncio.gather(counted, uncounted)
+
+        # Assert
+        assert gauge.read() == 0
+
+    def test_merkle_rebuild_is_measured(self, shared_registry, tmp_path):
+        # Arrange
+        path = str(tmp_path / "identities.tmp")
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE address_keys (id INTEGER PRIMARY KEY, address TEXT, pubkey TEXT, "
+                           "TPM_key TEXT, TPM_key_hash BLOB, TPM_enable BOOLEAN DEFAULT 0)")
+        connection.executemany("INSERT INTO address_keys (address, pubkey) VALUES (?, ?)",
+                               [(f"user{i}@example.coin", "ab") for i in range(10)])
+        connection.commit()
+        connection.close()
+        store = IdentityStore(path)
+
+        # Act
+        store.refresh()
+        store.refresh()
+
+        # Assert
+        assert shared_registry.histogram("merkle_rebuild_seconds", table="address_keys").count == 1
+        assert shared_registry.gauge("identity_records").read() == 10
+        store.close()
+
+    def test_password_screening_is_measured(self, shared_registry):
+        # Arrange
+        screener = PasswordScreener("common.txt")
+
+        # Act
+        screener.is_password_compromised("password")
+
+        # Assert
+        assert shared_registry.histogram("password_screener_check_seconds").count == 1
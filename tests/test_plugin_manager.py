@@ -1,9 +1,13 @@
-from plugin.plugin_manager import AbstractPlugin, PluginManager, PluginHealthFSM, PluginLifecycleFSM, PluginStates, HealthStates
+from plugin.plugin_manager import (AbstractPlugin, PluginManager, PluginHealthFSM, PluginLifecycleFSM, PluginStates,
+                                   HealthStates, SlidingWindowCounter)
+from hypothesis import given, strategies as st
+from plugin.process_isolation import ProcessPlugin, PluginWorkerError
 import tempfile
 import json
 import asyncio
 import pytest
 import os
+import sys
 
 class MockPlugin(AbstractPlugin):
     async def initialize(self) -> bool:
@@ -21,6 +25,41 @@ class MockPlugin(AbstractPlugin):
     async def stop(self) -> bool:
         return True
 
+START_LOG = []
+
+class SlowStartPlugin(MockPlugin):
+    async def start(self) -> bool:
+        START_LOG.append(("begin", self.name))
+        await asyncio.sleep(0.05)
+        START_LOG.append(("end", self.name))
+        return True
+
+class FailingStartPlugin(MockPlugin):
+    async def start(self) -> bool:
+        return False
+
+class FlakyPlugin(MockPlugin):
+    """Fails every event while its class level switch is on"""
+    failing = True
+
+    async def process_event(self, event: dict) -> bool:
+        self.processed = getattr(self, "processed", 0) + 1
+        if FlakyPlugin.failing:
+            raise RuntimeError("Simulated plugin failure")
+        return True
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def write_manifests(directory, manifests):
+    for manifest in manifests:
+        with open(os.path.join(directory, f"{manifest['name']}.json"), 'w') as file:
+            json.dump(manifest, file)
+
 class TestPluginManager():
     
     @pytest.mark.asyncio
@@ -46,4 +85,446 @@ class TestPluginManager():
         assert isinstance(p_manager.registry["mock plugin"], MockPlugin)
         
         # Clean Up
-        os.unlink(json_path)
\ No newline at end of file
+        os.unlink(json_path)
+    @pytest.mark.asyncio
+    async def test_plugin_manager_registers_process_isolated_plugin(self):
+        # Arrange
+        metadata = {
+            "name": "isolated plugin",
+            "class_path": "tests.test_plugin_manager.MockPlugin",
+            "isolation": "process"
+        }
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as file:
+            json.dump(metadata, file)
+            json_path = file.name
+
+        p_manager = PluginManager()
+
+        # Act
+        result = await p_manager.register(json_path)
+
+        # Assert
+        assert result is True
+        assert isinstance(p_manager.registry["isolated plugin"], ProcessPlugin)
+
+        # Clean Up
+        os.unlink(json_path)
+
+    @pytest.mark.asyncio
+    async def test_plugin_manager_rejects_unknown_isolation(self):
+        # Arrange
+        metadata = {
+            "name": "mock plugin",
+            "class_path": "tests.test_plugin_manager.MockPlugin",
+            "isolation": "thread"
+        }
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as file:
+            json.dump(metadata, file)
+            json_path = file.name
+
+        p_manager = PluginManager()
+
+        # Act
+        result = await p_manager.register(json_path)
+
+        # Assert
+        assert result is False
+        assert "mock plugin" not in p_manager.registry
+
+        # Clean Up
+        os.unlink(json_path)
+
+class TestProcessPlugin():
+
+    @pytest.mark.asyncio
+    async def test_process_plugin_forwards_interface_to_worker(self):
+        # Arrange
+        plugin = ProcessPlugin("isolated plugin", "tests.test_plugin_manager.MockPlugin")
+
+        # Act
+        initialized = await plugin.initialize()
+        started = await plugin.start()
+        processed = await plugin.process_event({"type": "identity"})
+        status = await plugin.get_status()
+        stopped = await plugin.stop()
+
+        # Assert
+        assert initialized and started and processed and stopped
+        assert status["name"] == "isolated plugin"
+        assert status["isolation"] == "process"
+        assert status["pid"] != os.getpid()
+
+    @pytest.mark.asyncio
+    async def test_process_plugin_restarts_crashed_worker(self):
+        # Arrange
+        plugin = ProcessPlugin("isolated plugin", "tests.test_plugin_manager.MockPlugin")
+        await plugin.initialize()
+        await plugin.start()
+        first_pid = plugin._process.pid
+
+        # Act
+        plugin._process.kill()
+        plugin._process.join()
+        processed = await plugin.process_event({"type": "identity"})
+        status = await plugin.get_status()
+
+        # Assert
+        assert processed is True
+        assert status["restarts"] == 1
+        assert status["pid"] != first_pid
+
+        # Clean Up
+        await plugin.stop()
+
+    @pytest.mark.asyncio
+    async def test_process_plugin_not_restarted_when_failed(self):
+        # Arrange
+        plugin = ProcessPlugin("isolated plugin", "tests.test_plugin_manager.MockPlugin")
+        await plugin.initialize()
+        plugin._process.kill()
+        plugin._process.join()
+        plugin.health.state = HealthStates.FAILED
+
+        # Act & Assert
+        with pytest.raises(PluginWorkerError):
+            await plugin.process_event({"type": "identity"})
+
+class TestLazyPluginLoading():
+
+    @pytest.mark.asyncio
+    async def test_scan_records_manifests_without_importing(self):
+        # Arrange
+        p_manager = PluginManager()
+        with tempfile.TemporaryDirectory() as manifest_dir:
+            write_manifests(manifest_dir, [
+                {"name": "missing", "class_path": "tests.does_not_exist.Plugin"},
+                {"name": "mock", "class_path": "tests.test_plugin_manager.MockPlugin"},
+            ])
+            with open(os.path.join(manifest_dir, "broken.json"), 'w') as file:
+                json.dump({"name": "broken"}, file)
+
+            # Act
+            found = await p_manager.scan(manifest_dir)
+
+        # Assert
+        assert found == ["missing", "mock"]
+        assert p_manager.registry == {}
+        assert await p_manager.start("missing") is False
+
+    @pytest.mark.asyncio
+    async def test_first_event_loads_and_starts_plugin(self):
+        # Arrange
+        p_manager = PluginManager()
+        with tempfile.TemporaryDirectory() as manifest_dir:
+            write_manifests(manifest_dir, [{"name": "mock", "class_path": "tests.test_plugin_manager.MockPlugin"}])
+            await p_manager.scan(manifest_dir)
+
+        # Act
+        result = await p_manager.dispatch("mock", {"type": "identity"})
+
+        # Assert
+        assert result is True
+        assert isinstance(p_manager.registry["mock"], MockPlugin)
+        assert set(p_manager.startup_timings["mock"]) == {"import", "initialize", "start"}
+
+    @pytest.mark.asyncio
+    async def test_event_conversion_failure_only_fails_that_event(self):
+        # Arrange
+        class UnconvertibleEvent():
+            def to_dict(self):
+                raise ValueError("cannot convert")
+
+        p_manager = PluginManager()
+        with tempfile.TemporaryDirectory() as manifest_dir:
+            write_manifests(manifest_dir, [{"name": "mock", "class_path": "tests.test_plugin_manager.MockPlugin"}])
+            await p_manager.scan(manifest_dir)
+
+        # Act
+        failed = await p_manager.dispatch("mock", UnconvertibleEvent())
+        next_event = await p_manager.dispatch("mock", {"type": "identity"})
+
+        # Assert
+        assert failed is False
+        assert next_event is True
+
+    @pytest.mark.asyncio
+    async def test_start_all_runs_levels_concurrently_in_dependency_order(self):
+        # Arrange
+        START_LOG.clear()
+        p_manager = PluginManager()
+        with tempfile.TemporaryDirectory() as manifest_dir:
+            write_manifests(manifest_dir, [
+                {"name": "a", "class_path": "tests.test_plugin_manager.SlowStartPlugin"},
+                {"name": "b", "class_path": "tests.test_plugin_manager.SlowStartPlugin"},
+                {"name": "c", "class_path": "tests.test_plugin_manager.SlowStartPlugin", "depends_on": ["a", "b"]},
+            ])
+            await p_manager.scan(manifest_dir)
+
+        # Act
+        results = await p_manager.start_all()
+        report = p_manager.get_startup_report()
+
+        # Assert
+        assert results == {"a": True, "b": True, "c": True}
+        assert START_LOG[:2] == [("begin", "a"), ("begin", "b")]
+        assert START_LOG[-2:] == [("begin", "c"), ("end", "c")]
+        assert [entry["name"] for entry in report].count("c") == 1
+        assert all(entry["total"] >= entry["start"] > 0 for entry in report)
+
+    @pytest.mark.asyncio
+    async def test_start_all_skips_dependents_of_failed_plugins(self):
+        # Arrange
+        p_manager = PluginManager()
+        with tempfile.TemporaryDirectory() as manifest_dir:
+            write_manifests(manifest_dir, [
+                {"name": "base", "class_path": "tests.test_plugin_manager.FailingStartPlugin"},
+                {"name": "child", "class_path": "tests.test_plugin_manager.MockPlugin", "depends_on": ["base"]},
+            ])
+            await p_manager.scan(manifest_dir)
+
+        # Act
+        results = await p_manager.start_all()
+
+        # Assert
+        assert results == {"base": False, "child": False}
+        assert "child" not in p_manager.registry
+
+    @pytest.mark.asyncio
+    async def test_start_all_rejects_dependency_cycles(self):
+        # Arrange
+        p_manager = PluginManager()
+        with tempfile.TemporaryDirectory() as manifest_dir:
+            write_manifests(manifest_dir, [
+                {"name": "a", "class_path": "tests.test_plugin_manager.MockPlugin", "depends_on": ["b"]},
+                {"name": "b", "class_path": "tests.test_plugin_manager.MockPlugin", "depends_on": ["a"]},
+            ])
+            await p_manager.scan(manifest_dir)
+
+        # Act & Assert
+        with pytest.raises(ValueError):
+            await p_manager.start_all()
+
+class TestSlidingWindowCounter():
+
+    @given(steps=st.lists(st.tuples(st.floats(min_value=0, max_value=30), st.booleans()), max_size=200))
+    def test_running_totals_match_the_buckets_in_the_window(self, steps):
+        # Arrange
+        clock = FakeClock()
+        counter = SlidingWindowCounter(window_seconds=60, bucket_count=6, clock=clock)
+        recorded = []
+
+        # Act & Assert
+        for advance, success in steps:
+            clock.now += advance
+            (counter.record_success if success else counter.record_error)()
+            recorded.append((int(clock.now / 10), success))
+            oldest = int(clock.now / 10) - 6
+            inside = [ok for epoch, ok in recorded if epoch > oldest]
+            assert counter.totals() == (inside.count(True), inside.count(False))
+
+    def test_idle_window_is_empty(self):
+        # Arrange
+        clock = FakeClock()
+        counter = SlidingWindowCounter(window_seconds=60, bucket_count=6, clock=clock)
+        counter.record_error()
+
+        # Act
+        clock.now += 60
+
+        # Assert
+        assert counter.totals() == (0, 0)
+
+class TestPluginHealthFSM():
+
+    @pytest.mark.asyncio
+    async def test_error_rate_moves_through_health_states(self):
+        # Arrange
+        health = PluginHealthFSM(min_requests=10, clock=FakeClock())
+        for _ in range(9):
+            await health.report_success()
+
+        # Act & Assert
+        await health.report_error()
+        assert health.state == HealthStates.DEGRADED
+        for _ in range(3):
+            await health.report_error()
+        assert health.state == HealthStates.UNHEALTHY
+        for _ in range(6):
+            await health.report_error()
+        assert health.state == HealthStates.FAILED
+        assert health.allow_request() is False
+
+    @pytest.mark.asyncio
+    async def test_old_buckets_leave_the_window(self):
+        # Arrange
+        clock = FakeClock()
+        health = PluginHealthFSM(window_seconds=60, bucket_count=6, min_requests=1, clock=clock)
+        await health.report_error()
+        assert health.state == HealthStates.FAILED
+
+        # Act
+        clock.now += 61
+
+        # Assert
+        assert health.window.totals() == (0, 0)
+        assert health.error_rate() == 0.0
+
+    @pytest.mark.asyncio
+    async def test_recovering_probes_close_the_breaker(self):
+        # Arrange
+        clock = FakeClock()
+        health = PluginHealthFSM(min_requests=1, recovery_timeout=30, probe_successes=2, clock=clock)
+        await health.report_error()
+
+        # Act
+        clock.now += 31
+        first_probe = health.allow_request()
+        second_probe = health.allow_request()
+        third_probe = health.allow_request()
+        await health.report_success()
+        await health.report_success()
+
+        # Assert
+        assert (first_probe, second_probe, third_probe) == (True, True, False)
+        assert health.state == HealthStates.HEALTHY
+        assert health.window.totals() == (0, 0)
+
+    @pytest.mark.asyncio
+    async def test_failed_probe_trips_the_breaker_again(self):
+        # Arrange
+        clock = FakeClock()
+        health = PluginHealthFSM(min_requests=1, recovery_timeout=30, clock=clock)
+        await health.report_error()
+        clock.now += 31
+        health.allow_request()
+        assert health.state == HealthStates.RECOVERING
+
+        # Act
+        await health.report_error()
+
+        # Assert
+        assert health.state == HealthStates.FAILED
+        assert health.allow_request() is False
+
+    @pytest.mark.asyncio
+    async def test_invalid_transitions_are_rejected(self):
+        # Arrange
+        health = PluginHealthFSM()
+        lifecycle = PluginLifecycleFSM()
+
+        # Act & Assert
+        assert await health.transition_to(HealthStates.RECOVERING) is False
+        assert await lifecycle.transition_to(PluginStates.ACTIVE) is False
+        assert await lifecycle.transition_to(PluginStates.LOADING) is True
+        assert await lifecycle.transition_to(PluginStates.ACTIVE) is True
+        assert lifecycle.state == PluginStates.ACTIVE
+
+    @pytest.mark.asyncio
+    async def test_manager_stops_routing_to_failed_plugins(self):
+        # Arrange
+        FlakyPlugin.failing = True
+        p_manager = PluginManager()
+        with tempfile.TemporaryDirectory() as manifest_dir:
+            write_manifests(manifest_dir, [{"name": "flaky", "class_path": "tests.test_plugin_manager.FlakyPlugin"}])
+            await p_manager.scan(manifest_dir)
+        await p_manager.start("flaky")
+        plugin = p_manager.registry["flaky"]
+        clock = FakeClock()
+        plugin.health = PluginHealthFSM(min_requests=5, recovery_timeout=30, probe_successes=1, clock=clock)
+
+        # Act
+        results = [await p_manager.dispatch("flaky", {"n": n}) for n in range(20)]
+        health_while_failed = await p_manager.get_plugin_health("flaky")
+        processed_while_failing = plugin.processed
+        FlakyPlugin.failing = False
+        clock.now += 31
+        probe = await p_manager.dispatch("flaky", {"n": "probe"})
+
+        # Assert
+        assert not any(results)
+        assert processed_while_failing == 5
+        assert health_while_failed == HealthStates.FAILED
+        assert probe is True
+        assert await p_manager.get_plugin_health("flaky") == HealthStates.HEALTHY
+        assert await p_manager.get_ready_state("flaky") == PluginStates.ACTIVE
+
+RELOADABLE_PLUGIN = """
+import asyncio
+from plugin.plugin_manager import AbstractPlugin
+
+VERSION = {version}
+
+class ReloadablePlugin(AbstractPlugin):
+    async def initialize(self) -> bool:
+        return True
+
+    async def start(self) -> bool:
+        return True
+
+    async def process_event(self, event: dict) -> bool:
+        await asyncio.sleep(event.get("delay", 0))
+        event["handled_by"] = VERSION
+        return True
+
+    async def get_status(self) -> dict:
+        return {{"name": self.name, "version": VERSION}}
+
+    async def stop(self) -> bool:
+        self.stopped = True
+        return True
+"""
+
+class TestPluginReload():
+
+    @pytest.mark.asyncio
+    async def test_reload_swaps_version_without_dropping_in_flight_events(self, tmp_path, monkeypatch):
+        # Arrange
+        monkeypatch.syspath_prepend(str(tmp_path))
+        module_path = tmp_path / "reloadable_plugin.py"
+        module_path.write_text(RELOADABLE_PLUGIN.format(version=1))
+        write_manifests(str(tmp_path), [{"name": "reloadable", "class_path": "reloadable_plugin.ReloadablePlugin"}])
+        p_manager = PluginManager()
+        await p_manager.scan(str(tmp_path))
+        await p_manager.start("reloadable")
+        old_plugin = p_manager.registry["reloadable"]
+        in_flight_event = {"delay": 0.1}
+        in_flight = asyncio.create_task(p_manager.dispatch("reloadable", in_flight_event))
+        await asyncio.sleep(0)
+
+        # Act
+        module_path.write_text(RELOADABLE_PLUGIN.format(version="2  # upgraded"))
+        reloaded = await p_manager.reload("reloadable")
+        new_event = {}
+        await p_manager.dispatch("reloadable", new_event)
+
+        # Assert
+        assert reloaded is True
+        assert in_flight.done() and in_flight.result() is True
+        assert in_flight_event["handled_by"] == 1
+        assert new_event["handled_by"] == 2
+        assert old_plugin.stopped is True
+        assert old_plugin.lifecycle.state == PluginStates.INACTIVE
+        assert p_manager.registry["reloadable"] is not old_plugin
+        assert await p_manager.get_ready_state("reloadable") == PluginStates.ACTIVE
+
+        # Clean Up
+        sys.modules.pop("reloadable_plugin", None)
+
+    @pytest.mark.asyncio
+    async def test_reload_keeps_old_version_when_new_one_fails(self):
+        # Arrange
+        p_manager = PluginManager()
+        with tempfile.TemporaryDirectory() as manifest_dir:
+            write_manifests(manifest_dir, [{"name": "mock", "class_path": "tests.test_plugin_manager.MockPlugin"}])
+            await p_manager.scan(manifest_dir)
+        await p_manager.start("mock")
+        old_plugin = p_manager.registry["mock"]
+        p_manager.manifests["mock"]["class_path"] = "tests.test_plugin_manager.FailingStartPlugin"
+
+        # Act
+        reloaded = await p_manager.reload("mock")
+
+        # Assert
+        assert reloaded is False
+        assert p_manager.registry["mock"] is old_plugin
+        assert old_plugin.lifecycle.state == PluginStates.ACTIVE
@@ -0,0 +1,363 @@
+import asyncio
+import json
+import sqlite3
+import pytest
+import pytest_asyncio
+from benchmarks.e2e import SCHEMA
+from benchmarks.fakes import FakeEmercoinNode, FakeIpfsNode
+from emercoin.rpc_client import EmercoinRpcClient, EmercoinRpcError
+from identity.ipfs import IpfsClient
+from identity.merkle import merkle_root
+from identity.publisher import PublishError, PublishScheduler, _watch, update_merkle_roots
+from identity.snapshot import MAGIC, SnapshotReader
+from identity.store import IdentityStore
+
+def register(db_path: str, address: str, pubkey: str):
+    connection = sqlite3.connect(db_path)
+    with connection:
+        connection.execute("INSERT INTO address_keys (address, pubkey, TPM_key, TPM_key_hash, TPM_enable) VALUES (?, ?, '', '', 0)",
+                           (address, pubkey))
+    connection.close()
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "identities.tmp")
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    with connection:
+        connection.execute("INSERT INTO tpm_domain_settings (domain, TPM_enable) VALUES ('example.coin', 1)")
+    connection.close()
+    for i in range(3):
+        register(path, f"user{i}@example.coin", f"{i:02x}" * 32)
+    return path
+
+@pytest_asyncio.fixture
+async def services():
+    node = FakeEmercoinNode({"dns:example.coin": "{}"})
+    ipfs = FakeIpfsNode()
+    await node.start()
+    await ipfs.start()
+    rpc = EmercoinRpcClient(node.url, "user", "password")
+    ipfs_client = IpfsClient(ipfs.url)
+    yield node, ipfs, rpc, ipfs_client
+    await rpc.close()
+    await ipfs_client.close()
+    await node.stop()
+    await ipfs.stop()
+
+@pytest_asyncio.fixture
+async def make_scheduler(db_path, services):
+    _, _, rpc, ipfs_client = services
+    schedulers = []
+
+    async def make(**kwargs):
+        scheduler = PublishScheduler(db_path, "example.coin", ipfs_client, rpc, **kwargs)
+        await scheduler.start()
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        await scheduler.stop(flush=False)
+
+class TestUpdateMerkleRoots():
+
+    def test_roots_match_the_store_and_are_written_to_db_root(self, db_path):
+        # Act
+        final_root = update_merkle_roots(db_path)
+
+        # Assert
+        store = IdentityStore(db_path)
+        store.refresh()
+        connection = sqlite3.connect(db_path)
+        rows = dict(connection.execute("SELECT table_name, root FROM db_root"))
+        table_hashes = [row[0] for row in connection.execute(
+            "SELECT row_hash FROM db_root WHERE table_name != 'db_root' ORDER BY id")]
+        stored = [row[0] for row in connection.execute("SELECT row_hash FROM address_keys ORDER BY id")]
+        connection.close()
+        assert rows["address_keys"] == store.root
+        assert rows["db_root"] == final_root == store.db_root
+        assert final_root == merkle_root(table_hashes)
+        assert stored == [record["row_hash"] for record in store.lookup_many(
+            [f"user{i}@example.coin" for i in range(3)])[0].values()]
+        store.close()
+
+    def test_recompute_is_stable_and_follows_changes(self, db_path):
+        # Act
+        first = update_merkle_roots(db_path)
+        again = update_merkle_roots(db_path)
+        register(db_path, "late@example.coin", "ff" * 32)
+        changed = update_merkle_roots(db_path)
+
+        # Assert
+        assert first == again
+        assert changed != first
+
+    def test_current_roots_are_not_rewritten(self, db_path):
+        # Arrange
+        update_merkle_roots(db_path)
+        watcher = sqlite3.connect(db_path)
+        version = watcher.execute("PRAGMA data_version").fetchone()[0]
+
+        # Act
+        update_merkle_roots(db_path)
+
+        # Assert
+        assert watcher.execute("PRAGMA data_version").fetchone()[0] == version
+        watcher.close()
+
+class TestPublishScheduler():
+
+    @pytest.mark.asyncio
+    async def test_changes_in_one_window_become_one_publish(self, make_scheduler, services, db_path):
+        # Arrange
+        node, ipfs, _, _ = services
+        scheduler = await make_scheduler(window=0.2)
+
+        # Act
+        for i in range(5):
+            register(db_path, f"new{i}@example.coin", "aa" * 32)
+            scheduler.notify()
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.5)
+
+        # Assert
+        assert len(node.transactions) == 1
+        method, name, value, _ = node.transactions[0]
+        published = json.loads(value)
+        assert (method, name) == ("name_update", "dns:example.coin")
+        assert published["merkle_root"] == update_merkle_roots(db_path)
+        assert published["cid"] in ipfs.blocks
+        assert ipfs.blocks[published["cid"]].startswith(b"SQLite format 3")
+        assert "snapshot_root" not in published
+        assert scheduler.get_stats()["changes_published"] == 5
+        assert scheduler.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_max_changes_publishes_before_the_window(self, make_scheduler, services):
+        # Arrange
+        node, _, _, _ = services
+        scheduler = await make_scheduler(window=60, max_changes=3)
+
+        # Act
+        scheduler.notify(2)
+        await asyncio.sleep(0.1)
+        before = len(node.transactions)
+        scheduler.notify()
+        await asyncio.sleep(0.3)
+
+        # Assert
+        assert before == 0
+        assert len(node.transactions) == 1
+
+    @pytest.mark.asyncio
+    async def test_publishes_never_overlap(self, make_scheduler, services, db_path):
+        # Arrange
+        node, _, rpc, _ = services
+        node.update_delay = 0.1
+        in_flight = []
+        overlaps = []
+        name_update = rpc.name_update
+
+        async def tracked(*args):
+            in_flight.append(1)
+            overlaps.append(len(in_flight))
+            try:
+                return await name_update(*args)
+            finally:
+                in_flight.pop()
+
+        rpc.name_update = tracked
+        scheduler = await make_scheduler(window=60, max_changes=1)
+
+        # Act
+        for i in range(4):
+            register(db_path, f"burst{i}@example.coin", "bb" * 32)
+            scheduler.notify()
+            await asyncio.sleep(0.03)
+        await scheduler.flush()
+
+        # Assert
+        assert max(overlaps) == 1
+        assert 2 <= len(node.transactions) <= 4
+        assert json.loads(node.transactions[-1][2])["merkle_root"] == update_merkle_roots(db_path)
+
+    @pytest.mark.asyncio
+    async def test_unchanged_root_is_not_published_again(self, make_scheduler, services):
+        # Arrange
+        node, _, _, _ = services
+        scheduler = await make_scheduler()
+
+        # Act
+        first = await scheduler.flush()
+        second = await scheduler.flush()
+
+        # Assert
+        assert first == second
+        assert len(node.transactions) == 1
+        assert scheduler.get_stats()["skipped"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_name_update_is_retried_without_reuploading(self, make_scheduler, services):
+        # Arrange
+        node, ipfs, _, _ = services
+        del node.names["dns:example.coin"]
+        scheduler = await make_scheduler(retry_delay=0.05, max_attempts=5)
+
+        async def restore_name():
+            await asyncio.sleep(0.08)
+            node.names["dns:example.coin"] = "{}"
+
+        # Act
+        restore = asyncio.ensure_future(restore_name())
+        published = await scheduler.flush()
+        await restore
+
+        # Assert
+        assert scheduler.get_stats()["retries"] >= 1
+        assert len(node.transactions) == 1
+        assert len(ipfs.blocks) == 1
+        assert json.loads(node.names["dns:example.coin"]) == published
+
+    @pytest.mark.asyncio
+    async def test_name_update_that_went_through_is_not_sent_again(self, make_scheduler, services):
+        # Arrange
+        node, _, rpc, _ = services
+        name_update = rpc.name_update
+
+        async def timed_out(*args):
+            await name_update(*args)
+            raise EmercoinRpcError("Emercoin node timed out")
+
+        rpc.name_update = timed_out
+        scheduler = await make_scheduler(retry_delay=0.01)
+
+        # Act
+        published = await scheduler.flush()
+
+        # Assert
+        assert len(node.transactions) == 1
+        assert json.loads(node.names["dns:example.coin"]) == published
+        assert scheduler.get_stats()["retries"] == 1
+
+    @pytest.mark.asyncio
+    async def test_publish_gives_up_after_max_attempts_and_keeps_changes(self, make_scheduler, services):
+        # Arrange
+        node, _, _, _ = services
+        del node.names["dns:example.coin"]
+        scheduler = await make_scheduler(window=60, retry_delay=0.01, max_attempts=2)
+        scheduler.notify(4)
+
+        # Act / Assert
+        with pytest.raises(PublishError):
+            await scheduler.flush()
+        assert scheduler.pending == 4
+        assert scheduler.get_stats()["failures"] == 1
+        assert node.transactions == []
+
+    @pytest.mark.asyncio
+    async def test_unexpected_error_fails_the_flush_and_keeps_the_worker(self, make_scheduler, services):
+        # Arrange
+        node, _, _, ipfs_client = services
+        scheduler = await make_scheduler(window=60)
+        add_file = ipfs_client.add_file
+
+        async def broken_add_file(path):
+            raise RuntimeError("unexpected upload bug")
+
+        ipfs_client.add_file = broken_add_file
+        scheduler.notify(2)
+
+        # Act
+        with pytest.raises(RuntimeError):
+            await scheduler.flush()
+        running = scheduler.running
+        ipfs_client.add_file = add_file
+        published = await scheduler.flush()
+
+        # Assert
+        assert running
+        assert scheduler.get_stats()["failures"] == 1
+        assert scheduler.get_stats()["changes_published"] == 2
+        assert json.loads(node.transactions[-1][2]) == published
+
+    @pytest.mark.asyncio
+    async def test_watch_returns_when_the_worker_stops(self, make_scheduler, db_path):
+        # Arrange
+        scheduler = await make_scheduler()
+        scheduler._worker.cancel()
+
+        # Act / Assert
+        await asyncio.wait_for(_watch(scheduler, db_path, 0.01), 1)
+
+    @pytest.mark.asyncio
+    async def test_snapshot_upload_publishes_the_snapshot_root(self, make_scheduler, services, tmp_path):
+        # Arrange
+        node, ipfs, _, _ = services
+        scheduler = await make_scheduler(snapshot=True)
+
+        # Act
+        published = await scheduler.flush()
+
+        # Assert
+        data = ipfs.blocks[published["cid"]]
+        path = tmp_path / "published.bgsnap"
+        path.write_bytes(data)
+        with SnapshotReader(str(path)) as reader:
+            assert published["snapshot_root"] == reader.root.hex()
+        assert data.startswith(MAGIC)
+        assert json.loads(node.names["dns:example.coin"]) == published
+
+    @pytest.mark.asyncio
+    async def test_stop_flushes_pending_changes(self, db_path, services):
+        # Arrange
+        node, _, rpc, ipfs_client = services
+        scheduler = PublishScheduler(db_path, "example.coin", ipfs_client, rpc, window=60)
+        await scheduler.start()
+        scheduler.notify()
+
+        # Act
+        await scheduler.stop()
+
+        # Assert
+        assert len(node.transactions) == 1
+        assert scheduler.pending == 0
+
+    @pytest.mark.asyncio
+    async def test_changes_notified_before_start_are_published(self, db_path, services):
+        # Arrange
+        node, _, rpc, ipfs_client = services
+        scheduler = PublishScheduler(db_path, "example.coin", ipfs_client, rpc, window=0.05)
+        scheduler.notify(3)
+
+        # Act
+        await scheduler.start()
+        await asyncio.sleep(0.3)
+        await scheduler.stop(flush=False)
+
+        # Assert
+        assert len(node.transactions) == 1
+        assert scheduler.pending == 0
+        assert scheduler.get_stats()["changes_published"] == 3
+
+    @pytest.mark.asyncio
+    async def test_one_watched_change_leads_to_one_publish(self, make_scheduler, services, db_path):
+        # Arrange
+        node, _, _, _ = services
+        scheduler = await make_scheduler(window=0.1)
+        await scheduler.flush()
+        published = len(node.transactions)
+        watcher = asyncio.ensure_future(_watch(scheduler, db_path, 0.01))
+
+        # Act
+        await asyncio.sleep(0.05)
+        register(db_path, "watched@example.coin", "cc" * 32)
+        await asyncio.sleep(1.0)
+        changes = scheduler.get_stats()["changes"]
+        await asyncio.sleep(0.5)
+        watcher.cancel()
+
+        # Assert
+        assert len(node.transactions) - published == 1
+        assert scheduler.get_stats()["changes"] == changes <= 2
+        assert scheduler.pending == 0
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import pytest
+from tpm.random_pool import HmacDrbg, RandomPool, RandomPoolError
+
+class CountingEntropySource():
+    """Stands in for TpmBroker.get_random and records every batch requested"""
+    def __init__(self, fail: bool = False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, size: int) -> bytes:
+        self.calls.append(size)
+        if self.fail:
+            raise OSError("TPM unavailable")
+        return os.urandom(size)
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class TestHmacDrbg():
+
+    def test_same_seed_gives_same_stream(self):
+        # Arrange
+        first = HmacDrbg(b"\x01" * 32, b"nonce")
+        second = HmacDrbg(b"\x01" * 32, b"nonce")
+
+        # Act & Assert
+        assert first.generate(64) == second.generate(64)
+        assert first.generate(64) != first.generate(64)
+
+    def test_reseed_changes_the_stream(self):
+        # Arrange
+        first = HmacDrbg(b"\x01" * 32)
+        second = HmacDrbg(b"\x01" * 32)
+
+        # Act
+        second.reseed(b"\x02" * 32)
+
+        # Assert
+        assert first.generate(32) != second.generate(32)
+        assert second.reseed_counter == 2
+
+    def test_short_entropy_is_rejected(self):
+        # Act & Assert
+        with pytest.raises(ValueError):
+            HmacDrbg(b"\x01" * 16)
+
+class TestRandomPool():
+
+    @pytest.mark.asyncio
+    async def test_draws_are_served_from_memory(self):
+        # Arrange
+        source = CountingEntropySource()
+        pool = RandomPool(source, seed_size=512)
+        await pool.start()
+
+        # Act
+        challenges = {pool.challenge() for _ in range(100)}
+        salt = pool.salt()
+        nonce = pool.nonce()
+
+        # Assert
+        assert len(challenges) == 100
+        assert all(len(challenge) == 64 for challenge in challenges)
+        assert len(salt) == 16 and len(nonce) == 12
+        assert source.calls == [512]
+        stats = pool.get_stats()
+        assert stats["draws"] == 102
+        assert stats["entropy_fetches"] == 1
+        # 512 seed bytes are 16 GetRandom commands, the draws would have needed 100 + 1 + 1
+        assert stats["tpm_calls"] == 16
+        assert stats["tpm_calls_saved"] == 86
+
+    @pytest.mark.asyncio
+    async def test_reseed_runs_in_the_background(self):
+        # Arrange
+        source = CountingEntropySource()
+        pool = RandomPool(source, reseed_interval=5)
+        await pool.start()
+
+        # Act
+        for _ in range(5):
+            pool.random_bytes(32)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        # Assert
+        assert len(source.calls) == 2
+        assert pool.get_stats()["reseeds"] == 1
+        assert pool.get_stats()["draws_since_seed"] == 0
+
+    @pytest.mark.asyncio
+    async def test_failed_reseed_keeps_serving(self):
+        # Arrange
+        source = CountingEntropySource()
+        pool = RandomPool(source, reseed_interval=1)
+        await pool.start()
+        source.fail = True
+
+        # Act
+        pool.random_bytes(32)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        # Assert
+        assert len(pool.random_bytes(32)) == 32
+        assert pool.get_stats()["reseed_failures"] >= 1
+        await pool.stop()
+
+    @pytest.mark.asyncio
+    async def test_failed_reseeds_back_off(self):
+        # Arrange
+        clock = FakeClock()
+        source = CountingEntropySource()
+        pool = RandomPool(source, reseed_interval=1000, reseed_seconds=60, reseed_backoff=1.0, clock=clock)
+        await pool.start()
+        source.fail = True
+        clock.now += 60
+        attempts = []
+
+        # Act
+        for elapsed in (0, 0.5, 0.5, 1.5, 1, 4):
+            clock.now += elapsed
+            for _ in range(10):
+                pool.random_bytes(32)
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            attempts.append(len(source.calls) - 1)
+        source.fail = False
+        clock.now += 8
+        pool.random_bytes(32)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        # Assert
+        assert attempts == [1, 1, 2, 2, 3, 4]
+        assert pool.get_stats()["reseeds"] == 1
+        assert pool.get_stats()["reseed_failures"] == 4
+        await pool.stop()
+
+    @pytest.mark.asyncio
+    async def test_large_draws_are_split(self):
+        # Arrange
+        pool = RandomPool(CountingEntropySource())
+        await pool.start()
+
+        # Act
+        data = pool.random_bytes(200000)
+
+        # Assert
+        assert len(data) == 200000
+
+    @pytest.mark.asyncio
+    async def test_unseeded_pool_refuses_to_serve(self):
+        # Arrange
+        pool = RandomPool(CountingEntropySource())
+
+        # Act & Assert
+        with pytest.raises(RandomPoolError):
+            pool.challenge()
+
+    @pytest.mark.asyncio
+    async def test_short_entropy_batch_is_rejected(self):
+        # Arrange
+        async def short_source(size: int) -> bytes:
+            return b"\x00" * (size // 2)
+        pool = RandomPool(short_source)
+
+        # Act & Assert
+        with pytest.raises(RandomPoolError):
+            await pool.start()
@@ -0,0 +1,122 @@
+import csv
+import os
+import stat
+import pytest
+from reliability.harness import STAGES, ReliabilityHarness, StageTimer, percentile, summarize
+
+STARTUP_LOG = "\n".join(f"✅ {marker}" for _, marker in STAGES[:-1]) + "\n✅ Yggdrasil started with IPv6: 200:1234::1\n"
+
+def write_fake_docker(tmp_path, lockout_iteration: int = None) -> str:
+    """Shell script answering the docker subcommands the harness uses"""
+    path = tmp_path / "docker"
+    lockout_check = f'[[ "$*" == *iteration_{lockout_iteration}* ]] && echo locked > "$dir/locked"' if lockout_iteration else ""
+    path.write_text(f'''#!/bin/bash
+dir="{tmp_path}"
+case "$1" in
+    run) {lockout_check}
+         echo "container$RANDOM$RANDOM" ;;
+    logs) if [[ -f "$dir/locked" ]]; then echo "ERROR: TPM_RC_LOCKOUT"; else printf '{STARTUP_LOG}'; fi ;;
+    inspect) echo true ;;
+    exec) case "$2$3" in
+              *yggdrasilctl*) echo "IPv6 address: 200:1234::1" ;;
+              *) echo "- 0x81000000" ;;
+          esac ;;
+esac
+''')
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+class TestReliabilityHarness():
+
+    def test_stage_timer_measures_each_stage_from_container_start(self):
+        # Arrange
+        timer = StageTimer(started=10.0)
+
+        # Act
+        timer.feed("⏳ Waiting for DBus to be ready...", 10.5)
+        timer.feed("✅ SWTPM is ready!", 11.0)
+        timer.feed("✅ DBus is ready!", 11.25)
+        timer.feed("📦 Pipfile.lock unchanged, skipping dependency install", 11.5)
+        partial = timer.feed("✅ Yggdrasil started with IPv6: 200::1", 14.0)
+        timer.feed("✅ tpm2-abrmd is ready!", 12.0)
+        timer.feed("✅ TPM startup complete", 12.5)
+        done = timer.feed("✅ RabbitMQ is ready!", 16.0)
+
+        # Assert
+        assert timer.reached == {"swtpm": 1.0, "dbus": 1.25, "yggdrasil": 4.0, "abrmd": 2.0,
+                                 "tpm2_startup": 2.5, "rabbitmq": 6.0}
+        assert timer.total == 6.0
+        assert not partial and done
+        assert not timer.dependencies_installed
+
+    def test_stage_timer_notices_a_startup_dependency_install(self):
+        # Arrange
+        timer = StageTimer(started=0.0)
+
+        # Act
+        timer.feed("📦 Installed dependencies from Pipfile.lock", 30.0)
+
+        # Assert
+        assert timer.dependencies_installed
+        assert timer.total is None
+
+    def test_percentiles_use_nearest_rank(self):
+        # Arrange
+        values = list(range(1, 101))
+
+        # Act & Assert
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([3.0], 0.9) == 3.0
+        assert percentile([], 0.5) is None
+
+    def test_summary_counts_outcomes(self):
+        # Arrange
+        results = [
+            {"tpm_status": "TPM_OK", "address": "200::1", "dbus": 1.0, "total": 5.0},
+            {"tpm_status": "TPM_WARNING", "address": None, "dbus": 2.0, "total": 6.0},
+        ]
+
+        # Act
+        summary = summarize(results)
+
+        # Assert
+        assert summary["successful"] == 1
+        assert summary["stages"]["dbus"]["max"] == 2.0
+        assert summary["stages"]["yggdrasil"]["count"] == 0
+
+    @pytest.mark.asyncio
+    async def test_iterations_run_with_their_own_state(self, tmp_path):
+        # Arrange
+        harness = ReliabilityHarness(
+            state_root=str(tmp_path / "state"), logs_dir=str(tmp_path / "logs"),
+            parallelism=3, docker=write_fake_docker(tmp_path)
+        )
+
+        # Act
+        summary = await harness.run(6, str(tmp_path / "results.csv"))
+
+        # Assert
+        assert summary["successful"] == 6
+        assert summary["dependency_installs"] == 0
+        assert summary["addresses"] == ["200:1234::1"]
+        assert sorted(os.listdir(tmp_path / "state")) == sorted(f"iteration_{i}" for i in range(1, 7))
+        with open(tmp_path / "results.csv") as file:
+            rows = list(csv.DictReader(file))
+        assert [row["iteration"] for row in rows] == [str(i) for i in range(1, 7)]
+        assert all(row["yggdrasil"] and row["rabbitmq"] for row in rows)
+
+    @pytest.mark.asyncio
+    async def test_lockout_stops_scheduling(self, tmp_path):
+        # Arrange
+        harness = ReliabilityHarness(
+            state_root=str(tmp_path / "state"), logs_dir=str(tmp_path / "logs"),
+            parallelism=1, docker=write_fake_docker(tmp_path, lockout_iteration=2)
+        )
+
+        # Act
+        summary = await harness.run(10, str(tmp_path / "results.csv"))
+
+        # Assert
+        assert summary["lockout"]
+        assert summary["iterations"] == 2
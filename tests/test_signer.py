@@ -0,0 +1,61 @@
+import pytest
+
+tpm2_pytss = pytest.importorskip("tpm2_pytss")
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+from identity.merkle import merkle_root, row_hash
+from tpm.signer import BatchSigner, TPM_PERSISTENT_BASE
+from tests.conftest import PERSISTENT_HANDLE
+
+def verify(public, message: str, signature):
+    key = load_pem_public_key(public.to_pem())
+    der = encode_dss_signature(int.from_bytes(bytes(signature.signature.ecdsa.signatureR), 'big'),
+                               int.from_bytes(bytes(signature.signature.ecdsa.signatureS), 'big'))
+    key.verify(der, message.encode(), ec.ECDSA(hashes.SHA256()))
+
+class TestBatchSigner():
+
+    def test_handle_is_read_from_provisioning_file(self, tmp_path):
+        # Arrange
+        handle_path = tmp_path / "handle.txt"
+        handle_path.write_text("0x8100ABCD\n")
+
+        # Act & Assert
+        assert BatchSigner(None, handle_path=str(handle_path)).handle == 0x8100ABCD
+        assert BatchSigner(None, handle_path=str(tmp_path / "missing")).handle == TPM_PERSISTENT_BASE
+
+    @pytest.mark.asyncio
+    async def test_row_hashes_are_signed_in_one_batch(self, broker):
+        # Arrange
+        signer = BatchSigner(broker, handle=PERSISTENT_HANDLE)
+        row_hashes = [row_hash(f"user{i}@example.coin", "ab" * 32) for i in range(20)]
+
+        # Act
+        signatures = await signer.sign_row_hashes(row_hashes)
+
+        # Assert
+        for value, signature in zip(row_hashes, signatures):
+            verify(signer.public, value, signature)
+        stats = signer.get_stats()
+        assert stats["signatures"] == 20
+        assert stats["signatures_per_second"] > 0
+        assert broker.get_info()["loaded_handles"] == 1
+
+    @pytest.mark.asyncio
+    async def test_merkle_root_mode_signs_once(self, broker):
+        # Arrange
+        signer = BatchSigner(broker, handle=PERSISTENT_HANDLE)
+        row_hashes = [row_hash(f"user{i}@example.coin") for i in range(7)]
+
+        # Act
+        root, signature = await signer.sign_merkle_root(row_hashes)
+        shards = await signer.sign_shard_roots({"a": row_hashes[:3], "b": row_hashes[3:], "empty": []})
+
+        # Assert
+        assert root == merkle_root(row_hashes)
+        verify(signer.public, root, signature)
+        assert set(shards) == {"a", "b"}
+        verify(signer.public, shards["b"][0], shards["b"][1])
+        assert signer.get_stats()["signatures"] == 3
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import pytest
+from hypothesis import given, settings, HealthCheck, strategies as st
+from identity.merkle import address_keys_row_hash, merkle_root
+from identity.snapshot import (ADDRESS_KEYS, SnapshotError, SnapshotReader,
+                               export_snapshot, write_snapshot)
+
+def identity_rows(count: int) -> list:
+    return [
+        (f"user{i}@domain{i % 7}.coin", f"{i:064x}", "LS0t" * (i % 3), f"{i:064x}" if i % 3 else None, i % 2)
+        for i in range(count)
+    ]
+
+addresses = st.lists(
+    st.tuples(st.text(min_size=1, max_size=40), st.text(max_size=64), st.text(max_size=80),
+              st.text(max_size=64), st.booleans()),
+    max_size=60, unique_by=lambda row: row[0]
+)
+
+class TestSnapshot():
+
+    def test_every_record_is_found_through_mmap(self, tmp_path):
+        # Arrange
+        path = str(tmp_path / "identities.snap")
+        rows = identity_rows(2000)
+        info = write_snapshot(path, rows, [("domain1.coin", 1), ("domain2.coin", 0)], block_size=1024)
+
+        # Act
+        with SnapshotReader(path) as reader:
+            found = [reader.get(row[0]) for row in rows]
+            missing = reader.get("nobody@domain1.coin")
+            domain = reader.get_domain("domain1.coin")
+            stats = reader.get_info()
+
+        # Assert
+        assert [record["pubkey"] for record in found] == [row[1] for row in rows]
+        assert found[4]["tpm_key"] == "LS0t"
+        assert found[3]["tpm_key_hash"] is None
+        assert found[1]["tpm_enable"] is True
+        assert missing is None
+        assert domain == {"domain": "domain1.coin", "tpm_enable": True}
+        assert info["address_keys"] == 2000
+        assert stats["tables"][ADDRESS_KEYS]["blocks"] > 10
+        assert stats["cached_blocks"] <= 64
+
+    def test_snapshot_is_canonical(self, tmp_path):
+        # Arrange
+        rows = identity_rows(300)
+
+        # Act
+        first = write_snapshot(str(tmp_path / "a.snap"), rows, [])
+        second = write_snapshot(str(tmp_path / "b.snap"), list(reversed(rows)), [])
+
+        # Assert
+        assert first["root"] == second["root"]
+        assert (tmp_path / "a.snap").read_bytes() == (tmp_path / "b.snap").read_bytes()
+
+    def test_root_covers_row_hashes_in_key_order(self, tmp_path):
+        # Arrange
+        path = str(tmp_path / "identities.snap")
+        rows = identity_rows(50)
+        write_snapshot(path, rows, [])
+
+        # Act
+        with SnapshotReader(path) as reader:
+            records = list(reader.records())
+            table_root = reader.get_info()["tables"][ADDRESS_KEYS]["root"]
+            verified = reader.verify()
+
+        # Assert
+        assert verified
+        assert table_root == merkle_root([
+            address_keys_row_hash(r["address"], r["pubkey"], r["tpm_key"], r["tpm_key_hash"], r["tpm_enable"])
+            for r in records
+        ])
+
+    @settings(suppress_health_check=[HealthCheck.function_scoped_fixture])
+    @given(rows=addresses)
+    def test_round_trip(self, tmp_path, rows):
+        # Arrange
+        path = str(tmp_path / "round_trip.snap")
+        write_snapshot(path, rows, [], block_size=256)
+
+        # Act
+        with SnapshotReader(path) as reader:
+            results = {row[0]: reader.get(row[0]) for row in rows}
+            verified = reader.verify()
+
+        # Assert
+        assert verified
+        for address, pubkey, tpm_key, tpm_key_hash, tpm_enable in rows:
+            assert results[address]["pubkey"] == pubkey
+            assert results[address]["tpm_key"] == (tpm_key or None)
+            assert results[address]["tpm_enable"] == tpm_enable
+
+    def test_export_from_cli_database(self, tmp_path):
+        # Arrange
+        db_path = str(tmp_path / "identities.tmp")
+        connection = sqlite3.connect(db_path)
+        connection.executescript("""
+            CREATE TABLE address_keys (id INTEGER PRIMARY KEY AUTOINCREMENT, address TEXT NOT NULL, pubkey TEXT NOT NULL,
+                TPM_key TEXT, TPM_key_hash BLOB, TPM_enable BOOLEAN DEFAULT 0, row_hash BLOB);
+            CREATE TABLE tpm_domain_settings (id INTEGER PRIMARY KEY AUTOINCREMENT, domain TEXT NOT NULL,
+                TPM_enable BOOLEAN DEFAULT 0, row_hash BLOB);
+        """)
+        connection.executemany("INSERT INTO address_keys (address, pubkey, TPM_enable) VALUES (?, ?, ?)",
+                               [("alice@example.coin", "aa", 1), ("bob@example.coin", "bb", 0), ("alice@example.coin", "cc", 0)])
+        connection.execute("INSERT INTO tpm_domain_settings (domain, TPM_enable) VALUES ('example.coin', 1)")
+        connection.commit()
+        connection.close()
+        path = str(tmp_path / "identities.snap")
+
+        # Act
+        info = export_snapshot(db_path, path)
+
+        # Assert
+        with SnapshotReader(path) as reader:
+            assert reader.get("alice@example.coin")["pubkey"] == "aa"
+            assert reader.get_domain("example.coin")["tpm_enable"] is True
+            assert len(reader) == 2
+        assert info["address_keys"] == 2
+        assert info["bytes"] == os.path.getsize(path)
+
+    def test_damaged_files_are_rejected(self, tmp_path):
+        # Arrange
+        path = tmp_path / "identities.snap"
+        write_snapshot(str(path), identity_rows(100), [])
+        data = path.read_bytes()
+        truncated = tmp_path / "truncated.snap"
+        truncated.write_bytes(data[:-10])
+        tampered = tmp_path / "tampered.snap"
+        tampered.write_bytes(data[:20] + bytes([data[20] ^ 0xFF]) + data[21:])
+        empty = tmp_path / "empty.snap"
+        empty.write_bytes(b"")
+
+        # Act & Assert
+        for damaged in (truncated, empty):
+            with pytest.raises(SnapshotError):
+                SnapshotReader(str(damaged))
+        with SnapshotReader(str(tampered)) as reader:
+            with pytest.raises(SnapshotError):
+                reader.verify()
@@ -0,0 +1,135 @@
+import asyncio
+import pytest
+
+tpm2_pytss = pytest.importorskip("tpm2_pytss")
+from tpm2_pytss import TPM2_ALG, TPM2_RH, TPM2_ST, TPM2B_DIGEST, TPMT_SIG_SCHEME, TPMT_TK_HASHCHECK
+from tpm.broker import TpmBroker, TpmBrokerError
+from tests.conftest import PERSISTENT_HANDLE
+
+class TestTpmBroker():
+
+    @pytest.mark.asyncio
+    async def test_concurrent_random_requests_are_merged(self, broker):
+        # Arrange
+        sizes = [8, 16, 32, 64] * 8
+
+        # Act
+        results = await asyncio.gather(*(broker.get_random(size) for size in sizes))
+
+        # Assert
+        assert [len(result) for result in results] == sizes
+        assert len(set(results)) == len(results)
+        info = broker.get_info()
+        assert info["coalesced"] > 0
+        assert info["tpm_commands"] < len(sizes) + 2
+
+    @pytest.mark.asyncio
+    async def test_identical_read_public_requests_share_one_call(self, broker):
+        # Act
+        results = await asyncio.gather(*(broker.read_public(PERSISTENT_HANDLE) for _ in range(10)))
+
+        # Assert
+        assert all(bytes(result[1]) == bytes(results[0][1]) for result in results)
+        assert broker.get_info()["coalesced"] >= 9
+        assert broker.get_info()["loaded_handles"] == 1
+
+    @pytest.mark.asyncio
+    async def test_sign_reuses_loaded_handle_and_session(self, broker):
+        # Arrange
+        scheme = TPMT_SIG_SCHEME(scheme=TPM2_ALG.NULL)
+        validation = TPMT_TK_HASHCHECK(tag=TPM2_ST.HASHCHECK, hierarchy=TPM2_RH.NULL)
+
+        # Act
+        signatures = await asyncio.gather(*(
+            broker.sign(PERSISTENT_HANDLE, TPM2B_DIGEST(bytes([i]) * 32), scheme, validation)
+            for i in range(5)
+        ))
+
+        # Assert
+        assert len(signatures) == 5
+        assert all(signature.sigAlg == TPM2_ALG.ECDSA for signature in signatures)
+        assert broker.get_info()["loaded_handles"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_sign_keeps_the_session(self, broker):
+        # Arrange
+        scheme = TPMT_SIG_SCHEME(scheme=TPM2_ALG.RSASSA)
+        scheme.details.any.hashAlg = TPM2_ALG.SHA256
+        validation = TPMT_TK_HASHCHECK(tag=TPM2_ST.HASHCHECK, hierarchy=TPM2_RH.NULL)
+        session = broker._session
+
+        # Act
+        results = await asyncio.gather(*(
+            broker.sign(PERSISTENT_HANDLE, TPM2B_DIGEST(b"\x00" * 32), scheme, validation) for _ in range(3)
+        ), return_exceptions=True)
+
+        # Assert
+        assert all(isinstance(result, TpmBrokerError) for result in results)
+        assert broker._session == session
+
+    @pytest.mark.asyncio
+    async def test_unknown_handle_fails_only_its_request(self, broker):
+        # Act
+        results = await asyncio.gather(
+            broker.read_public(PERSISTENT_HANDLE + 1),
+            broker.get_random(16),
+            return_exceptions=True
+        )
+
+        # Assert
+        assert isinstance(results[0], TpmBrokerError)
+        assert len(results[1]) == 16
+
+    @pytest.mark.asyncio
+    async def test_unexpected_error_fails_only_its_request(self, broker, monkeypatch):
+        # Arrange
+        def malformed_hash(data, hash_alg):
+            raise TypeError("data must be bytes")
+
+        monkeypatch.setattr(broker, "_hash", malformed_hash)
+
+        # Act
+        results = await asyncio.gather(
+            broker.hash(b"data"),
+            broker.get_random(16),
+            broker.read_public(PERSISTENT_HANDLE),
+            return_exceptions=True
+        )
+
+        # Assert
+        assert isinstance(results[0], TypeError)
+        assert len(results[1]) == 16
+        assert not isinstance(results[2], Exception)
+
+    @pytest.mark.asyncio
+    async def test_broker_restarts_after_stop(self, broker):
+        # Act
+        await broker.stop()
+        await broker.start()
+        result = await broker.get_random(16)
+
+        # Assert
+        assert len(result) == 16
+        assert broker.get_info()["running"]
+
+    @pytest.mark.asyncio
+    async def test_stop_fails_requests_in_flight_and_queued(self, swtpm):
+        # Arrange
+        broker = TpmBroker(swtpm, max_batch=4)
+        await broker.start()
+        requests = [asyncio.ensure_future(broker.get_random(32)) for _ in range(32)]
+        await asyncio.sleep(0)
+
+        # Act
+        await broker.stop()
+        results = await asyncio.wait_for(asyncio.gather(*requests, return_exceptions=True), timeout=5)
+
+        # Assert
+        assert all(isinstance(result, (bytes, TpmBrokerError)) for result in results)
+        assert any(isinstance(result, TpmBrokerError) for result in results)
+
+    @pytest.mark.asyncio
+    async def test_requests_before_start_are_rejected(self):
+        # Act & Assert
+        with pytest.raises(TpmBrokerError):
+            await TpmBroker("swtpm").get_random(8)
@@ -0,0 +1,268 @@
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from tpm2_pytss import (ESAPI, ESYS_TR, TPM2_ALG, TPM2_RC, TPM2_SE, TPM2B_MAX_BUFFER, TPMA_SESSION, TPMT_SYM_DEF,
+                        TSS2_Exception)
+
+# Same TPM the shell scripts reach through tpm2-abrmd
+DEFAULT_TCTI = "tabrmd:bus_type=system"
+# TPM2_GetRandom never returns more than the largest digest the TPM supports
+MAX_RANDOM_CHUNK = 32
+
+def _is_stale_reference(error: TSS2_Exception) -> bool:
+    """
+    True when the TPM rejected a session or object handle, e.g. after tpm2-abrmd flushed the
+    session. Layer bits are masked so the codes match whether or not they came through a resource manager.
+    """
+    rc = error.rc & 0xFFFF
+    if rc & TPM2_RC.FMT1:
+        return TPM2_RC.FMT1 + (rc & 0x3F) == TPM2_RC.HANDLE
+    return TPM2_RC.REFERENCE_H0 <= rc <= TPM2_RC.REFERENCE_S6
+
+class TpmBrokerError(Exception):
+    """Raised when the broker is not running or the TPM rejects an operation"""
+
+class _Request():
+    __slots__ = ("operation", "args", "future")
+
+    def __init__(self, operation: str, args: tuple, future: asyncio.Future):
+        self.operation = operation
+        self.args = args
+        self.future = future
+
+class TpmBroker():
+    """
+    Owns a single ESYS context and serializes every TPM command through one asyncio worker.
+    Requests queued while the TPM is busy are handled as a batch, GetRandom requests in a
+    batch are merged into as few TPM calls as possible and identical ReadPublic requests
+    are answered by one call. Persistent handles and the HMAC session are created once
+    and reused for the lifetime of the broker.
+    Args:
+        tcti: TCTI configuration string, defaults to tpm2-abrmd on the system bus
+        max_batch: maximum number of queued requests handled together
+        max_queue: requests waiting beyond this make callers wait to enqueue
+    """
+    def __init__(self, tcti: str = DEFAULT_TCTI, max_batch: int = 64, max_queue: int = 1024):
+        self.tcti = tcti
+        self.max_batch = max_batch
+        self.requests = 0
+        self.tpm_commands = 0
+        self.coalesced = 0
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        # The ESYS context is not thread safe, every call into it happens on this one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tpm-broker")
+        self._context = None
+        self._session = None
+        self._handles = {}
+        self._worker = None
+
+    async def start(self):
+        if self._worker is not None:
+            return
+        if self._executor is None:
+            # stop() shut the previous thread down, a restarted broker gets a fresh one
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tpm-broker")
+        await self._run(self._open)
+        self._worker = asyncio.create_task(self._work())
+
+    async def stop(self):
+        """Fails queued requests, then closes the session and the ESYS context"""
+        if self._executor is None:
+            return
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        queued = []
+        while not self._queue.empty():
+            queued.append(self._queue.get_nowait())
+        self._fail(queued, TpmBrokerError("TPM broker stopped"))
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def get_random(self, size: int) -> bytes:
+        if size < 1:
+            raise ValueError("size must be a positive number of bytes")
+        return await self._submit("get_random", size)
+
+    async def read_public(self, handle: int) -> tuple:
+        """Returns the (public, name, qualified_name) of a persistent handle such as 0x81000000"""
+        return await self._submit("read_public", handle)
+
+    async def hash(self, data: bytes, hash_alg=TPM2_ALG.SHA256) -> tuple:
+        """Hashes data in the TPM, returns (digest, ticket) so restricted keys can sign it"""
+        return await self._submit("hash", data, hash_alg)
+
+    async def sign(self, handle: int, digest, scheme, validation):
+        """Signs a digest with the persistent key at handle using the shared session"""
+        return await self._submit("sign", handle, digest, scheme, validation)
+
+    def get_info(self) -> dict:
+        return {
+            "requests": self.requests,
+            "tpm_commands": self.tpm_commands,
+            "coalesced": self.coalesced,
+            "queued": self._queue.qsize(),
+            "loaded_handles": len(self._handles),
+            "running": self._worker is not None,
+        }
+
+    async def _submit(self, operation: str, *args):
+        if self._worker is None:
+            raise TpmBrokerError("TPM broker is not started")
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        await self._queue.put(_Request(operation, args, future))
+        return await future
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _fail(requests: list, error: Exception):
+        for request in requests:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    async def _work(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                results = await self._run(self._execute_batch, batch)
+            except asyncio.CancelledError:
+                # stop() cancelled the batch in flight, its callers would otherwise wait forever
+                self._fail(batch, TpmBrokerError("TPM broker stopped"))
+                raise
+            except Exception as e:
+                results = [TpmBrokerError(f"TPM batch failed:\n{e}")] * len(batch)
+            for request, result in zip(batch, results):
+                if request.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    request.future.set_exception(result)
+                else:
+                    request.future.set_result(result)
+
+    # Everything below runs on the broker thread
+
+    def _open(self):
+        self._context = ESAPI(self.tcti)
+        self.tpm_commands += 1
+        self._session = self._start_session()
+
+    def _close(self):
+        if self._context is None:
+            return
+        try:
+            if self._session is not None:
+                self._context.flush_context(self._session)
+        except TSS2_Exception:
+            pass
+        self._context.close()
+        self._context = None
+        self._session = None
+        self._handles.clear()
+
+    def _start_session(self):
+        session = self._context.start_auth_session(
+            tpm_key=ESYS_TR.NONE,
+            bind=ESYS_TR.NONE,
+            session_type=TPM2_SE.HMAC,
+            symmetric=TPMT_SYM_DEF(algorithm=TPM2_ALG.NULL),
+            auth_hash=TPM2_ALG.SHA256
+        )
+        self._context.trsess_set_attributes(session, TPMA_SESSION.CONTINUESESSION)
+        self.tpm_commands += 1
+        return session
+
+    def _restart_session(self):
+        """Flushes the current session before replacing it so a retry never leaks a TPM session slot"""
+        if self._session is not None:
+            try:
+                self._context.flush_context(self._session)
+            except TSS2_Exception:
+                # Already gone on the TPM side, which is usually why it is being replaced
+                pass
+            self._session = None
+        self._session = self._start_session()
+
+    def _handle(self, handle: int):
+        """Resolves a persistent handle to an ESYS_TR once and keeps it for later requests"""
+        if handle not in self._handles:
+            self._handles[handle] = self._context.tr_from_tpmpublic(handle)
+            self.tpm_commands += 1
+        return self._handles[handle]
+
+    def _execute_batch(self, batch: list) -> list:
+        results = [None] * len(batch)
+        randoms = []
+        reads = defaultdict(list)
+        for index, request in enumerate(batch):
+            if request.operation == "get_random":
+                randoms.append(index)
+            elif request.operation == "read_public":
+                reads[request.args[0]].append(index)
+            else:
+                results[index] = self._guarded(getattr(self, f"_{request.operation}"), *request.args)
+        if randoms:
+            error = self._guarded(self._fill_randoms, batch, randoms, results)
+            if error is not None:
+                for index in randoms:
+                    results[index] = error
+        for handle, indexes in reads.items():
+            result = self._guarded(self._read_public, handle)
+            self.coalesced += len(indexes) - 1
+            for index in indexes:
+                results[index] = result
+        return results
+
+    def _guarded(self, func, *args):
+        try:
+            return func(*args)
+        except TSS2_Exception as e:
+            return TpmBrokerError(f"TPM command failed:\n{e}")
+        except Exception as e:
+            # A malformed request fails on its own instead of taking the rest of the batch with it
+            return e
+
+    def _fill_randoms(self, batch: list, indexes: list, results: list):
+        """Draws the bytes for every GetRandom request of the batch in one pass and splits them"""
+        total = sum(batch[index].args[0] for index in indexes)
+        pool = bytearray()
+        while len(pool) < total:
+            pool += bytes(self._context.get_random(min(MAX_RANDOM_CHUNK, total - len(pool))))
+            self.tpm_commands += 1
+        naive_calls = sum(-(-batch[index].args[0] // MAX_RANDOM_CHUNK) for index in indexes)
+        self.coalesced += naive_calls - -(-total // MAX_RANDOM_CHUNK)
+        offset = 0
+        for index in indexes:
+            size = batch[index].args[0]
+            results[index] = bytes(pool[offset:offset + size])
+            offset += size
+
+    def _read_public(self, handle: int) -> tuple:
+        self.tpm_commands += 1
+        return self._context.read_public(self._handle(handle))
+
+    def _hash(self, data: bytes, hash_alg) -> tuple:
+        self.tpm_commands += 1
+        return self._context.hash(TPM2B_MAX_BUFFER(data), hash_alg, ESYS_TR.OWNER)
+
+    def _sign(self, handle: int, digest, scheme, validation):
+        try:
+            signature = self._context.sign(self._handle(handle), digest, scheme, validation, session1=self._session)
+        except TSS2_Exception as e:
+            # Only a flushed session or stale key handle is worth one retry, anything else is the caller's error
+            if not _is_stale_reference(e):
+                raise
+            self._handles.pop(handle, None)
+            self._restart_session()
+            signature = self._context.sign(self._handle(handle), digest, scheme, validation, session1=self._session)
+        self.tpm_commands += 1
+        return signature
@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+
+# SP 800-90A limits for HMAC_DRBG
+MAX_BYTES_PER_REQUEST = 1 << 16
+RESEED_LIMIT = 1 << 48
+PERSONALIZATION = b"brunnen-g random pool"
+# Bytes one TPM2_GetRandom returns, tpm.broker.MAX_RANDOM_CHUNK, kept here so the pool imports without tpm2-pytss
+GET_RANDOM_CHUNK = 32
+
+def _get_random_calls(size: int) -> int:
+    return -(-size // GET_RANDOM_CHUNK)
+
+class RandomPoolError(Exception):
+    """Raised when the pool is not seeded or has run past its reseed limit without fresh entropy"""
+
+class HmacDrbg():
+    """
+    HMAC_DRBG with SHA-256 as specified in NIST SP 800-90A.
+    Args:
+        entropy: seed material, at least 32 bytes
+        nonce: value that differs between instantiations
+        personalization: optional string binding the generator to its use
+    """
+    def __init__(self, entropy: bytes, nonce: bytes = b"", personalization: bytes = b""):
+        if len(entropy) < 32:
+            raise ValueError("HMAC_DRBG needs at least 32 bytes of entropy")
+        self._key = b"\x00" * 32
+        self._value = b"\x01" * 32
+        self._update(entropy + nonce + personalization)
+        self.reseed_counter = 1
+
+    def _update(self, provided: bytes = b""):
+        self._key = hmac.new(self._key, self._value + b"\x00" + provided, hashlib.sha256).digest()
+        self._value = hmac.new(self._key, self._value, hashlib.sha256).digest()
+        if provided:
+            self._key = hmac.new(self._key, self._value + b"\x01" + provided, hashlib.sha256).digest()
+            self._value = hmac.new(self._key, self._value, hashlib.sha256).digest()
+
+    def reseed(self, entropy: bytes, additional: bytes = b""):
+        if len(entropy) < 32:
+            raise ValueError("HMAC_DRBG needs at least 32 bytes of entropy")
+        self._update(entropy + additional)
+        self.reseed_counter = 1
+
+    def generate(self, size: int, additional: bytes = b"") -> bytes:
+        if size > MAX_BYTES_PER_REQUEST:
+            raise ValueError(f"HMAC_DRBG returns at most {MAX_BYTES_PER_REQUEST} bytes per request")
+        if self.reseed_counter > RESEED_LIMIT:
+            raise RandomPoolError("HMAC_DRBG must be reseeded")
+        if additional:
+            self._update(additional)
+        blocks = []
+        for _ in range((size + 31) // 32):
+            self._value = hmac.new(self._key, self._value, hashlib.sha256).digest()
+            blocks.append(self._value)
+        self._update(additional)
+        self.reseed_counter += 1
+        return b"".join(blocks)[:size]
+
+class RandomPool():
+    """
+    Serves challenges, salts and nonces from an HMAC_DRBG seeded by large TPM GetRandom batches.
+    Draws come from memory, once reseed_interval draws or reseed_seconds have passed a fresh
+    seed is fetched in the background while the current state keeps serving. One reseed runs
+    at a time and after a failure the next one waits reseed_backoff seconds, doubling with
+    every further failure up to reseed_seconds.
+    Args:
+        entropy_source: async callable returning n random bytes, such as TpmBroker.get_random
+        seed_size: bytes fetched from the entropy source per (re)seed
+        reseed_interval: draws served before a background reseed is started
+        reseed_seconds: age of the seed before a background reseed is started
+        reseed_backoff: seconds before retrying the first failed reseed
+        clock: monotonic time source
+    """
+    def __init__(self, entropy_source, seed_size: int = 256, reseed_interval: int = 4096,
+                 reseed_seconds: float = 300.0, reseed_backoff: float = 1.0, clock=time.monotonic):
+        self.entropy_source = entropy_source
+        self.seed_size = seed_size
+        self.reseed_interval = reseed_interval
+        self.reseed_seconds = reseed_seconds
+        self.reseed_backoff = reseed_backoff
+        self.draws = 0
+        self.entropy_fetches = 0
+        self.tpm_calls = 0
+        self._naive_calls = 0
+        self.reseeds = 0
+        self.reseed_failures = 0
+        self._drbg = None
+        self._seeded_at = 0.0
+        self._draws_since_seed = 0
+        self._reseed_task = None
+        self._clock = clock
+        self._failed_reseeds = 0
+        self._retry_at = 0.0
+
+    async def start(self):
+        """Instantiates the DRBG, the first seed is awaited so the pool never serves unseeded"""
+        if self._drbg is not None:
+            return
+        entropy = await self._fetch_entropy()
+        self._drbg = HmacDrbg(entropy, os.urandom(16) + time.time_ns().to_bytes(8, 'big'), PERSONALIZATION)
+        self._seeded_at = self._clock()
+
+    async def stop(self):
+        if self._reseed_task is not None:
+            self._reseed_task.cancel()
+            try:
+                await self._reseed_task
+            except asyncio.CancelledError:
+                pass
+            self._reseed_task = None
+        self._drbg = None
+
+    def random_bytes(self, size: int) -> bytes:
+        if self._drbg is None:
+            raise RandomPoolError("Random pool is not seeded, call start() first")
+        if size < 1:
+            raise ValueError("size must be a positive number of bytes")
+        chunks = []
+        remaining = size
+        while remaining:
+            chunk = min(remaining, MAX_BYTES_PER_REQUEST)
+            chunks.append(self._drbg.generate(chunk))
+            remaining -= chunk
+        self.draws += 1
+        self._naive_calls += _get_random_calls(size)
+        self._draws_since_seed += 1
+        self._schedule_reseed()
+        return b"".join(chunks)
+
+    def challenge(self, size: int = 32) -> str:
+        """Hex challenge, the in-memory replacement for openssl rand -hex 32"""
+        return self.random_bytes(size).hex()
+
+    def salt(self, size: int = 16) -> bytes:
+        return self.random_bytes(size)
+
+    def nonce(self, size: int = 12) -> bytes:
+        return self.random_bytes(size)
+
+    async def reseed(self):
+        """Fetches fresh entropy and mixes it into the DRBG"""
+        entropy = await self._fetch_entropy()
+        if self._drbg is None:
+            return
+        self._drbg.reseed(entropy)
+        self._seeded_at = self._clock()
+        self._draws_since_seed = 0
+        self._failed_reseeds = 0
+        self._retry_at = 0.0
+        self.reseeds += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "draws": self.draws,
+            "entropy_fetches": self.entropy_fetches,
+            "tpm_calls": self.tpm_calls,
+            # Every draw used to be its own fork plus the GetRandom commands for its size
+            "tpm_calls_saved": max(self._naive_calls - self.tpm_calls, 0),
+            "reseeds": self.reseeds,
+            "reseed_failures": self.reseed_failures,
+            "draws_since_seed": self._draws_since_seed,
+            "seed_age": self._clock() - self._seeded_at if self._drbg else None,
+            "reseeding": self._reseed_task is not None,
+        }
+
+    async def _fetch_entropy(self) -> bytes:
+        entropy = await self.entropy_source(self.seed_size)
+        self.entropy_fetches += 1
+        self.tpm_calls += _get_random_calls(self.seed_size)
+        if len(entropy) < self.seed_size:
+            raise RandomPoolError(f"Entropy source returned {len(entropy)} of {self.seed_size} bytes")
+        return entropy
+
+    def _schedule_reseed(self):
+        if self._reseed_task is not None or self._clock() < self._retry_at:
+            return
+        stale = self._clock() - self._seeded_at >= self.reseed_seconds
+        if self._draws_since_seed < self.reseed_interval and not stale:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._reseed_task = loop.create_task(self._background_reseed())
+
+    async def _background_reseed(self):
+        try:
+            await self.reseed()
+        except Exception as e:
+            self.reseed_failures += 1
+            backoff = min(self.reseed_backoff * 2 ** self._failed_reseeds, self.reseed_seconds)
+            self._failed_reseeds += 1
+            self._retry_at = self._clock() + backoff
+            print(f"Background reseed of the random pool failed, retrying in {backoff:.1f}s:\n{e}")
+        finally:
+            self._reseed_task = None
@@ -0,0 +1,97 @@
+import asyncio
+import hashlib
+import os
+import time
+from tpm2_pytss import TPM2_ALG, TPM2_RH, TPM2_ST, TPM2B_DIGEST, TPMA_OBJECT, TPMT_SIG_SCHEME, TPMT_TK_HASHCHECK
+from identity.merkle import merkle_root
+from tpm.broker import TpmBroker
+
+# Matches TPM_PERSISTENT_BASE in tpm_provisioning.sh
+TPM_PERSISTENT_BASE = 0x81000000
+# tpm_provisioning.sh writes the handle it persisted the signing key at into this file
+DEFAULT_HANDLE_PATH = "handle.txt"
+
+class BatchSigner():
+    """
+    Signs batches of row hashes, or a single Merkle root committing to them, with the signing
+    key persisted by tpm_provisioning.sh. The key is looked up once, every signature of a batch
+    is queued on the broker at the same time so TPM2_Sign commands run back to back.
+    Each signature covers the sha256 of the row hash hex string, for restricted keys such as
+    the provisioned attestation key the digest is produced by TPM2_Hash to get the ticket.
+    Args:
+        broker: started TpmBroker owning the TPM connection
+        handle: persistent handle of the key, read from handle_path when not given
+        handle_path: file written by tpm_provisioning.sh, TPM_PERSISTENT_BASE is used without it
+        scheme: signature scheme, the default NULL scheme uses the scheme of the key
+    """
+    def __init__(self, broker: TpmBroker, handle: int = None, handle_path: str = DEFAULT_HANDLE_PATH,
+                 scheme: TPMT_SIG_SCHEME = None):
+        self.broker = broker
+        self.handle = handle if handle is not None else self._read_handle(handle_path)
+        self.scheme = scheme or TPMT_SIG_SCHEME(scheme=TPM2_ALG.NULL)
+        self.public = None
+        self.restricted = False
+        self.signatures = 0
+        self.signing_seconds = 0.0
+
+    @staticmethod
+    def _read_handle(handle_path: str) -> int:
+        if handle_path and os.path.exists(handle_path):
+            with open(handle_path) as file:
+                return int(file.read().strip(), 16)
+        return TPM_PERSISTENT_BASE
+
+    async def load(self):
+        """Reads the public area of the persistent key once and keeps its handle loaded in the broker"""
+        if self.public is None:
+            public, _, _ = await self.broker.read_public(self.handle)
+            self.public = public
+            self.restricted = bool(public.publicArea.objectAttributes & TPMA_OBJECT.RESTRICTED)
+        return self.public
+
+    async def sign_row_hashes(self, row_hashes: list) -> list:
+        """Returns one signature per row hash, in the same order"""
+        await self.load()
+        started = time.perf_counter()
+        signatures = await asyncio.gather(*(self._sign(row_hash) for row_hash in row_hashes))
+        self._record(len(signatures), started)
+        return signatures
+
+    async def sign_merkle_root(self, row_hashes: list) -> tuple:
+        """Signs only the Merkle root of the batch, returns (root, signature)"""
+        root = merkle_root(row_hashes)
+        if root is None:
+            raise ValueError("Cannot sign the Merkle root of an empty batch")
+        await self.load()
+        started = time.perf_counter()
+        signature = await self._sign(root)
+        self._record(1, started)
+        return root, signature
+
+    async def sign_shard_roots(self, shards: dict) -> dict:
+        """Signs the Merkle root of every shard, shards maps a shard name to its row hashes"""
+        roots = {name: merkle_root(row_hashes) for name, row_hashes in shards.items() if row_hashes}
+        signatures = await self.sign_row_hashes(list(roots.values()))
+        return {name: (root, signature) for (name, root), signature in zip(roots.items(), signatures)}
+
+    async def _sign(self, row_hash: str):
+        message = row_hash.encode()
+        if self.restricted:
+            digest, validation = await self.broker.hash(message)
+        else:
+            digest = TPM2B_DIGEST(hashlib.sha256(message).digest())
+            validation = TPMT_TK_HASHCHECK(tag=TPM2_ST.HASHCHECK, hierarchy=TPM2_RH.NULL)
+        return await self.broker.sign(self.handle, digest, self.scheme, validation)
+
+    def _record(self, count: int, started: float):
+        self.signatures += count
+        self.signing_seconds += time.perf_counter() - started
+
+    def get_stats(self) -> dict:
+        return {
+            "handle": f"0x{self.handle:08X}",
+            "restricted": self.restricted,
+            "signatures": self.signatures,
+            "signing_seconds": self.signing_seconds,
+            "signatures_per_second": self.signatures / self.signing_seconds if self.signing_seconds else 0.0,
+        }